@@ -0,0 +1,69 @@
+from application.search_usual import SearchUsual
+from domain.schema.schemas import AgentState, TransactionRequest
+from typing import Any, AsyncIterator, Dict, List
+import asyncio
+import os
+
+
+class BatchAnalysis:
+    """Analiza lotes de transacciones con concurrencia acotada.
+
+    Los perfiles se resuelven una sola vez para todo el lote, los resultados
+    se entregan a medida que terminan y la persistencia pasa por la cola
+    acotada del write-behind, que agrupa para batch_writer.
+    """
+
+    def __init__(self, graph, search_usual: SearchUsual, dynamo_writer=None,
+                 default_concurrency: int | None = None, max_concurrency: int | None = None,
+                 profile_builder=None):
+        self.graph = graph
+        self.search_usual = search_usual
+        self.dynamo_writer = dynamo_writer
+        self.profile_builder = profile_builder
+        self.default_concurrency = (default_concurrency if default_concurrency is not None
+                                    else int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "8")))
+        self.max_concurrency = (max_concurrency if max_concurrency is not None
+                                else int(os.getenv("BATCH_ANALYSIS_MAX_CONCURRENCY", "64")))
+
+    async def run(self, requests: List[TransactionRequest], concurrency: int | None = None) -> AsyncIterator[Dict[str, Any]]:
+        concurrency = max(1, min(concurrency or self.default_concurrency, self.max_concurrency))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        # Una sola pasada por el store de perfiles para todo el lote
+        profiles = await self.search_usual.resolve_usual_behaviors({request.customer_id for request in requests})
+
+        async def analyze(request: TransactionRequest) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    state = AgentState(
+                        transaction_id=request.transaction_id,
+                        transaction_request=request,
+                        usual_behavior=profiles.get(request.customer_id)
+                    )
+                    return await self.graph.runnable.ainvoke(input=state)
+                except Exception as e:
+                    print(f"[BATCH] Error processing {request.transaction_id}: {e}")
+                    return {
+                        "transaction_id": request.transaction_id,
+                        "status": "error",
+                        "message": str(e)
+                    }
+
+        print(f"[BATCH] Analyzing {len(requests)} transactions with concurrency {concurrency}")
+        tasks = [asyncio.create_task(analyze(request)) for request in requests]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result.get("status") != "error":
+                    self._persist(result)
+                    if self.profile_builder is not None:
+                        self.profile_builder.observe_result(result)
+                yield result
+        finally:
+            # Si el cliente corta el stream, no seguir consumiendo LLM
+            for task in tasks:
+                task.cancel()
+
+    def _persist(self, result: Dict[str, Any]) -> None:
+        if self.dynamo_writer is not None:
+            self.dynamo_writer.enqueue(result)
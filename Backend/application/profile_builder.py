@@ -0,0 +1,274 @@
+from domain.schema.schemas import TransactionRequest, UsualBehavior
+from datetime import datetime, timezone
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import math
+import os
+
+HOURS_IN_DAY = 24
+
+
+class ProfileBuilder:
+    """Perfil de cada cliente aprendido de las decisiones finalizadas.
+
+    Cada transacción aprobada (por el pipeline sin revisión, o por un revisor
+    humano) actualiza en O(1) el estado del cliente: media y varianza del
+    monto (Welford), histograma de hora del día y dispositivos/países con su
+    último uso, acotados por cantidad y antigüedad. En la misma escritura se
+    materializa la vista con la forma de UsualBehavior, así SearchUsual la
+    sirve sin recalcular nada en el request path.
+
+    Estado en Redis (compartido entre workers, WATCH/MULTI por cliente) o en
+    memoria si no hay adaptador (para tests y scripts: LRU acotado a
+    PROFILE_LOCAL_MAX_CUSTOMERS clientes). Las actualizaciones se encolan y un worker
+    en background las aplica fuera de la respuesta.
+    """
+
+    def __init__(self, redis_adapter=None, learn_decisions: str | None = None, min_observations: int | None = None,
+                 max_items: int | None = None, recency_days: float | None = None, hours_coverage: float | None = None,
+                 min_hours_span: int | None = None, max_queue_size: int | None = None,
+                 max_local_profiles: int | None = None):
+        self.redis = redis_adapter
+        configured = learn_decisions if learn_decisions is not None else os.getenv("PROFILE_LEARN_DECISIONS", "APPROVE")
+        self.learn_decisions = {value.strip().upper() for value in configured.split(",") if value.strip()}
+        # Observaciones mínimas para servir el perfil aprendido en lugar del estático
+        self.min_observations = min_observations if min_observations is not None else int(os.getenv("PROFILE_MIN_OBSERVATIONS", "5"))
+        self.max_items = max_items if max_items is not None else int(os.getenv("PROFILE_MAX_ITEMS", "10"))
+        self.recency_seconds = (recency_days if recency_days is not None else float(os.getenv("PROFILE_RECENCY_DAYS", "90"))) * 86400
+        # Fracción de las transacciones que debe cubrir el rango usual_hours
+        self.hours_coverage = hours_coverage if hours_coverage is not None else float(os.getenv("PROFILE_HOURS_COVERAGE", "0.9"))
+        # Ancho mínimo del rango: pocas observaciones a la misma hora no deben marcar todo lo demás
+        self.min_hours_span = min_hours_span if min_hours_span is not None else int(os.getenv("PROFILE_MIN_HOURS_SPAN", "4"))
+        self.max_queue_size = max_queue_size if max_queue_size is not None else int(os.getenv("PROFILE_UPDATE_QUEUE_SIZE", "5000"))
+        # Modo local (sin Redis, pensado para tests y scripts): LRU acotado de clientes en memoria
+        self.max_local_profiles = (max_local_profiles if max_local_profiles is not None
+                                   else int(os.getenv("PROFILE_LOCAL_MAX_CUSTOMERS", "10000")))
+
+        self._states: "OrderedDict[str, dict]" = OrderedDict()
+        self._views: Dict[str, dict] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._direct_tasks: set = set()
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.updates = 0
+        self.failed = 0
+        self.conflicts = 0
+        self.served_learned = 0
+        self.not_mature = 0
+        self.evicted = 0
+
+    # --- Ciclo de vida del worker ---
+
+    def start(self) -> None:
+        if self._worker is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = asyncio.create_task(self._run())
+            backend = "redis" if self.redis is not None else "local"
+            print(f"[PROFILES] Profile builder started (backend={backend}, learn={sorted(self.learn_decisions)})")
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        # Se aplican las actualizaciones pendientes antes de apagar
+        await self.queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._direct_tasks:
+            await asyncio.gather(*self._direct_tasks, return_exceptions=True)
+        print(f"[PROFILES] Profile builder stopped (updates={self.updates}, failed={self.failed})")
+
+    async def _run(self) -> None:
+        while True:
+            transaction = await self.queue.get()
+            try:
+                await self.update(transaction)
+            except Exception as e:
+                self.failed += 1
+                print(f"[PROFILES] Update failed for {self._field(transaction, 'customer_id')}: {e}")
+            finally:
+                self.queue.task_done()
+
+    # --- Entradas: decisiones finalizadas ---
+
+    def observe_result(self, result: Dict[str, Any]) -> bool:
+        """Resultado del grafo: se aprende si la decisión quedó final sin revisión humana."""
+        if result.get("need_human_review"):
+            return False
+        decision = (result.get("decision") or {}).get("value")
+        return self._enqueue_if_learnable(result.get("transaction_request"), decision)
+
+    def observe_review(self, transaction_request, decision: str) -> bool:
+        """Decisión de un revisor humano sobre una transacción escalada."""
+        return self._enqueue_if_learnable(transaction_request, decision)
+
+    def _enqueue_if_learnable(self, transaction_request, decision: str | None) -> bool:
+        if transaction_request is None or (decision or "").upper() not in self.learn_decisions:
+            return False
+        if self.queue is None:
+            # Sin worker (p.ej. scripts): se aplica en una tarea aparte
+            task = asyncio.create_task(self.update(transaction_request))
+            self._direct_tasks.add(task)
+            task.add_done_callback(self._direct_tasks.discard)
+            return True
+        try:
+            self.queue.put_nowait(transaction_request)
+            self.enqueued += 1
+            return True
+        except asyncio.QueueFull:
+            # El perfil tolera perder una observación; la respuesta nunca espera
+            self.dropped += 1
+            return False
+
+    # --- Actualización O(1) ---
+
+    async def update(self, transaction) -> dict:
+        customer_id = self._field(transaction, "customer_id")
+
+        def apply(state: Optional[dict]) -> Tuple[dict, dict]:
+            state = self.apply(state, transaction)
+            return state, self.materialize(customer_id, state)
+
+        if self.redis is not None:
+            result = await self.redis.update_customer_profile(customer_id, apply)
+            self.conflicts += result["conflicts"]
+            view = result["view"]
+        else:
+            state, view = apply(self._states.get(customer_id))
+            self._states[customer_id] = state
+            self._states.move_to_end(customer_id)
+            self._views[customer_id] = view
+            while len(self._states) > self.max_local_profiles:
+                evicted_id, _ = self._states.popitem(last=False)
+                self._views.pop(evicted_id, None)
+                self.evicted += 1
+        self.updates += 1
+        return view
+
+    def apply(self, state: Optional[dict], transaction) -> dict:
+        state = state or {"count": 0, "mean": 0.0, "m2": 0.0, "hours": [0] * HOURS_IN_DAY, "devices": {}, "countries": {}}
+        amount = float(self._field(transaction, "amount"))
+        timestamp = self._timestamp(self._field(transaction, "timestamp"))
+        seen_at = timestamp.timestamp()
+
+        # Welford: media y suma de cuadrados de desviaciones sin guardar el historial
+        count = state["count"] + 1
+        delta = amount - state["mean"]
+        mean = state["mean"] + delta / count
+        state["m2"] += delta * (amount - mean)
+        state["mean"] = mean
+        state["count"] = count
+
+        state["hours"][timestamp.hour] += 1
+        self._touch(state["devices"], self._field(transaction, "device_id"), seen_at)
+        self._touch(state["countries"], self._field(transaction, "country"), seen_at)
+        return state
+
+    def _touch(self, items: Dict[str, float], value: str, seen_at: float) -> None:
+        # Último uso por valor; se descartan los vencidos y los menos recientes sobre max_items.
+        # items nunca supera max_items + 1 entradas, así que el costo es constante
+        items[value] = max(items.get(value, seen_at), seen_at)
+        newest = max(items.values())
+        for stale in [key for key, last_seen in items.items() if newest - last_seen > self.recency_seconds]:
+            del items[stale]
+        while len(items) > self.max_items:
+            del items[min(items, key=items.get)]
+
+    def materialize(self, customer_id: str, state: dict) -> dict:
+        count = state["count"]
+        variance = state["m2"] / (count - 1) if count > 1 else 0.0
+        start_hour, end_hour = self._usual_hours(state["hours"])
+        return {
+            "customer_id": customer_id,
+            "usual_amount_avg": round(state["mean"], 2),
+            "usual_hours": f"{start_hour:02d}-{end_hour:02d}",
+            "usual_countries": ",".join(self._by_recency(state["countries"])),
+            "usual_devices": ",".join(self._by_recency(state["devices"])),
+            "amount_std": round(math.sqrt(variance), 2),
+            "observations": count,
+            "updated_at": datetime.utcnow().isoformat() + "Z",
+        }
+
+    def _usual_hours(self, hours: List[int]) -> Tuple[int, int]:
+        # Rango contiguo más corto (sin cruzar medianoche, como lo evalúa TransactionContextAgent)
+        # que cubre hours_coverage de las transacciones; 24x24 operaciones como máximo
+        total = sum(hours)
+        needed = self.hours_coverage * total
+        best = (0, HOURS_IN_DAY - 1)
+        for start in range(HOURS_IN_DAY):
+            covered = 0
+            for end in range(start, HOURS_IN_DAY):
+                covered += hours[end]
+                if covered >= needed:
+                    if end - start < best[1] - best[0]:
+                        best = (start, end)
+                    break
+        # Se ensancha alrededor del rango hasta min_hours_span, sin salir de 00-23
+        start, end = best
+        while end - start + 1 < min(self.min_hours_span, HOURS_IN_DAY):
+            if start > 0 and (end == HOURS_IN_DAY - 1 or (end - start) % 2):
+                start -= 1
+            else:
+                end += 1
+        return start, end
+
+    @staticmethod
+    def _by_recency(items: Dict[str, float]) -> List[str]:
+        return [value for value, _ in sorted(items.items(), key=lambda item: (-item[1], item[0]))]
+
+    @staticmethod
+    def _field(transaction, name: str):
+        if isinstance(transaction, TransactionRequest):
+            return getattr(transaction, name)
+        return transaction.get(name)
+
+    @staticmethod
+    def _timestamp(value) -> datetime:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        # Sin zona horaria se interpreta como UTC (así se registran en el pipeline)
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+    # --- Lectura (request path) ---
+
+    async def get_many(self, customer_ids) -> Dict[str, UsualBehavior]:
+        """Perfiles aprendidos con al menos min_observations, ya materializados."""
+        customer_ids = list(customer_ids)
+        if self.redis is not None:
+            views = await self.redis.get_customer_profiles(customer_ids)
+        else:
+            views = {customer_id: self._views[customer_id] for customer_id in customer_ids if customer_id in self._views}
+
+        profiles = {}
+        for customer_id, view in views.items():
+            if view.get("observations", 0) >= self.min_observations:
+                profiles[customer_id] = UsualBehavior(**view)
+            else:
+                self.not_mature += 1
+        self.served_learned += len(profiles)
+        return profiles
+
+    async def get(self, customer_id: str) -> Optional[UsualBehavior]:
+        return (await self.get_many([customer_id])).get(customer_id)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if self.redis is not None else "local",
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "updates": self.updates,
+            "failed": self.failed,
+            "conflicts": self.conflicts,
+            "queue_size": self.queue.qsize() if self.queue is not None else 0,
+            "local_profiles": len(self._views),
+            "local_evicted": self.evicted,
+            "served_learned": self.served_learned,
+            "not_mature": self.not_mature,
+            "min_observations": self.min_observations,
+        }
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+from domain.schema.schemas import UsualBehavior
+
+
+class ProfileStore:
+    """Índice en memoria de perfiles de cliente keyed por customer_id.
+
+    El archivo se carga una sola vez y se recarga cuando cambia su mtime.
+    La recarga construye un diccionario nuevo y lo publica con una sola
+    asignación, así los lectores nunca ven un índice a medio construir.
+    """
+
+    def __init__(self, db_path: str = "usual_behavior_db.json", check_interval_seconds: float | None = None):
+        self.db_path = db_path
+        if check_interval_seconds is None:
+            check_interval_seconds = float(os.getenv("PROFILE_STORE_CHECK_INTERVAL", "1.0"))
+        self.check_interval_seconds = check_interval_seconds
+        self._profiles: Dict[str, UsualBehavior] = {}
+        self._mtime: float | None = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.load_time_seconds = 0.0
+        self.loaded_at: float | None = None
+        self.reload_count = 0
+        self.memory_bytes = 0
+        self.load()
+
+    def load(self) -> None:
+        start = time.perf_counter()
+        mtime = os.stat(self.db_path).st_mtime
+        with open(self.db_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        profiles = {}
+        for record in data:
+            customer_id = record.get("customer_id")
+            if customer_id:
+                profiles[customer_id] = UsualBehavior(**record)
+
+        # Tamaño calculado una vez por carga: stats() lo lee en cada scrape de /metrics
+        memory_bytes = self.memory_footprint_bytes(profiles)
+
+        # Swap atómico del índice
+        self._profiles = profiles
+        self._mtime = mtime
+        self.memory_bytes = memory_bytes
+        self.load_time_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        self.reload_count += 1
+        print(f"[PROFILES] Loaded {len(profiles)} profiles in {self.load_time_seconds * 1000:.2f} ms")
+
+    def _reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval_seconds:
+            return
+        self._last_check = now
+
+        try:
+            mtime = os.stat(self.db_path).st_mtime
+        except OSError as e:
+            print(f"[PROFILES] Could not stat {self.db_path}: {e}")
+            return
+
+        if mtime != self._mtime and self._lock.acquire(blocking=False):
+            try:
+                self.load()
+            except Exception as e:
+                # Se conserva el índice anterior si el archivo nuevo es inválido
+                print(f"[PROFILES] Reload failed, keeping previous snapshot: {e}")
+            finally:
+                self._lock.release()
+
+    def get(self, customer_id: str) -> Optional[UsualBehavior]:
+        self._reload_if_changed()
+        return self._profiles.get(customer_id)
+
+    def get_many(self, customer_ids) -> Dict[str, Optional[UsualBehavior]]:
+        self._reload_if_changed()
+        profiles = self._profiles
+        return {customer_id: profiles.get(customer_id) for customer_id in customer_ids}
+
+    def memory_footprint_bytes(self, profiles: Dict[str, UsualBehavior] | None = None) -> int:
+        profiles = self._profiles if profiles is None else profiles
+        total = sys.getsizeof(profiles)
+        for customer_id, profile in profiles.items():
+            total += sys.getsizeof(customer_id) + sys.getsizeof(profile) + sys.getsizeof(profile.__dict__)
+            total += sum(sys.getsizeof(v) for v in profile.__dict__.values())
+        return total
+
+    def stats(self) -> dict:
+        return {
+            "profiles": len(self._profiles),
+            "load_time_seconds": round(self.load_time_seconds, 6),
+            "loaded_at": self.loaded_at,
+            "reload_count": self.reload_count,
+            "memory_bytes": self.memory_bytes,
+        }
@@ -0,0 +1,313 @@
+"""Replay de tráfico histórico sobre las etapas deterministas del pipeline.
+
+Responde "¿qué habrían decidido las reglas y el ruteo?" sin llamar a la API
+ni a los LLM. Lee en streaming archivos NDJSON o exports de DynamoDB a S3
+(.json/.json.gz, una línea {"Item": {...}} en DynamoDB JSON), reparte los
+chunks de líneas a un pool de procesos y en cada uno aplica
+TransactionContextAgent.score_batch, las políticas deterministas
+(PolicyEngine.evaluate_frame) y el ruteo de should_debate.
+
+Cada línea puede ser un TransactionRequest o un item guardado por el
+pipeline (con transaction_request, usual_behavior, decision, debate,
+last_decision). En los items guardados se usa el perfil registrado en la
+decisión (salvo --current-profiles) y se compara con lo que se decidió.
+
+Uso (desde Backend/):
+    python -m application.replay historico.ndjson --output replay.csv --summary replay_summary.json
+    python -m application.replay export/data/*.json.gz --workers 8 --chunk-size 20000
+"""
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+from boto3.dynamodb.types import TypeDeserializer
+from infraestructure.agents.transaction_context_agent import TransactionContextAgent
+from infraestructure.aws.dynamo_codec import decode_item
+from infraestructure.langgraph_init import DEBATE_SKIP_ANOMALY_SCORE
+from infraestructure.policy_engine import PolicyEngine
+import argparse
+import gzip
+import json
+import os
+import time
+import pandas as pd
+
+SIGNALS = ("amount", "time", "device", "country")
+TRANSACTION_COLUMNS = ("transaction_id", "customer_id", "amount", "currency", "country", "channel", "device_id", "timestamp")
+PROFILE_COLUMNS = ("customer_id", "usual_amount_avg", "usual_hours", "usual_countries", "usual_devices")
+
+# Estado de cada proceso del pool (se fija en _init_worker)
+_worker: dict = {}
+
+
+def _init_worker(profiles: pd.DataFrame, use_recorded_profiles: bool) -> None:
+    _worker["agent"] = TransactionContextAgent()
+    _worker["policy_engine"] = PolicyEngine()
+    _worker["profiles"] = profiles
+    _worker["use_recorded_profiles"] = use_recorded_profiles
+    _worker["deserializer"] = TypeDeserializer()
+
+
+def _parse_line(line: str) -> dict:
+    record = json.loads(line)
+    if "Item" in record and isinstance(record["Item"], dict):
+        # Export de DynamoDB: {"Item": {"attr": {"S": ...}}}
+        deserializer = _worker["deserializer"]
+        record = decode_item({key: deserializer.deserialize(value) for key, value in record["Item"].items()})
+    return record
+
+
+def _normalize_timestamp(timestamp):
+    # encode_item agrega "Z" también a datetimes con offset ("...+00:00Z")
+    if isinstance(timestamp, str) and timestamp.endswith("Z") and ("+" in timestamp[10:] or "-" in timestamp[19:]):
+        return timestamp[:-1]
+    return timestamp
+
+
+def _recorded_branch(item: dict) -> str:
+    if (item.get("policy_match") or {}).get("enforced"):
+        return "policy_decision"
+    return "debate_agents" if item.get("debate") else "decision_arbiter"
+
+
+def _recorded(item: dict) -> dict:
+    decision = item.get("decision") or {}
+    last_decision = item.get("last_decision") or {}
+    human = last_decision.get("value") if last_decision.get("decided_by") == "human" else None
+    if not decision:
+        return {"recorded_branch": None, "recorded_decision": None, "human_decision": None, "final_decision": None}
+    return {
+        "recorded_branch": _recorded_branch(item),
+        "recorded_decision": decision.get("value"),
+        "human_decision": human,
+        "final_decision": human or decision.get("value"),
+    }
+
+
+def replay_chunk(lines: List[str]) -> tuple:
+    """Procesa un chunk de líneas y devuelve (outcomes, líneas inválidas)."""
+    transactions, recorded, recorded_profiles = [], [], []
+    invalid = 0
+    for line in lines:
+        try:
+            item = _parse_line(line)
+            tx = item.get("transaction_request") or item
+            row = {column: tx[column] for column in TRANSACTION_COLUMNS}
+            row["timestamp"] = _normalize_timestamp(row["timestamp"])
+        except (ValueError, KeyError, TypeError):
+            invalid += 1
+            continue
+        # El perfil registrado se indexa por transacción para no mezclar snapshots del mismo cliente
+        profile = item.get("usual_behavior") if _worker["use_recorded_profiles"] else None
+        row["profile_key"] = f"{row['customer_id']}@{row['transaction_id']}" if profile else row["customer_id"]
+        if profile:
+            recorded_profiles.append({**{column: profile.get(column) for column in PROFILE_COLUMNS}, "customer_id": row["profile_key"]})
+        transactions.append(row)
+        recorded.append(_recorded(item))
+
+    if not transactions:
+        return pd.DataFrame(), invalid
+
+    frame = pd.DataFrame(transactions)
+    # Solo los perfiles del chunk: score_batch los parsea en cada llamada
+    profiles = _worker["profiles"]
+    profiles = profiles[profiles["customer_id"].isin(frame["profile_key"])]
+    if recorded_profiles:
+        profiles = pd.concat([profiles, pd.DataFrame(recorded_profiles)], ignore_index=True)
+
+    scores = _worker["agent"].score_batch(
+        frame.drop(columns="customer_id").rename(columns={"profile_key": "customer_id"}), profiles
+    )
+    outcomes = pd.DataFrame({
+        "transaction_id": frame["transaction_id"],
+        "customer_id": frame["customer_id"],
+        "amount": frame["amount"],
+        "has_profile": scores["has_profile"],
+        **{f"{signal}_anomaly": scores[f"{signal}_anomaly"] for signal in SIGNALS},
+        "anomaly_count": scores["anomaly_count"],
+        "anomaly_score": scores["anomaly_score"],
+    })
+    # Mismo criterio que should_debate en LangGraphInit
+    outcomes["branch"] = (outcomes["anomaly_score"] > DEBATE_SKIP_ANOMALY_SCORE).map(
+        {True: "decision_arbiter", False: "debate_agents"}
+    )
+    engine = _worker["policy_engine"]
+    if engine.enabled:
+        policies = engine.evaluate_frame(scores)
+        outcomes = pd.concat([outcomes, policies], axis=1)
+        if engine.enforced:
+            outcomes.loc[policies["policy_decision"].notna(), "branch"] = "policy_decision"
+    return pd.concat([outcomes, pd.DataFrame(recorded)], axis=1), invalid
+
+
+def iter_lines(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def iter_chunks(lines: Iterator[str], chunk_size: int) -> Iterator[List[str]]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ReplaySummary:
+    """Agregados incrementales: no guarda los outcomes en memoria."""
+
+    def __init__(self):
+        self.rows = 0
+        self.invalid = 0
+        self.without_profile = 0
+        self.branches = Counter()
+        self.anomalies = Counter()
+        self.branch_vs_recorded = Counter()
+        self.anomaly_count_vs_decision = Counter()
+        self.branch_vs_decision = Counter()
+        self.policy_matches = Counter()
+        self.policy_vs_decision = Counter()
+
+    def add(self, outcomes: pd.DataFrame, invalid: int) -> None:
+        self.invalid += invalid
+        if outcomes.empty:
+            return
+        self.rows += len(outcomes)
+        self.without_profile += int((~outcomes["has_profile"]).sum())
+        self.branches.update(outcomes["branch"].value_counts().to_dict())
+        for signal in SIGNALS:
+            self.anomalies[signal] += int(outcomes[f"{signal}_anomaly"].sum())
+        if "policy_matches" in outcomes:
+            matches = outcomes["policy_matches"][outcomes["policy_matches"] != ""]
+            self.policy_matches.update(matches.str.split(",").explode().value_counts().to_dict())
+
+        recorded = outcomes[outcomes["final_decision"].notna()]
+        if not recorded.empty:
+            self.branch_vs_recorded.update(recorded.groupby(["branch", "recorded_branch"]).size().to_dict())
+            self.anomaly_count_vs_decision.update(recorded.groupby(["anomaly_count", "final_decision"]).size().to_dict())
+            self.branch_vs_decision.update(recorded.groupby(["branch", "final_decision"]).size().to_dict())
+            if "policy_decision" in recorded:
+                policy = recorded.assign(policy_decision=recorded["policy_decision"].fillna("NO_MATCH"))
+                self.policy_vs_decision.update(policy.groupby(["policy_decision", "final_decision"]).size().to_dict())
+
+    @staticmethod
+    def _matrix(counter: Counter) -> Dict[str, Dict[str, int]]:
+        matrix: Dict[str, Dict[str, int]] = {}
+        for (row, column), count in sorted(counter.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+            matrix.setdefault(str(row), {})[str(column)] = int(count)
+        return matrix
+
+    def to_dict(self, elapsed: float) -> dict:
+        compared = sum(self.branch_vs_recorded.values())
+        agreed = sum(count for (branch, recorded), count in self.branch_vs_recorded.items() if branch == recorded)
+        return {
+            "rows": self.rows,
+            "invalid_lines": self.invalid,
+            "without_profile": self.without_profile,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_hour": round(self.rows / elapsed * 3600) if elapsed else None,
+            "branches": {branch: int(count) for branch, count in sorted(self.branches.items())},
+            "policy_matches": {policy_id: int(count) for policy_id, count in sorted(self.policy_matches.items())},
+            "anomaly_rate": {signal: round(self.anomalies[signal] / self.rows, 4) if self.rows else 0.0 for signal in SIGNALS},
+            "compared_with_recorded": compared,
+            "branch_agreement": round(agreed / compared, 4) if compared else None,
+            # Filas: resultado del replay, columnas: lo registrado (decisión final = humana si hubo revisión)
+            "branch_vs_recorded_branch": self._matrix(self.branch_vs_recorded),
+            "branch_vs_final_decision": self._matrix(self.branch_vs_decision),
+            "anomaly_count_vs_final_decision": self._matrix(self.anomaly_count_vs_decision),
+            # Decisión que impondrían las políticas (NO_MATCH: sin match o ambiguo) frente a la registrada
+            "policy_decision_vs_final_decision": self._matrix(self.policy_vs_decision),
+        }
+
+
+def load_profiles(path: str | None) -> pd.DataFrame:
+    if not path:
+        return pd.DataFrame(columns=list(PROFILE_COLUMNS))
+    with open(path, "r", encoding="utf-8") as f:
+        return pd.DataFrame(json.load(f), columns=list(PROFILE_COLUMNS))
+
+
+def write_outcomes(outcomes: pd.DataFrame, f, header: bool, fmt: str) -> None:
+    if outcomes.empty:
+        return
+    if fmt == "ndjson":
+        outcomes.to_json(f, orient="records", lines=True, force_ascii=False)
+    else:
+        outcomes.to_csv(f, header=header, index=False)
+
+
+def run(paths: List[str], output: str | None, profiles_path: str | None, workers: int, chunk_size: int,
+        use_recorded_profiles: bool = True) -> dict:
+    profiles = load_profiles(profiles_path)
+    summary = ReplaySummary()
+    fmt = "ndjson" if output and output.endswith((".ndjson", ".jsonl")) else "csv"
+    out = open(output, "w", encoding="utf-8", newline="") if output else None
+    start = time.perf_counter()
+    header = True
+
+    def consume(result) -> None:
+        nonlocal header
+        outcomes, invalid = result
+        summary.add(outcomes, invalid)
+        if out is not None and not outcomes.empty:
+            write_outcomes(outcomes, out, header, fmt)
+            header = False
+
+    try:
+        chunks = iter_chunks(iter_lines(paths), chunk_size)
+        if workers <= 0:
+            _init_worker(profiles, use_recorded_profiles)
+            for chunk in chunks:
+                consume(replay_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(profiles, use_recorded_profiles)) as pool:
+                # Chunks en vuelo acotados: memoria constante y outcomes en el orden de entrada
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(replay_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        consume(pending.popleft().result())
+                while pending:
+                    consume(pending.popleft().result())
+    finally:
+        if out is not None:
+            out.close()
+
+    return summary.to_dict(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de transacciones históricas sobre reglas y ruteo deterministas")
+    parser.add_argument("inputs", nargs="+", help="Archivos NDJSON o export de DynamoDB (.json/.json.gz)")
+    parser.add_argument("--output", help="Outcomes por transacción (.csv, o .ndjson/.jsonl)")
+    parser.add_argument("--summary", help="Archivo JSON para el resumen (por defecto se imprime)")
+    parser.add_argument("--profiles", default="usual_behavior_db.json",
+                        help="Perfiles para transacciones sin perfil registrado")
+    parser.add_argument("--current-profiles", action="store_true",
+                        help="Ignora el usual_behavior registrado en cada item y usa --profiles")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos del pool (0 = sin pool)")
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    args = parser.parse_args()
+
+    summary = run(args.inputs, args.output, args.profiles, args.workers, args.chunk_size,
+                  use_recorded_profiles=not args.current_profiles)
+    summary["run_at"] = datetime.utcnow().isoformat() + "Z"
+    report = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"Summary saved to {args.summary}")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
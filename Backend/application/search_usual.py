@@ -1,16 +1,28 @@
-import json
-from pathlib import Path
+from application.profile_builder import ProfileBuilder
+from application.profile_store import ProfileStore
 from domain.schema.schemas import UsualBehavior
 
 class SearchUsual:
 
+    def __init__(self, profile_store: ProfileStore = None, profile_builder: ProfileBuilder = None):
+        self.profile_store = profile_store or ProfileStore()
+        self.profile_builder = profile_builder
+
     def get_usual_behavior_by_customer_id(self, customer_id: str) -> UsualBehavior:
+        return self.profile_store.get(customer_id)
+
+    def get_usual_behaviors(self, customer_ids) -> dict:
+        return self.profile_store.get_many(customer_ids)
 
-        db_path: str = "usual_behavior_db.json"
+    async def resolve_usual_behavior(self, customer_id: str) -> UsualBehavior:
+        return (await self.resolve_usual_behaviors([customer_id])).get(customer_id)
 
-        with open(db_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        for record in data:
-            if record.get("customer_id") == customer_id:
-                return UsualBehavior(**record)
-        return None
\ No newline at end of file
+    async def resolve_usual_behaviors(self, customer_ids) -> dict:
+        # Perfil aprendido (ya materializado) si tiene suficientes observaciones; si no, el estático
+        profiles = self.get_usual_behaviors(customer_ids)
+        if self.profile_builder is not None:
+            try:
+                profiles.update(await self.profile_builder.get_many(customer_ids))
+            except Exception as e:
+                print(f"[PROFILES] Learned profiles unavailable, using static: {e}")
+        return profiles
@@ -0,0 +1,168 @@
+"""Paridad y rendimiento de TransactionContextAgent.score_batch.
+
+Uso (desde Backend/):
+    python -m benchmarks.bench_context_scoring --transactions 200000 --customers 5000
+
+Genera perfiles y transacciones sintéticas (incluye clientes sin perfil,
+horarios mal formados, promedios en cero y montos exactamente en el umbral),
+puntúa cada transacción con el camino por transacción (check_* +
+calculate_composite_risk) y el lote con score_batch, y falla si algún flag,
+score, ratio o riesgo compuesto difiere. Lo mismo para las políticas
+deterministas: PolicyEngine.evaluate por transacción frente a evaluate_frame
+sobre el lote. Luego reporta filas por segundo de ambos caminos.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from domain.schema.schemas import TransactionRequest, UsualBehavior
+from infraestructure.agents.transaction_context_agent import TransactionContextAgent
+from infraestructure.policy_engine import PolicyEngine
+
+HOURS = ["08-20", "09-22", "00-23", "9-17", "22-06", "24h", "08-20-1", ""]
+DEVICES = [f"D-{i:02d}" for i in range(1, 30)]
+COUNTRIES = ["PE", "CL", "CO", "MX", "US", "ES", "AR"]
+SIGNALS = ("amount", "time", "device", "country")
+
+
+def build_profiles(customers: int, rng: random.Random) -> list:
+    profiles = []
+    for i in range(customers):
+        profiles.append(UsualBehavior(
+            customer_id=f"CU-{i:06d}",
+            usual_amount_avg=rng.choice([0.0, round(rng.uniform(50, 5000), 2), float(rng.randint(1, 40) * 25)]),
+            usual_hours=rng.choice(HOURS),
+            usual_countries=", ".join(rng.sample(COUNTRIES, rng.randint(1, 3))),
+            usual_devices=",".join(rng.sample(DEVICES, rng.randint(1, 3))),
+        ))
+    return profiles
+
+
+def build_transactions(count: int, customers: int, profiles: dict, rng: random.Random) -> list:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    transactions = []
+    for i in range(count):
+        # ~5% de clientes sin perfil
+        customer_id = f"CU-{rng.randint(0, int(customers * 1.05)):06d}"
+        profile = profiles.get(customer_id)
+        avg = profile.usual_amount_avg if profile else 500.0
+        # Montos en el umbral exacto (2x) para ejercitar el borde de la comparación
+        amount = rng.choice([avg * 2, round(avg * rng.uniform(0.1, 6), 2), float(rng.randint(1, 9999))])
+        known_devices = [d.strip() for d in profile.usual_devices.split(",")] if profile else DEVICES
+        known_countries = [c.strip() for c in profile.usual_countries.split(",")] if profile else COUNTRIES
+        transactions.append(TransactionRequest(
+            transaction_id=f"T-{i:08d}",
+            customer_id=customer_id,
+            amount=amount,
+            currency="PEN",
+            country=rng.choice(known_countries) if rng.random() < 0.8 else rng.choice(COUNTRIES),
+            channel=rng.choice(["web", "app", "pos"]),
+            device_id=rng.choice(known_devices) if rng.random() < 0.8 else rng.choice(DEVICES),
+            timestamp=start + timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        ))
+    return transactions
+
+
+def score_one(agent: TransactionContextAgent, transaction: TransactionRequest, profile) -> dict:
+    signals = {
+        "amount_anomaly": agent.check_amount_anomaly(transaction, profile),
+        "time_anomaly": agent.check_time_anomaly(transaction, profile),
+        "device_anomaly": agent.check_device_anomaly(transaction, profile),
+        "country_anomaly": agent.check_country_anomaly(transaction, profile),
+    }
+    return {"signals": signals, "anomaly_score": agent.calculate_composite_risk(signals)}
+
+
+def check_parity(expected: list, batch: pd.DataFrame) -> list:
+    mismatches = []
+    columns = {name: batch[name].to_numpy() for name in batch.columns}
+    for i, row in enumerate(expected):
+        diffs = {}
+        for signal in SIGNALS:
+            data = row["signals"][f"{signal}_anomaly"]
+            if bool(columns[f"{signal}_anomaly"][i]) != data["is_anomaly"]:
+                diffs[f"{signal}_anomaly"] = (data["is_anomaly"], bool(columns[f"{signal}_anomaly"][i]))
+            if float(columns[f"{signal}_score"][i]) != data["score"]:
+                diffs[f"{signal}_score"] = (data["score"], float(columns[f"{signal}_score"][i]))
+        ratio = row["signals"]["amount_anomaly"].get("ratio")
+        if ratio is not None and float(columns["amount_ratio"][i]) != ratio:
+            diffs["amount_ratio"] = (ratio, float(columns["amount_ratio"][i]))
+        if float(columns["anomaly_score"][i]) != row["anomaly_score"]:
+            diffs["anomaly_score"] = (row["anomaly_score"], float(columns["anomaly_score"][i]))
+        if diffs:
+            mismatches.append({"transaction_id": columns["transaction_id"][i], **diffs})
+    return mismatches
+
+
+def check_policy_parity(engine: PolicyEngine, expected: list, batch: pd.DataFrame) -> tuple:
+    start = time.perf_counter()
+    matches = [engine.evaluate(row["signals"]) for row in expected]
+    per_transaction_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    frame = engine.evaluate_frame(batch)
+    batch_seconds = time.perf_counter() - start
+
+    mismatches = []
+    for i, (match, matched_ids, decision) in enumerate(zip(matches, frame["policy_matches"], frame["policy_decision"])):
+        expected_ids = ",".join(item["policy_id"] for item in match["matched"])
+        decision = decision if pd.notna(decision) else None
+        if expected_ids != matched_ids or match["decision"] != decision:
+            mismatches.append({"row": i, "expected": (expected_ids, match["decision"]), "batch": (matched_ids, decision)})
+    return frame, mismatches, per_transaction_seconds, batch_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad y rendimiento del scoring columnar de TransactionContextAgent")
+    parser.add_argument("--transactions", type=int, default=200000)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    agent = TransactionContextAgent()
+    profile_list = build_profiles(args.customers, rng)
+    profiles = {profile.customer_id: profile for profile in profile_list}
+    transactions = build_transactions(args.transactions, args.customers, profiles, rng)
+
+    start = time.perf_counter()
+    expected = [score_one(agent, tx, profiles.get(tx.customer_id)) for tx in transactions]
+    per_transaction_seconds = time.perf_counter() - start
+
+    transactions_frame = pd.DataFrame([tx.model_dump() for tx in transactions])
+    profiles_frame = pd.DataFrame([profile.model_dump() for profile in profile_list])
+    start = time.perf_counter()
+    batch = agent.score_batch(transactions_frame, profiles_frame)
+    batch_seconds = time.perf_counter() - start
+
+    mismatches = check_parity(expected, batch)
+    engine = PolicyEngine(mode="enforce")
+    policy_frame, policy_mismatches, policy_seconds, policy_batch_seconds = check_policy_parity(engine, expected, batch)
+    results = {
+        "transactions": args.transactions,
+        "customers": args.customers,
+        "with_profile": int(batch["has_profile"].sum()),
+        "anomaly_rate": {signal: round(float(batch[f"{signal}_anomaly"].mean()), 4) for signal in SIGNALS},
+        "mismatches": len(mismatches),
+        "per_transaction_rows_per_second": round(args.transactions / per_transaction_seconds),
+        "batch_rows_per_second": round(args.transactions / batch_seconds),
+        "speedup": round(per_transaction_seconds / batch_seconds, 1),
+        "policy_decisions": {str(k): int(v) for k, v in policy_frame["policy_decision"].fillna("NO_MATCH").value_counts().items()},
+        "policy_mismatches": len(policy_mismatches),
+        "policy_evaluate_us": round(policy_seconds / args.transactions * 1e6, 2),
+        "policy_batch_rows_per_second": round(args.transactions / policy_batch_seconds),
+    }
+    print(json.dumps(results, indent=2))
+    if mismatches:
+        print(json.dumps(mismatches[:5], indent=2, default=str))
+        raise SystemExit("score_batch differs from the per-transaction path")
+    if policy_mismatches:
+        print(json.dumps(policy_mismatches[:5], indent=2, default=str))
+        raise SystemExit("evaluate_frame differs from PolicyEngine.evaluate")
+
+
+if __name__ == "__main__":
+    main()
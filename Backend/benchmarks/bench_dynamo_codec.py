@@ -0,0 +1,144 @@
+"""Microbenchmark del codec de DynamoDB contra el camino anterior.
+
+Uso (desde Backend/):
+    python -m benchmarks.bench_dynamo_codec --iterations 2000 --debate-rounds 2
+
+El camino anterior (_serialize_to_dict + _convert_floats_to_decimal al
+escribir, _convert_decimal_to_float al leer) se reproduce aquí como
+referencia. Antes de medir se verifica que ambos produzcan el mismo item.
+"""
+import argparse
+import json
+import statistics
+import timeit
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
+
+from domain.schema.schemas import TransactionRequest, UsualBehavior
+from infraestructure.aws.dynamo_codec import decode_item, encode_item
+
+
+def legacy_serialize_to_dict(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        return obj.isoformat() + 'Z'
+    elif hasattr(obj, 'model_dump'):
+        return legacy_serialize_to_dict(obj.model_dump())
+    elif hasattr(obj, 'dict'):
+        return legacy_serialize_to_dict(obj.dict())
+    elif isinstance(obj, dict):
+        return {k: legacy_serialize_to_dict(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple, set)):
+        return [legacy_serialize_to_dict(item) for item in obj]
+    return obj
+
+
+def legacy_convert_floats_to_decimal(obj: Any) -> Any:
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    elif isinstance(obj, dict):
+        return {k: legacy_convert_floats_to_decimal(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_convert_floats_to_decimal(item) for item in obj]
+    return obj
+
+
+def legacy_convert_decimal_to_float(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    elif isinstance(obj, dict):
+        return {k: legacy_convert_decimal_to_float(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [legacy_convert_decimal_to_float(item) for item in obj]
+    return obj
+
+
+def legacy_encode(state: dict) -> dict:
+    return legacy_convert_floats_to_decimal(legacy_serialize_to_dict(state))
+
+
+def build_state(debate_rounds: int) -> dict:
+    """Resultado del grafo con la forma y tamaño típicos de una transacción debatida."""
+    request = TransactionRequest(
+        transaction_id="T-1001", customer_id="CU-001", amount=1800.0, currency="PEN", country="PE",
+        channel="web", device_id="D-99", timestamp=datetime(2025, 12, 17, 3, 15),
+    )
+    usual = UsualBehavior(customer_id="CU-001", usual_amount_avg=500.0, usual_hours="08-20",
+                          usual_countries="PE", usual_devices="D-01")
+    argument = "Argumento del debate con referencias a la evidencia de políticas y amenazas. " * 5
+    audit = []
+    for name in ("transaction_context_agent", "behavioral_agent", "internal_policy_rag_agent",
+                 "external_threat_agent", "debate_agents", "decision_arbiter", "explainability_agent"):
+        audit.append({
+            "agent_name": name, "status": "completed", "execution_time": datetime(2025, 12, 17, 3, 15, 2),
+            "duration_seconds": 0.4213, "confidence": 0.87, "details": {"score": 0.61, "tokens": 812},
+        })
+    return {
+        "transaction_id": request.transaction_id,
+        "transaction_request": request,
+        "usual_behavior": usual,
+        "behavioral_analysis": {"deviation_score": 0.72, "notes": "Monto y horario atípicos para el cliente"},
+        "anomaly_score": 0.75,
+        "anomaly_signals": {
+            "amount": {"is_anomaly": True, "ratio": 3.6},
+            "time": {"is_anomaly": True, "hour": 3},
+            "device": {"is_anomaly": True, "device_id": "D-99"},
+            "country": {"is_anomaly": False, "country": "PE"},
+        },
+        "signals": ["Monto fuera de rango", "Horario no habitual", "Dispositivo nuevo"],
+        "rag_evidence": [
+            {"policy_id": f"FP-0{i}", "chunk_id": str(i), "version": "2025.1", "score": 0.8 - i * 0.05,
+             "rule": "Monto > 3x promedio habitual y horario fuera de rango → CHALLENGE"}
+            for i in range(1, 6)
+        ],
+        "search_evidence": [
+            {"url": f"https://example.org/alerta-{i}", "summary": "Campaña de fraude con dispositivos nuevos", "fraud_type": "account_takeover"}
+            for i in range(3)
+        ],
+        "debate": [
+            {"round": r, "agent": agent, "argument": argument, "confidence": 0.65}
+            for r in range(1, debate_rounds + 1) for agent in ("pro_customer", "pro_fraud")
+        ],
+        "decision": {"value": "CHALLENGE", "confidence": 0.78, "chain_of_thought": argument},
+        "explanations": argument,
+        "explanation_audit": argument * 2,
+        "agent_audit": audit,
+        "need_human_review": False,
+    }
+
+
+def measure(fn, arg, iterations: int, repeats: int) -> dict:
+    runs = timeit.repeat(lambda: fn(arg), number=iterations, repeat=repeats)
+    per_call_us = [run / iterations * 1e6 for run in runs]
+    return {"best_us": round(min(per_call_us), 2), "median_us": round(statistics.median(per_call_us), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark del codec de items de DynamoDB")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--debate-rounds", type=int, default=2)
+    args = parser.parse_args()
+
+    state = build_state(args.debate_rounds)
+    legacy_item = legacy_encode(state)
+    item = encode_item(state)
+    if item != legacy_item:
+        raise SystemExit("Codec output differs from the legacy serializer")
+    if decode_item(item) != legacy_convert_decimal_to_float(legacy_item):
+        raise SystemExit("Codec decode differs from the legacy converter")
+
+    results = {
+        "item_bytes": len(json.dumps(decode_item(item), ensure_ascii=False)),
+        "encode_legacy": measure(legacy_encode, state, args.iterations, args.repeats),
+        "encode_codec": measure(encode_item, state, args.iterations, args.repeats),
+        "decode_legacy": measure(legacy_convert_decimal_to_float, item, args.iterations, args.repeats),
+        "decode_codec": measure(decode_item, item, args.iterations, args.repeats),
+    }
+    results["encode_speedup"] = round(results["encode_legacy"]["median_us"] / results["encode_codec"]["median_us"], 2)
+    results["decode_speedup"] = round(results["decode_legacy"]["median_us"] / results["decode_codec"]["median_us"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compara la latencia del pipeline en modo serial vs paralelo.
+
+Uso (desde Backend/):
+    python -m benchmarks.compare_pipeline_modes --runs 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from application.search_usual import SearchUsual
+from domain.schema.schemas import AgentState, TransactionRequest
+from infraestructure.langgraph_init import LangGraphInit
+from infraestructure.openai_client import OpenAIClient
+from infraestructure.redis_adapter import RedisAdapter
+
+
+def load_sample_transaction(path: str = "schema.json") -> TransactionRequest:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    tx = data["transaction_data"]
+    return TransactionRequest(**{k: tx[k] for k in TransactionRequest.model_fields})
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+async def measure(runnable, request: TransactionRequest, usual_behavior, runs: int) -> list[float]:
+    durations = []
+    for _ in range(runs):
+        state = AgentState(
+            transaction_id=request.transaction_id,
+            transaction_request=request,
+            usual_behavior=usual_behavior,
+        )
+        start = time.perf_counter()
+        await runnable.ainvoke(input=state)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+async def main(runs: int):
+    request = load_sample_transaction()
+    usual_behavior = SearchUsual().get_usual_behavior_by_customer_id(request.customer_id)
+    llm = OpenAIClient().get_llm()
+    graph = LangGraphInit(llm, RedisAdapter())
+
+    report = {}
+    for mode, parallel in (("serial", False), ("parallel", True)):
+        runnable = graph.build_graph(parallel=parallel)
+        durations = await measure(runnable, request, usual_behavior, runs)
+        report[mode] = {
+            "runs": runs,
+            "mean_seconds": round(statistics.mean(durations), 3),
+            "p50_seconds": round(percentile(durations, 50), 3),
+            "p95_seconds": round(percentile(durations, 95), 3),
+        }
+
+    report["speedup_p50"] = round(report["serial"]["p50_seconds"] / report["parallel"]["p50_seconds"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latencia serial vs paralelo del grafo de agentes")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs))
@@ -0,0 +1,198 @@
+"""Load test offline de /analize con dobles locales de todas las dependencias.
+
+Uso (desde Backend/):
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.load_test --count 200 --rate 20 --llm-latency-ms 300
+    python -m benchmarks.load_test --arbiter-mode tool   # comparar con single_shot
+
+Reporta throughput, percentiles de latencia end-to-end y por nodo, y el mix
+de ramas del grafo. El reporte se guarda como JSON en benchmarks/results/.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeLatency, install_fakes
+
+NODES = [
+    "transaction_context_agent", "behavioral_agent", "internal_policy_rag_agent", "external_threat_agent",
+    "evidence_join", "policy_decision", "debate_agents", "decision_arbiter", "explainability_agent", "human_review_queue",
+]
+EXTERNAL_CALLS = [
+    ("openai", "chat"), ("openai", "embeddings"), ("qdrant", "query_points"), ("perplexity", "chat"),
+]
+ROUTES = [
+    ("should_debate", "policy_decision"), ("should_debate", "debate_agents"), ("should_debate", "decision_arbiter"),
+    ("final_routing", "human_review_queue"), ("final_routing", "end"),
+]
+
+
+def build_corpus(count: int, profiles: list, seed: int) -> list:
+    """Transacciones sintéticas con la forma de schema.json y mezcla de anomalías."""
+    rng = random.Random(seed)
+    base_time = datetime(2025, 12, 17)
+    corpus = []
+    for i in range(count):
+        profile = rng.choice(profiles)
+        start_hour, end_hour = map(int, profile["usual_hours"].split("-"))
+        usual_device = profile["usual_devices"].split(",")[0].strip()
+        usual_country = profile["usual_countries"].split(",")[0].strip()
+
+        amount_anomaly = rng.random() < 0.35
+        time_anomaly = rng.random() < 0.3
+        device_anomaly = rng.random() < 0.25
+        country_anomaly = rng.random() < 0.15
+
+        amount = profile["usual_amount_avg"] * (rng.uniform(2.5, 6) if amount_anomaly else rng.uniform(0.2, 1.5))
+        hour = rng.choice([h for h in range(24) if not start_hour <= h <= end_hour]) if time_anomaly else rng.randint(start_hour, end_hour)
+        corpus.append({
+            "transaction_id": f"BENCH-{seed}-{i:06d}",
+            "customer_id": profile["customer_id"],
+            "amount": round(amount, 2),
+            "currency": "PEN",
+            "country": rng.choice(["CL", "US", "BR"]) if country_anomaly else usual_country,
+            "channel": rng.choice(["web", "mobile", "pos"]),
+            "device_id": f"D-{rng.randint(50, 99)}" if device_anomaly else usual_device,
+            "timestamp": (base_time + timedelta(hours=hour, minutes=rng.randint(0, 59))).isoformat(),
+        })
+    return corpus
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[idx], 4)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+async def run(args) -> dict:
+    latency = FakeLatency(llm_ms=args.llm_latency_ms, embedding_ms=args.embedding_latency_ms,
+                          search_ms=args.search_latency_ms, jitter=args.jitter)
+    if args.arbiter_mode:
+        os.environ["ARBITER_MODE"] = args.arbiter_mode
+    aws = install_fakes(latency)
+    try:
+        import httpx
+        import main
+        from infraestructure.context_builder import CONTEXT_TOKENS
+        from infraestructure.metrics import EXTERNAL_LATENCY, LLM_TOKENS, NODE_LATENCY, ROUTING_DECISIONS
+
+        with open("usual_behavior_db.json", "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+        corpus = build_corpus(args.count, profiles, args.seed)
+
+        await main.start_background_workers()
+        latencies = []
+        errors = 0
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+            async def send(idx: int, transaction: dict):
+                nonlocal errors
+                # Llegadas en lazo abierto a la tasa objetivo
+                await asyncio.sleep(max(0.0, idx / args.rate - (time.perf_counter() - started)))
+                request_start = time.perf_counter()
+                response = await client.post("/analize", json=transaction)
+                latencies.append(time.perf_counter() - request_start)
+                if response.status_code != 200 or response.json().get("status") == "error":
+                    errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(send(i, tx) for i, tx in enumerate(corpus)))
+            elapsed = time.perf_counter() - started
+        await main.stop_background_workers()
+
+        report = {
+            "run_at": datetime.utcnow().isoformat() + "Z",
+            "git_revision": git_revision(),
+            "config": {
+                "count": args.count, "target_rate": args.rate, "seed": args.seed,
+                "llm_latency_ms": args.llm_latency_ms, "embedding_latency_ms": args.embedding_latency_ms,
+                "search_latency_ms": args.search_latency_ms, "jitter": args.jitter,
+                "pipeline_mode": os.getenv("PIPELINE_MODE", "parallel"),
+                "arbiter_mode": main.graph.arbiter_agent.mode,
+                "policy_engine_mode": main.graph.policy_engine.mode,
+            },
+            "throughput_rps": round(len(latencies) / elapsed, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "errors": errors,
+            "end_to_end_seconds": {
+                "mean": round(statistics.mean(latencies), 4) if latencies else None,
+                "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+            },
+            "nodes": {},
+            "external_calls": {},
+            "arbiter_tokens": {
+                token_type: int(LLM_TOKENS.value(agent="arbiter", type=token_type)) for token_type in ("input", "output")
+            },
+            "context_tokens": {},
+            "branch_mix": {f"{router}:{branch}": int(ROUTING_DECISIONS.value(router=router, branch=branch)) for router, branch in ROUTES},
+        }
+        node_snapshot = NODE_LATENCY.snapshot()
+        for node in NODES:
+            data = node_snapshot.get((node,))
+            if data:
+                report["nodes"][node] = {
+                    "count": data["count"],
+                    "mean": round(data["sum"] / data["count"], 4),
+                    **{f"p{q}": round(NODE_LATENCY.quantile(q / 100, node=node), 4) for q in (50, 95, 99)},
+                }
+        external_snapshot = EXTERNAL_LATENCY.snapshot()
+        for service, operation in EXTERNAL_CALLS:
+            data = external_snapshot.get((service, operation))
+            if data:
+                report["external_calls"][f"{service}:{operation}"] = {
+                    "count": data["count"],
+                    "mean": round(data["sum"] / data["count"], 4),
+                    "p95": round(EXTERNAL_LATENCY.quantile(0.95, service=service, operation=operation), 4),
+                }
+        for (agent,), data in sorted(CONTEXT_TOKENS.snapshot().items()):
+            report["context_tokens"][agent] = {
+                "count": data["count"],
+                "mean": round(data["sum"] / data["count"], 1),
+                "p95": round(CONTEXT_TOKENS.quantile(0.95, agent=agent), 1),
+            }
+        return report
+    finally:
+        aws.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test offline del pipeline /analize")
+    parser.add_argument("--count", type=int, default=200, help="Transacciones a enviar")
+    parser.add_argument("--rate", type=float, default=20.0, help="Tasa objetivo (transacciones/s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=80.0)
+    parser.add_argument("--search-latency-ms", type=float, default=800.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variación relativa de las latencias simuladas")
+    parser.add_argument("--arbiter-mode", choices=["single_shot", "tool"], default=None,
+                        help="Sobrescribe ARBITER_MODE para la corrida")
+    parser.add_argument("--output-dir", default="benchmarks/results")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"load_test_{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Report saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
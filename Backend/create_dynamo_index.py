@@ -0,0 +1,67 @@
+"""Crea el GSI de listado de transacciones y completa entity_type en items existentes.
+
+Uso (desde Backend/): python create_dynamo_index.py
+"""
+import time
+from infraestructure.aws.dynamo import (
+    DynamoService, TRANSACTION_ENTITY_TYPE, TRANSACTIONS_INDEX_ATTRIBUTES, TRANSACTIONS_INDEX_NAME, TRANSACTIONS_INDEX_SPEC
+)
+
+
+def create_index(service: DynamoService) -> None:
+    client = service.table.meta.client
+    description = client.describe_table(TableName=service.table_name)["Table"]
+    existing = [gsi["IndexName"] for gsi in description.get("GlobalSecondaryIndexes", [])]
+    if TRANSACTIONS_INDEX_NAME in existing:
+        print(f"Index {TRANSACTIONS_INDEX_NAME} already exists")
+        return
+
+    update = {"Create": dict(TRANSACTIONS_INDEX_SPEC)}
+    if description.get("BillingModeSummary", {}).get("BillingMode") != "PAY_PER_REQUEST":
+        update["Create"]["ProvisionedThroughput"] = {
+            "ReadCapacityUnits": description["ProvisionedThroughput"]["ReadCapacityUnits"],
+            "WriteCapacityUnits": description["ProvisionedThroughput"]["WriteCapacityUnits"],
+        }
+    client.update_table(
+        TableName=service.table_name,
+        AttributeDefinitions=TRANSACTIONS_INDEX_ATTRIBUTES,
+        GlobalSecondaryIndexUpdates=[update],
+    )
+    print(f"Creating index {TRANSACTIONS_INDEX_NAME}...")
+    while True:
+        gsis = client.describe_table(TableName=service.table_name)["Table"].get("GlobalSecondaryIndexes", [])
+        status = next((g["IndexStatus"] for g in gsis if g["IndexName"] == TRANSACTIONS_INDEX_NAME), None)
+        if status == "ACTIVE":
+            break
+        time.sleep(5)
+    print(f"Index {TRANSACTIONS_INDEX_NAME} active")
+
+
+def backfill_entity_type(service: DynamoService) -> int:
+    # Items guardados antes del índice no tienen entity_type y no aparecerían en el listado
+    updated = 0
+    scan_kwargs = {
+        "ProjectionExpression": "transaction_id, saved_at, entity_type",
+    }
+    while True:
+        response = service.table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            if item.get("entity_type"):
+                continue
+            service.table.update_item(
+                Key={"transaction_id": item["transaction_id"]},
+                UpdateExpression="SET entity_type = :type, saved_at = if_not_exists(saved_at, :epoch)",
+                ExpressionAttributeValues={":type": TRANSACTION_ENTITY_TYPE, ":epoch": "1970-01-01T00:00:00Z"},
+            )
+            updated += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    print(f"Backfilled entity_type on {updated} items")
+    return updated
+
+
+if __name__ == "__main__":
+    dynamo_service = DynamoService()
+    create_index(dynamo_service)
+    backfill_entity_type(dynamo_service)
@@ -0,0 +1,34 @@
+"""Políticas internas de fraude.
+
+Cada política guarda el texto que se indexa en Qdrant para el RAG y, junto
+a él, su forma ejecutable: un predicado sobre anomaly_signals (salida de
+TransactionContextAgent) y la decisión que impone. Los predicados son JSON
+plano para poder guardarse en el payload de Qdrant:
+
+    {"all": [condición, ...]} / {"any": [condición, ...]}
+    condición: {"signal": "amount_anomaly", "field": "ratio", "op": ">", "value": 3}
+"""
+
+FRAUD_POLICIES = [
+    {
+        "policy_id": "FP-01",
+        "rule": "Monto > 3x promedio habitual y horario fuera de rango → CHALLENGE",
+        "version": "2025.1",
+        "decision": "CHALLENGE",
+        "predicate": {"all": [
+            {"signal": "amount_anomaly", "field": "ratio", "op": ">", "value": 3},
+            {"signal": "time_anomaly", "field": "is_anomaly", "op": "==", "value": True},
+        ]},
+    },
+    {
+        "policy_id": "FP-02",
+        "rule": "Transacción internacional y dispositivo nuevo → ESCALATE_TO_HUMAN",
+        "version": "2025.1",
+        "decision": "ESCALATE_TO_HUMAN",
+        # Sin país de residencia en el perfil, "internacional" = país fuera de los usuales del cliente
+        "predicate": {"all": [
+            {"signal": "country_anomaly", "field": "is_anomaly", "op": "==", "value": True},
+            {"signal": "device_anomaly", "field": "is_anomaly", "op": "==", "value": True},
+        ]},
+    },
+]
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
-from typing import Annotated, List
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal
 from typing import TypedDict
 import datetime
+import operator
 
 class TransactionRequest(BaseModel):
     transaction_id: str
@@ -26,6 +27,18 @@ class DecisionResult(BaseModel):
     chain_of_thought: str  # Razonamiento del árbitro
 
 
+# Salidas estructuradas de los agentes LLM (el schema se envía al modelo)
+class BehavioralAnalysisResult(BaseModel):
+    deviation_score: float = Field(ge=0, le=1, description="0 es comportamiento normal y 1 es muy desviado")
+    notes: str = Field(description="Análisis conciso de la desviación")
+
+
+class ArbiterDecisionResult(BaseModel):
+    chain_of_thought: str = Field(description="Razonamiento de la decisión")
+    decision: Literal["APPROVE", "CHALLENGE", "BLOCK", "ESCALATE_TO_HUMAN"]
+    confidence: float = Field(ge=0, le=1)
+
+
 class AgentState(TypedDict, total=False):
     transaction_id: str
     transaction_request: TransactionRequest
@@ -36,11 +49,14 @@ class AgentState(TypedDict, total=False):
     signals: List[str]
     rag_evidence: List[dict]  # Resultados RAG
     search_evidence: List[dict]  # Resultados Web Search
+    rendered_context: dict  # Secciones de evidencia renderizadas una vez (ContextBuilder)
+    policy_match: dict  # Políticas deterministas que cumplen (PolicyEngine)
     debate: List[dict]  # Lista de argumentos del debate
     decision: dict  # {"value": str, "chain_of_thought": str}
     explanations: str
     explanation_audit: str
-    agent_audit: List[dict]
+    # Reducer: los agentes que corren en paralelo devuelven solo sus entradas nuevas
+    agent_audit: Annotated[List[dict], operator.add]
     need_human_review: bool
 
 
@@ -1,20 +1,24 @@
-from domain.schema.schemas import AgentState
+from domain.schema.schemas import AgentState, BehavioralAnalysisResult
 from typing import Dict, Any
 from langchain_core.messages import SystemMessage, HumanMessage
+from infraestructure.llm_cache import cache_status
+from infraestructure.metrics import LLM_RETRIES, STRUCTURED_OUTPUT_FAILURES
 from datetime import datetime
-import json
+import os
 
 class BehavioralAgent:
 
     def __init__(self, llm):
         self.llm = llm
         self.name = "BehavioralAgent"
+        self.structured_llm = llm.with_structured_output(BehavioralAnalysisResult, include_raw=True)
+        # Intentos ante una salida que no valida contra el schema (1 = sin reintentos)
+        self.max_attempts = int(os.getenv("STRUCTURED_OUTPUT_MAX_ATTEMPTS", "2"))
 
     async def analyze_behavior(self, state: AgentState) -> Dict[str, Any]:
         transaction = state["transaction_request"].dict()
         behavior = state["usual_behavior"].dict()
         context = state.get("anomaly_signals", {})
-        agent_audit = state.get("agent_audit", [])
         
         # Extract hour from timestamp (handle both string and datetime objects)
         timestamp = transaction["timestamp"]
@@ -24,15 +28,11 @@ class BehavioralAgent:
             hour = timestamp.hour
         
         # Create messages for the LLM
+        # La forma de la respuesta la impone BehavioralAnalysisResult (structured output)
         system_message = SystemMessage(content="""Eres un experto en análisis de comportamiento financiero para el BCP.
             Analiza si esta transacción es consistente con el patrón histórico del cliente.
             Considera: monto, horario, ubicación, dispositivo.
-
-            RESPONDE SIEMPRE EN JSON con la siguiente estructura:
-            {
-                "deviation_score": <número entre 0 y 1, donde 0 es comportamiento normal y 1 es muy desviado>,
-                "notes": "<análisis conciso de la desviación>"
-            }""")
+            Devuelve deviation_score entre 0 (comportamiento normal) y 1 (muy desviado) y notas concisas.""")
                     
         user_content = f"""Cliente: {transaction["customer_id"]}
             Comportamiento habitual:
@@ -47,39 +47,31 @@ class BehavioralAgent:
             - País: {transaction["country"]}
             - Dispositivo: {transaction["device_id"]}
 
-            ¿Qué tan desviada está esta transacción del patrón normal? Responde en JSON."""
+            ¿Qué tan desviada está esta transacción del patrón normal?"""
         
-        user_message = HumanMessage(content=user_content)
+        messages = [system_message, HumanMessage(content=user_content)]
         
-        # Parse JSON response from LLM with retry
-        max_retries = 3
         deviation_score = 0.5
         notes = ""
+        llm_cache = None
+        failures = 0
         
-        for attempt in range(max_retries):
-            try:
-                response = await self.llm.ainvoke([system_message, user_message])
-                content = response.content
-                print("Behavioral Agent LLM Response:", content)
-                
-                # Extrae JSON desde el primer { hasta el último }
-                start_idx = content.find('{')
-                end_idx = content.rfind('}')
-                
-                if start_idx != -1 and end_idx != -1:
-                    json_str = content[start_idx:end_idx + 1]
-                    llm_analysis = json.loads(json_str)
-                    deviation_score = llm_analysis.get("deviation_score", 0.5)
-                    notes = llm_analysis.get("notes", "")
-                    break  # Success, exit retry loop
-                else:
-                    raise json.JSONDecodeError("No JSON found", content, 0)
-                    
-            except (json.JSONDecodeError, AttributeError, ValueError) as e:
-                if attempt == max_retries - 1:
-                    # Fallback after max retries
-                    deviation_score = 0.5
-                    notes = f"Error al parsear JSON después de {max_retries} intentos: {str(e)}"
+        for attempt in range(self.max_attempts):
+            result = await self.structured_llm.ainvoke(messages)
+            llm_cache = cache_status(result)
+            parsed = result.get("parsed")
+            if parsed is not None:
+                deviation_score = parsed.deviation_score
+                notes = parsed.notes
+                break
+            
+            failures += 1
+            STRUCTURED_OUTPUT_FAILURES.inc(agent="behavioral")
+            print(f"Behavioral Agent structured output failed: {result.get('parsing_error')}")
+            if attempt < self.max_attempts - 1:
+                LLM_RETRIES.inc(agent="behavioral")
+            else:
+                notes = f"Salida estructurada inválida después de {self.max_attempts} intentos: {result.get('parsing_error')}"
         
         behavioral_analysis = {
             "pattern_deviation": notes,
@@ -91,10 +83,12 @@ class BehavioralAgent:
             "agent_name": "behavioral_agent",
             "status": "completed",
             "execution_time": datetime.utcnow().isoformat() + "Z",
-            "deviation_score": deviation_score
+            "deviation_score": deviation_score,
+            "llm_cache": llm_cache,
+            "structured_output_failures": failures
         }
         
         return {
             "behavioral_analysis": behavioral_analysis,
-            "agent_audit": agent_audit + [agent_decision]
-        }
\ No newline at end of file
+            "agent_audit": [agent_decision]
+        }
@@ -1,125 +1,158 @@
 from domain.schema.schemas import AgentState
-from typing import Dict, Any
+from infraestructure.context_builder import ContextBuilder
+from typing import Dict, Any, List
 from langchain_core.messages import SystemMessage, HumanMessage
 from datetime import datetime
-import json
-from time import time
+import asyncio
+import os
+import re
 
 
 class DebateAgent():
-    def __init__(self, llm):
+    def __init__(self, llm, max_rounds: int | None = None, history_window: int | None = None,
+                 convergence_threshold: float | None = None, context_builder: ContextBuilder | None = None):
         self.llm = llm
+        self.context_builder = context_builder or ContextBuilder()
+        self.max_rounds = max_rounds if max_rounds is not None else int(os.getenv("DEBATE_MAX_ROUNDS", "2"))
+        # Número de argumentos previos que se envían como historial compacto
+        self.history_window = history_window if history_window is not None else int(os.getenv("DEBATE_HISTORY_WINDOW", "4"))
+        self.max_argument_chars = int(os.getenv("DEBATE_MAX_ARGUMENT_CHARS", "400"))
+        # Similitud (Jaccard) entre rondas a partir de la cual se considera que el debate convergió
+        self.convergence_threshold = (convergence_threshold if convergence_threshold is not None
+                                      else float(os.getenv("DEBATE_CONVERGENCE_THRESHOLD", "0.6")))
+
+        # Pro-customer system message
+        self.pro_customer_system = """Eres un agente defensor del cliente. Tu rol es argumentar que la transacción es legítima y que las señales anómalas tienen explicaciones razonables. Sé breve y conciso (máximo 2-3 oraciones)."""
+        # Pro-fraud system message
+        self.pro_fraud_system = """Eres un agente detector de fraude. Tu rol es argumentar que las señales anómalas son preocupantes y sugieren riesgo de fraude. Sé breve y conciso (máximo 2-3 oraciones)."""
 
     async def debate(self, state: AgentState) -> Dict[str, Any]:
         start_time = datetime.now()
         anomaly_signals = state.get('anomaly_signals', {})
-        signals = state.get('signals', [])
-        transaction_request = state.get('transaction_request', {})
         behavioral_analysis = state.get('behavioral_analysis', {})
-        agent_audit = state.get('agent_audit', [])
-        
-        # Pro-customer system message
-        pro_customer_system = """Eres un agente defensor del cliente. Tu rol es argumentar que la transacción es legítima y que las señales anómalas tienen explicaciones razonables. Sé breve y conciso (máximo 2-3 oraciones)."""
-        # Pro-fraud system message
-        pro_fraud_system = """Eres un agente detector de fraude. Tu rol es argumentar que las señales anómalas son preocupantes y sugieren riesgo de fraude. Sé breve y conciso (máximo 2-3 oraciones)."""
         
         debate_transcript = []
-        context_summary = self._build_context_summary(anomaly_signals, signals, transaction_request, behavioral_analysis)
+        context_summary, context_usage = self.context_builder.view(state, "debate")
         
-        for round_num in range(1, 3):
-            # Pro-customer argument
-            customer_prompt = f"""Round {round_num}/3
-                Contexto de la transacción:
-                {context_summary}
-                {"Debate previo: " + json.dumps(debate_transcript, indent=2, ensure_ascii=False) if debate_transcript else ""}
-                Argumenta brevemente por qué esta transacción podría ser legítima."""
-
-            customer_response = await self.llm.ainvoke([
-                SystemMessage(content=pro_customer_system),
-                HumanMessage(content=customer_prompt)
-            ])
+        # Si la evidencia apunta claramente a un lado, una ronda es suficiente
+        one_sided = self._is_one_sided(anomaly_signals, behavioral_analysis)
+        planned_rounds = 1 if one_sided else self.max_rounds
+        stop_reason = "one_sided_evidence" if one_sided and self.max_rounds > 1 else "max_rounds"
+        round_durations = []
+        
+        for round_num in range(1, planned_rounds + 1):
+            round_start = datetime.now()
+            history = self._render_history(debate_transcript)
+            
+            # Los argumentos de una ronda son independientes entre sí: se generan en paralelo
+            customer_arg, fraud_arg = await asyncio.gather(
+                self._argue(self.pro_customer_system, round_num, context_summary, history,
+                            "Argumenta brevemente por qué esta transacción podría ser legítima."),
+                self._argue(self.pro_fraud_system, round_num, context_summary, history,
+                            "Argumenta brevemente el riesgo de fraude, rebatiendo al defensor si hay debate previo.")
+            )
             
-            customer_arg = customer_response.content
+            timestamp = datetime.utcnow().isoformat() + "Z"
             debate_transcript.append({
                 "round": round_num,
                 "agent": "pro_customer",
                 "argument": customer_arg,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+                "timestamp": timestamp
             })
-            
-            # Pro-fraud argument
-            fraud_prompt = f"""Round {round_num}/3
-                Contexto de la transacción:
-                {context_summary}
-                Argumento del defensor del cliente:
-                {customer_arg}
-                {"Debate previo: " + json.dumps(debate_transcript[:-1], indent=2, ensure_ascii=False) if len(debate_transcript) > 1 else ""}
-                Rebate brevemente argumentando el riesgo de fraude."""
-
-            fraud_response = await self.llm.ainvoke([
-                SystemMessage(content=pro_fraud_system),
-                HumanMessage(content=fraud_prompt)
-            ])
-            
-            fraud_arg = fraud_response.content
             debate_transcript.append({
                 "round": round_num,
                 "agent": "pro_fraud",
                 "argument": fraud_arg,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
+                "timestamp": timestamp
             })
+            round_durations.append((datetime.now() - round_start).total_seconds())
+            
+            if round_num < planned_rounds and self._has_converged(debate_transcript, round_num):
+                stop_reason = "converged"
+                break
         
         # Register audit trail
-        num_rounds = len([t for t in debate_transcript if t["agent"] == "pro_fraud"])
-        agent_audit.append({
+        num_rounds = len(round_durations)
+        skipped_rounds = self.max_rounds - num_rounds
+        avg_round_seconds = sum(round_durations) / num_rounds if num_rounds else 0.0
+        agent_decision = {
             "agent_name": "debate_agents",
             "rounds": num_rounds,
+            "max_rounds": self.max_rounds,
+            "stop_reason": stop_reason,
+            "estimated_time_saved_seconds": round(skipped_rounds * avg_round_seconds, 3),
+            "context_tokens": context_usage["tokens"],
+            "context_truncated": context_usage["truncated"],
             "execution_time": datetime.utcnow().isoformat() + "Z",
             "duration_seconds": (datetime.now() - start_time).total_seconds()
-        })
+        }
         
         # Update confidence based on debate        
         return {
             "debate": debate_transcript,
-            "agent_audit": agent_audit,
+            "agent_audit": [agent_decision],
         }
     
-    def _build_context_summary(self, anomaly_signals: Dict, signals: list, transaction_request, behavioral_analysis: Dict) -> str:
-        summary_parts = []
-        
-        # Transaction basics
-        if transaction_request:
-            amount = transaction_request.amount if hasattr(transaction_request, 'amount') else transaction_request.get('amount', 0)
-            currency = transaction_request.currency if hasattr(transaction_request, 'currency') else transaction_request.get('currency', 'PEN')
-            country = transaction_request.country if hasattr(transaction_request, 'country') else transaction_request.get('country', 'N/A')
-            summary_parts.append(f"Transacción: {amount} {currency} en {country}")
-        
-        # Anomaly signals
-        if anomaly_signals:
-            summary_parts.append("\nSeñales de anomalía:")
-            
-            amount_anom = anomaly_signals.get('amount_anomaly', {})
-            if amount_anom:
-                summary_parts.append(f"- Monto: {amount_anom.get('reason', 'N/A')} (score: {amount_anom.get('score', 0):.2f})")
-            
-            time_anom = anomaly_signals.get('time_anomaly', {})
-            if time_anom:
-                summary_parts.append(f"- Horario: {time_anom.get('reason', 'N/A')} (score: {time_anom.get('score', 0):.2f})")
-            
-            device_anom = anomaly_signals.get('device_anomaly', {})
-            if device_anom:
-                summary_parts.append(f"- Dispositivo: {device_anom.get('reason', 'N/A')} (score: {device_anom.get('score', 0):.2f})")
-            
-            country_anom = anomaly_signals.get('country_anomaly', {})
-            if country_anom:
-                summary_parts.append(f"- País: {country_anom.get('reason', 'N/A')} (score: {country_anom.get('score', 0):.2f})")
-        
-        # Behavioral analysis
-        if behavioral_analysis:
-            deviation = behavioral_analysis.get('deviation_score', 0)
-            summary_parts.append(f"\nDesviación de comportamiento: {deviation:.2f}")
-            pattern = behavioral_analysis.get('pattern_deviation', '')
-            if pattern:
-                summary_parts.append(f"Análisis: {pattern}")
+    async def _argue(self, system_prompt: str, round_num: int, context_summary: str, history: str, instruction: str) -> str:
+        prompt = f"""Round {round_num}/{self.max_rounds}
+Contexto de la transacción:
+{context_summary}
+{"Debate previo:" + chr(10) + history if history else ""}
+{instruction}"""
+
+        response = await self.llm.ainvoke([
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=prompt)
+        ])
+        return response.content
+    
+    def _render_history(self, debate_transcript: List[dict]) -> str:
+        # Historial compacto y acotado: solo los últimos argumentos, truncados
+        lines = []
+        for entry in debate_transcript[-self.history_window:]:
+            agent = "Cliente" if entry["agent"] == "pro_customer" else "Fraude"
+            argument = " ".join(entry["argument"].split())
+            if len(argument) > self.max_argument_chars:
+                argument = argument[:self.max_argument_chars].rstrip() + "…"
+            lines.append(f"[R{entry['round']} {agent}] {argument}")
+        return "\n".join(lines)
+    
+    def _is_one_sided(self, anomaly_signals: Dict, behavioral_analysis: Dict) -> bool:
+        if not anomaly_signals:
+            return False
+        anomaly_count = sum(1 for data in anomaly_signals.values() if isinstance(data, dict) and data.get("is_anomaly"))
+        deviation = behavioral_analysis.get("deviation_score", 0.5) if behavioral_analysis else 0.5
         
-        return "\n".join(summary_parts)
\ No newline at end of file
+        # Reglas y análisis comportamental coinciden en la misma dirección
+        if anomaly_count <= 1 and deviation <= 0.3:
+            return True
+        if anomaly_count >= 3 and deviation >= 0.7:
+            return True
+        return False
+    
+    def _has_converged(self, debate_transcript: List[dict], round_num: int) -> bool:
+        def argument(round_: int, agent: str):
+            return next((t["argument"] for t in debate_transcript if t["round"] == round_ and t["agent"] == agent), None)
+
+        if round_num == 1:
+            # Tras la primera ronda: ambos lados ya coinciden en lo que argumentan
+            customer, fraud = argument(1, "pro_customer"), argument(1, "pro_fraud")
+            if customer is None or fraud is None:
+                return False
+            return self._similarity(customer, fraud) >= self.convergence_threshold
+        # Rondas siguientes: cada lado repite lo que dijo en la ronda anterior
+        for agent in ("pro_customer", "pro_fraud"):
+            current, previous = argument(round_num, agent), argument(round_num - 1, agent)
+            if current is None or previous is None:
+                return False
+            if self._similarity(current, previous) < self.convergence_threshold:
+                return False
+        return True
+    
+    @staticmethod
+    def _similarity(text_a: str, text_b: str) -> float:
+        tokens_a = set(re.findall(r"\w+", text_a.lower()))
+        tokens_b = set(re.findall(r"\w+", text_b.lower()))
+        if not tokens_a or not tokens_b:
+            return 0.0
+        return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
@@ -1,76 +1,16 @@
-from domain.schema.schemas import AgentState
+from domain.schema.schemas import AgentState, ArbiterDecisionResult
 from typing import Dict, Any
 from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
 from langchain_core.tools import tool
+from infraestructure.context_builder import ContextBuilder
+from infraestructure.llm_cache import cache_status
+from infraestructure.metrics import LLM_RETRIES, LLM_TOKENS, STRUCTURED_OUTPUT_FAILURES
 from datetime import datetime
-import json
+import os
+import time
 
 
-class DecisionArbiter:
-    def __init__(self, llm):
-        self.llm = llm
-    
-    def _create_context_tool(self, state: AgentState):        
-        @tool
-        def obtener_contexto_total() -> str:
-            """Obtiene y formatea el contexto para la decisión final."""
-            tx_obj = state.get('transaction_request')
-            bh_obj = state.get('usual_behavior')
-            
-            # Convertir objetos Pydantic a dict
-            tx = tx_obj.model_dump() if tx_obj else {}
-            bh = bh_obj.model_dump() if bh_obj else {}
-            ba = state.get('behavioral_analysis', {})
-            anom = state.get('anomaly_signals', {})
-            sig = state.get('signals', [])
-            rag = state.get('rag_evidence', [])
-            web = state.get('search_evidence', [])
-            deb = state.get('debate', [])
-            
-            ctx = f"""TRANSACCIÓN
-                Monto: {tx.get('amount', 0)} {tx.get('currency', 'N/A')} | País: {tx.get('country', 'N/A')} | Dispositivo: {tx.get('device_id', 'N/A')}
-
-                COMPORTAMIENTO HABITUAL
-                Monto promedio: {bh.get('usual_amount_avg', 0)} | Horarios: {bh.get('usual_hours', 'N/A')} | Países: {bh.get('usual_countries', 'N/A')}
-
-                DESVIACIÓN
-                Score: {ba.get('deviation_score', 0)} | {ba.get('pattern_deviation', 'N/A')}
-
-                ANOMALÍAS
-                Señales: {', '.join(sig) if sig else 'Ninguna'}
-                """
-            
-            for anom_type, data in anom.items():
-                if isinstance(data, dict):
-                    ctx += f"  {anom_type}: {data.get('is_anomaly', False)} (score: {data.get('score', 0):.2f})\n"
-            
-            if rag:
-                ctx += "\nPOLÍTICAS INTERNAS\n"
-                for ev in rag:
-                    ctx += f"  {ev.get('policy_id', 'N/A')}: {ev.get('rule', 'N/A')} (sim: {ev.get('similarity_score', 0):.2f})\n"
-            
-            if web:
-                ctx += "\nTHREAT INTELLIGENCE\n"
-                for ev in web:
-                    ctx += f"  {ev.get('fraud_type', 'N/A')}: {ev.get('summary', 'N/A')}\n"
-            
-            if deb:
-                ctx += "\nDEBATE\n"
-                for d in deb:
-                    agent = "Pro-Customer" if d.get('agent') == 'pro_customer' else "Pro-Fraud"
-                    ctx += f"  {agent}: {d.get('argument', 'N/A')}\n"
-            
-            print("Contexto:", ctx)
-            return ctx
-        
-        return obtener_contexto_total
-    
-    async def decide(self, state: AgentState) -> Dict[str, Any]:
-        start_time = datetime.now()
-        context_tool = self._create_context_tool(state)
-        llm_with_tools = self.llm.bind_tools([context_tool])
-        
-        system_prompt = """Eres árbitro de detección de fraude. Tu decisión DEBE basarse primariamente en las REGLAS INTERNAS.
+ARBITER_SYSTEM_PROMPT = """Eres árbitro de detección de fraude. Tu decisión DEBE basarse primariamente en las REGLAS INTERNAS.
 
         JERARQUÍA DE RELEVANCIA:
         1. REGLAS INTERNAS (POLÍTICAS) - Máxima prioridad pero cumpliendo sus criterios
@@ -88,21 +28,56 @@ class DecisionArbiter:
 
         IMPORTANTE: Si una política interna aplica claramente, eso determina tu decisión.
 
-        Responde SOLO con JSON:
-        {"chain_of_thought": "razonamiento", "decision": "APPROVE|CHALLENGE|BLOCK|ESCALATE_TO_HUMAN", "confidence": 0.0-1.0}"""
-
-        user_prompt = f"""Analiza y decide:
+        Responde con chain_of_thought (razonamiento), decision y confidence (0.0-1.0)."""
 
-        Usa el tool 'obtener_contexto_total' para obtener el contexto.
 
-        Responde con JSON válido (sin markdown):
-        {{"chain_of_thought": "razonamiento", "decision": "APPROVE|CHALLENGE|BLOCK|ESCALATE_TO_HUMAN", "confidence": 0.0-1.0}}"""
+class DecisionArbiter:
+    def __init__(self, llm, mode: str | None = None, context_builder: ContextBuilder | None = None):
+        self.llm = llm
+        self.context_builder = context_builder or ContextBuilder()
+        # single_shot: contexto en el prompt, una llamada | tool: el modelo pide el contexto vía tool (dos llamadas)
+        self.mode = (mode or os.getenv("ARBITER_MODE", "single_shot")).lower()
+        self.structured_llm = llm.with_structured_output(ArbiterDecisionResult, include_raw=True)
+        # Intentos ante una salida que no valida contra el schema (1 = sin reintentos)
+        self.max_attempts = int(os.getenv("STRUCTURED_OUTPUT_MAX_ATTEMPTS", "2"))
+    
+    def _create_context_tool(self, context: str):        
+        @tool
+        def obtener_contexto_total() -> str:
+            """Obtiene y formatea el contexto para la decisión final."""
+            print("Contexto:", context)
+            return context
+        
+        return obtener_contexto_total
+    
+    @staticmethod
+    async def _timed_call(runnable, messages: list, usage: dict):
+        start = time.perf_counter()
+        result = await runnable.ainvoke(messages)
+        usage["llm_latency_seconds"] += time.perf_counter() - start
+        usage["llm_calls"] += 1
+        # with_structured_output(include_raw=True) devuelve el AIMessage en "raw" (None si vino del cache)
+        message = result.get("raw") if isinstance(result, dict) else result
+        tokens = getattr(message, "usage_metadata", None) or {}
+        usage["input_tokens"] += tokens.get("input_tokens", 0)
+        usage["output_tokens"] += tokens.get("output_tokens", 0)
+        LLM_TOKENS.inc(tokens.get("input_tokens", 0), agent="arbiter", type="input")
+        LLM_TOKENS.inc(tokens.get("output_tokens", 0), agent="arbiter", type="output")
+        return result
+    
+    async def _tool_round_trip(self, context: str, usage: dict, llm_cache: list) -> list:
+        """Modo tool: primera llamada para que el modelo pida obtener_contexto_total."""
+        context_tool = self._create_context_tool(context)
+        llm_with_tools = self.llm.bind_tools([context_tool])
+        user_prompt = """Analiza y decide:
 
-        # Primera invocación - el LLM debería llamar al tool
-        response1 = await llm_with_tools.ainvoke([
-            SystemMessage(content=system_prompt),
+        Usa el tool 'obtener_contexto_total' para obtener el contexto."""
+        
+        response1 = await self._timed_call(llm_with_tools, [
+            SystemMessage(content=ARBITER_SYSTEM_PROMPT),
             HumanMessage(content=user_prompt)
-        ])
+        ], usage)
+        llm_cache.append(cache_status(response1))
         
         # Verificar si hay tool calls
         if response1.tool_calls:
@@ -115,46 +90,78 @@ class DecisionArbiter:
                 tool_call_id=tool_call['id']
             )
             
-            response2 = await self.llm.ainvoke([
-                SystemMessage(content=system_prompt),
+            return [
+                SystemMessage(content=ARBITER_SYSTEM_PROMPT),
                 HumanMessage(content=user_prompt),
                 response1,
                 tool_message,
-                HumanMessage(content="Ahora responde con el JSON de decisión.")
-            ])
-            final_response = response2.content
+                HumanMessage(content="Ahora responde con la decisión.")
+            ]
+        
+        # Sin tool call el contexto se entrega en el mensaje
+        return [
+            SystemMessage(content=ARBITER_SYSTEM_PROMPT),
+            HumanMessage(content=user_prompt),
+            HumanMessage(content=f"{context_tool.invoke({})}\nAhora responde con la decisión.")
+        ]
+    
+    async def decide(self, state: AgentState) -> Dict[str, Any]:
+        start_time = datetime.now()
+        usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "llm_latency_seconds": 0.0}
+        llm_cache = []
+        # Vista compacta del contexto compartido, la misma en ambos modos
+        context, context_usage = self.context_builder.view(state, "arbiter")
+        
+        if self.mode == "single_shot":
+            # El contexto ya se conoce: se envía en el prompt y se decide en una sola llamada
+            final_messages = [
+                SystemMessage(content=ARBITER_SYSTEM_PROMPT),
+                HumanMessage(content=f"Analiza y decide con el siguiente contexto:\n\n{context}")
+            ]
         else:
-            final_response = response1.content
+            final_messages = await self._tool_round_trip(context, usage, llm_cache)
         
-        try:
-            if "```json" in final_response:
-                final_response = final_response.split("```json")[1].split("```")[0].strip()
-            elif "```" in final_response:
-                final_response = final_response.split("```")[1].split("```")[0].strip()
+        # La decisión se valida contra ArbiterDecisionResult: sin parseo manual de JSON
+        decision = None
+        failures = 0
+        for attempt in range(self.max_attempts):
+            result = await self._timed_call(self.structured_llm, final_messages, usage)
+            llm_cache.append(cache_status(result))
+            parsed = result.get("parsed")
+            if parsed is not None:
+                decision = {
+                    "value": parsed.decision,
+                    "chain_of_thought": parsed.chain_of_thought,
+                    "confidence": parsed.confidence
+                }
+                break
             
-            decision_data = json.loads(final_response)
-            decision = {
-                "value": decision_data.get("decision", "ESCALATE_TO_HUMAN"),
-                "chain_of_thought": decision_data.get("chain_of_thought", ""),
-                "confidence": decision_data.get("confidence", 0.5)
-            }
-        except json.JSONDecodeError as e:
-            decision = {
-                "value": "ESCALATE_TO_HUMAN",
-                "chain_of_thought": f"Error: {str(e)}",
-                "confidence": 0.0
-            }
+            failures += 1
+            STRUCTURED_OUTPUT_FAILURES.inc(agent="arbiter")
+            if attempt < self.max_attempts - 1:
+                LLM_RETRIES.inc(agent="arbiter")
+            else:
+                decision = {
+                    "value": "ESCALATE_TO_HUMAN",
+                    "chain_of_thought": f"Error: {result.get('parsing_error')}",
+                    "confidence": 0.0
+                }
         
-        agent_audit = state.get('agent_audit', [])
-        agent_audit.append({
+        agent_decision = {
             "agent_name": "decision_arbiter",
             "decision": decision['value'],
             "execution_time": datetime.utcnow().isoformat() + "Z",
-            "duration_seconds": (datetime.now() - start_time).total_seconds()
-        })
+            "duration_seconds": (datetime.now() - start_time).total_seconds(),
+            "mode": self.mode,
+            "llm_cache": llm_cache,
+            "structured_output_failures": failures,
+            "context_tokens": context_usage["tokens"],
+            "context_truncated": context_usage["truncated"],
+            **usage
+        }
         
         return {
             "decision": decision,
-            "agent_audit": agent_audit,
+            "agent_audit": [agent_decision],
             "need_human_review": decision['value'] == "ESCALATE_TO_HUMAN"
         }
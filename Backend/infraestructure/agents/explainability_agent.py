@@ -1,91 +1,139 @@
 from domain.schema.schemas import AgentState
 from typing import Dict, Any
+from infraestructure.context_builder import ContextBuilder
+from infraestructure.llm_cache import cache_status
 from langchain_core.messages import SystemMessage, HumanMessage
 from datetime import datetime
-import json
+import asyncio
+import os
+
+# Textos para el cliente en casos claros, por decisión
+CUSTOMER_TEMPLATES = {
+    "APPROVE": (
+        "Tu transacción de {amount} {currency} fue aprobada. "
+        "Coincide con tu forma habitual de operar, por lo que no necesitas realizar ninguna acción adicional."
+    ),
+    "BLOCK": (
+        "Por tu seguridad, bloqueamos tu transacción de {amount} {currency}. "
+        "Detectamos varias diferencias importantes respecto a tu forma habitual de operar: {reasons}. "
+        "Si reconoces esta operación, comunícate con nosotros para validarla."
+    ),
+}
+
 
 class ExplanabilityAgent:
-    def __init__(self, llm):
+    def __init__(self, llm, mode: str | None = None, context_builder: ContextBuilder | None = None):
         self.llm = llm
+        self.context_builder = context_builder or ContextBuilder()
+        # auto: plantilla en casos claros y LLM en ambiguos | llm: siempre LLM | template: siempre plantilla
+        self.mode = (mode or os.getenv("EXPLANATION_MODE", "auto")).lower()
+        self.template_min_confidence = float(os.getenv("EXPLANATION_TEMPLATE_MIN_CONFIDENCE", "0.85"))
 
     async def explain(self, state: AgentState) -> Dict[str, Any]:
         start_time = datetime.now()
-        agent_audit = state.get('agent_audit', [])
-        
-        # Preparar contexto completo para el LLM
-        context = self._prepare_context(state)
-        
-        # Generar explicación para el cliente
-        explanation_customer = await self._generate_customer_explanation(context, state)
         
-        # Generar explicación para auditoría
-        explanation_audit = await self._generate_audit_explanation(context, state)
+        llm_cache = None
+        context_usage = {"tokens": 0, "truncated": False}
+        if self.mode == "template" or (self.mode == "auto" and self._is_clear_cut(state)):
+            mode_used = "template"
+            explanation_customer = self._template_customer_explanation(state)
+            explanation_audit = self._template_audit_explanation(state)
+        else:
+            mode_used = "llm"
+            # Vista compacta del contexto compartido, con la decisión y el razonamiento del árbitro
+            context, context_usage = self.context_builder.view(state, "explainability")
+            
+            # Ambas explicaciones son independientes: se generan en paralelo
+            (explanation_customer, customer_cache), (explanation_audit, audit_cache) = await asyncio.gather(
+                self._generate_customer_explanation(context, state),
+                self._generate_audit_explanation(context, state)
+            )
+            llm_cache = {"customer": customer_cache, "audit": audit_cache}
         
         # Register audit trail
-        agent_audit.append({
+        agent_decision = {
             "agent_name": "explainability_agent",
             "explanations_generated": 2,
+            "mode": mode_used,
+            "llm_cache": llm_cache,
+            "context_tokens": context_usage["tokens"],
+            "context_truncated": context_usage["truncated"],
             "execution_time": datetime.utcnow().isoformat() + "Z",
             "duration_seconds": (datetime.now() - start_time).total_seconds()
-        })
+        }
         
         return {
             "explanations": explanation_customer,
             "explanation_audit": explanation_audit,
-            "agent_audit": agent_audit
+            "agent_audit": [agent_decision],
+            # Último consumidor del contexto renderizado: no se devuelve ni se persiste
+            "rendered_context": {}
         }
     
-    def _prepare_context(self, state: AgentState) -> str:
-                
-        # Obtener datos del estado
-        transaction_obj = state.get('transaction_request')
-        # Convertir TransactionRequest a diccionario si es necesario
-        if transaction_obj and hasattr(transaction_obj, 'dict'):
-            transaction = transaction_obj.dict()
-        else:
-            transaction = transaction_obj or {}
+    def _is_clear_cut(self, state: AgentState) -> bool:
+        decision = state.get('decision', {})
+        decision_value = decision.get('value')
+        confidence = decision.get('confidence') or 0
+        if confidence < self.template_min_confidence:
+            return False
         
+        anomaly_count = len(self._detected_anomalies(state))
+        if decision_value == "APPROVE":
+            return anomaly_count == 0
+        if decision_value == "BLOCK":
+            return anomaly_count >= 3
+        return False
+    
+    def _detected_anomalies(self, state: AgentState) -> list:
+        anomaly_signals = state.get('anomaly_signals', {})
+        return [
+            (anomaly_type, data) for anomaly_type, data in anomaly_signals.items()
+            if isinstance(data, dict) and data.get('is_anomaly')
+        ]
+    
+    def _template_customer_explanation(self, state: AgentState) -> str:
+        transaction = state.get('transaction_request')
+        decision_value = state.get('decision', {}).get('value', 'UNKNOWN')
+        reasons = [data.get('reason', anomaly_type) for anomaly_type, data in self._detected_anomalies(state)]
+        
+        template = CUSTOMER_TEMPLATES.get(decision_value, (
+            "Tu transacción de {amount} {currency} quedó con estado {decision}. "
+            "Te contactaremos si necesitamos validar información adicional."
+        ))
+        return template.format(
+            amount=getattr(transaction, 'amount', 'N/A'),
+            currency=getattr(transaction, 'currency', ''),
+            reasons="; ".join(reasons).lower() if reasons else "sin señales",
+            decision=decision_value
+        )
+    
+    def _template_audit_explanation(self, state: AgentState) -> str:
         decision = state.get('decision', {})
-        signals = state.get('signals', [])
-        anomaly_score = state.get('anomaly_score', 0)
         anomaly_signals = state.get('anomaly_signals', {})
-        behavioral_analysis = state.get('behavioral_analysis', {})
         rag_evidence = state.get('rag_evidence', [])
         search_evidence = state.get('search_evidence', [])
+        agents = [entry.get('agent_name') for entry in state.get('agent_audit', []) if entry.get('agent_name')]
         
-        context = f"""
-        TRANSACCIÓN:
-        - ID: {transaction.get('transaction_id')}
-        - Cliente: {transaction.get('customer_id')}
-        - Monto: {transaction.get('amount')} {transaction.get('currency')}
-        - País: {transaction.get('country')}
-        - Canal: {transaction.get('channel')}
-        - Dispositivo: {transaction.get('device_id')}
-        - Timestamp: {transaction.get('timestamp')}
-
-        DECISIÓN TOMADA: {decision.get('value')}
-        CONFIANZA: {decision.get('confidence', 0):.2f}
-
-        SEÑALES DETECTADAS: {', '.join(signals) if signals else 'Ninguna'}
-
-        ANÁLISIS DE ANOMALÍAS:
-        {json.dumps(anomaly_signals, indent=2)}
-
-        ANÁLISIS COMPORTAMENTAL:
-        {json.dumps(behavioral_analysis, indent=2)}
-
-        POLÍTICAS INTERNAS CONSULTADAS (RAG):
-        {json.dumps(rag_evidence, indent=2)}
-
-        INTELIGENCIA EXTERNA (WEB SEARCH):
-        {json.dumps(search_evidence, indent=2)}
-
-        RAZONAMIENTO DEL ÁRBITRO:
-        {decision.get('chain_of_thought', '')}
-        """
-        return context
+        lines = [
+            f"Decisión: {decision.get('value')} (confianza {decision.get('confidence', 0):.2f}), explicación generada por plantilla (caso claro).",
+            f"Ruta de agentes: {' → '.join(agents + ['explainability_agent'])}",
+            f"Anomaly score: {state.get('anomaly_score', 0)}",
+            "Señales:",
+        ]
+        for anomaly_type, data in anomaly_signals.items():
+            if isinstance(data, dict):
+                lines.append(f"- {anomaly_type}: {data.get('is_anomaly', False)} (score {data.get('score', 0)}) - {data.get('reason', 'N/A')}")
+        
+        policies = [ev for ev in rag_evidence if not ev.get('error')]
+        lines.append("Políticas consultadas:" if policies else "Políticas consultadas: ninguna")
+        for ev in policies:
+            lines.append(f"- {ev.get('policy_id')} v{ev.get('version')}: {ev.get('rule')} (similitud {ev.get('similarity_score')})")
+        
+        lines.append(f"Evidencia externa: {len(search_evidence)} fuentes")
+        lines.append(f"Razonamiento del árbitro: {decision.get('chain_of_thought', '')}")
+        return "\n".join(lines)
     
-    async def _generate_customer_explanation(self, context: str, state: AgentState) -> str:        
+    async def _generate_customer_explanation(self, context: str, state: AgentState) -> tuple[str, str | None]:        
         decision_value = state.get('decision', {}).get('value', 'UNKNOWN')
         
         system_prompt = SystemMessage(content="""
@@ -110,9 +158,9 @@ class ExplanabilityAgent:
         """)
         
         response = await self.llm.ainvoke([system_prompt, human_prompt])
-        return response.content.strip()
+        return response.content.strip(), cache_status(response)
     
-    async def _generate_audit_explanation(self, context: str, state: AgentState) -> str:
+    async def _generate_audit_explanation(self, context: str, state: AgentState) -> tuple[str, str | None]:
         """Genera una explicación técnica detallada para auditoría"""
         
         decision_value = state.get('decision', {}).get('value', 'UNKNOWN')
@@ -145,4 +193,4 @@ class ExplanabilityAgent:
         """)
         
         response = await self.llm.ainvoke([system_prompt, human_prompt])
-        return response.content.strip()
\ No newline at end of file
+        return response.content.strip(), cache_status(response)
\ No newline at end of file
@@ -3,19 +3,68 @@ from perplexity import Perplexity
 from typing import Dict, Any
 from datetime import datetime
 from langchain_core.tools import tool
+from infraestructure.threat_cache import ThreatEvidenceCache
+from infraestructure.metrics import track_external
+import asyncio
 import os
 
 class ExternalThreatAgent():
-    def __init__(self, llm):
+    def __init__(self, llm, redis_adapter=None):
         self.perplexityapikey = os.getenv("PERPLEXITY_API_KEY")
         self.llm = llm
+        self.threat_cache = ThreatEvidenceCache(redis_adapter)
 
     async def get_external_threat(self, state: Dict[str, Any]) -> Dict[str, Any]:
         transaction = state.get('transaction_request')
-        search_evidence = []
         
         print(f"[SEARCH] Iniciando búsqueda de amenazas para transacción: {transaction.transaction_id}")
         
+        # Construir query basada en anomaly_signals
+        anomalies = state.get('anomaly_signals', {})
+        anomaly_flags = []
+        anomaly_types = []
+        
+        if anomalies.get('device_anomaly', {}).get('is_anomaly'):
+            anomaly_flags.append("device")
+            anomaly_types.append("dispositivos nuevos/desconocidos")
+        if anomalies.get('time_anomaly', {}).get('is_anomaly'):
+            anomaly_flags.append("time")
+            anomaly_types.append("transacciones en horas inusuales")
+        if anomalies.get('amount_anomaly', {}).get('is_anomaly'):
+            anomaly_flags.append("amount")
+            anomaly_types.append(f"montos anómalos en {transaction.currency}")
+            
+        if anomaly_types:
+            anomaly_str = ", ".join(anomaly_types)
+            query = f"Fraudes recientes en {transaction.country} con patrones de: {anomaly_str}"
+        else:
+            query = f"Fraudes financieros recientes en {transaction.country}"
+        
+        # La query solo depende de (país, moneda, anomalías): se cachea por esa firma
+        cache_key = self.threat_cache.signature(transaction.country, transaction.currency, anomaly_flags)
+        search_evidence, cache_status = await self.threat_cache.get_or_fetch(
+            cache_key,
+            lambda: self._search_threats(query)
+        )
+        print(f"[SEARCH] Threat cache {cache_status} for {cache_key}")
+        
+        # Agent decision tracking
+        agent_decision = {
+            "agent_name": "external_threat_agent",
+            "status": "completed",
+            "execution_time": datetime.utcnow().isoformat() + "Z",
+            "query_used": query,
+            "cache": cache_status
+        }
+        
+        return {
+            "search_evidence": search_evidence,
+            "agent_audit": [agent_decision]
+        }
+
+    async def _search_threats(self, query: str) -> list:
+        search_evidence = []
+        
         # Crear tool para búsqueda
         @tool
         def search_external_threats(query: str) -> str:
@@ -30,34 +79,35 @@ class ExternalThreatAgent():
                 - Descripción breve del fraude (100-150 caracteres)
                 - Tipo de fraude"""
 
-                completion = client.chat.completions.create(
-                    messages=[{"role": "user", "content": prompt}],
-                    model="sonar-pro",
-                    web_search_options={"search_recency_filter": "week"},
-                    response_format={
-                        "type": "json_schema",
-                        "json_schema": {
-                            "schema": {
-                                "type": "object",
-                                "properties": {
-                                    "threats": {
-                                        "type": "array",
-                                        "items": {
-                                            "type": "object",
-                                            "properties": {
-                                                "url": {"type": "string"},
-                                                "summary": {"type": "string"},
-                                                "fraud_type": {"type": "string"}
-                                            },
-                                            "required": ["url", "summary"]
+                with track_external("perplexity", "chat"):
+                    completion = client.chat.completions.create(
+                        messages=[{"role": "user", "content": prompt}],
+                        model="sonar-pro",
+                        web_search_options={"search_recency_filter": "week"},
+                        response_format={
+                            "type": "json_schema",
+                            "json_schema": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "threats": {
+                                            "type": "array",
+                                            "items": {
+                                                "type": "object",
+                                                "properties": {
+                                                    "url": {"type": "string"},
+                                                    "summary": {"type": "string"},
+                                                    "fraud_type": {"type": "string"}
+                                                },
+                                                "required": ["url", "summary"]
+                                            }
                                         }
-                                    }
-                                },
-                                "required": ["threats"]
+                                    },
+                                    "required": ["threats"]
+                                }
                             }
                         }
-                    }
-                )
+                    )
                 
                 import json
                 content = completion.choices[0].message.content
@@ -95,23 +145,6 @@ class ExternalThreatAgent():
         # ReAct agent simple: bind tool al LLM
         llm_with_tools = self.llm.bind_tools([search_external_threats])
         
-        # Construir query basada en anomaly_signals
-        anomalies = state.get('anomaly_signals', {})
-        anomaly_types = []
-        
-        if anomalies.get('device_anomaly', {}).get('is_anomaly'):
-            anomaly_types.append("dispositivos nuevos/desconocidos")
-        if anomalies.get('time_anomaly', {}).get('is_anomaly'):
-            anomaly_types.append("transacciones en horas inusuales")
-        if anomalies.get('amount_anomaly', {}).get('is_anomaly'):
-            anomaly_types.append(f"montos anómalos en {transaction.currency}")
-            
-        if anomaly_types:
-            anomaly_str = ", ".join(anomaly_types)
-            query = f"Fraudes recientes en {transaction.country} con patrones de: {anomaly_str}"
-        else:
-            query = f"Fraudes financieros recientes en {transaction.country}"
-            
         messages = [{"role": "user", "content": query}]
         
         print(f"[SEARCH] Invocando ReAct agent")
@@ -123,22 +156,8 @@ class ExternalThreatAgent():
         if hasattr(response, 'tool_calls') and response.tool_calls:
             for tool_call in response.tool_calls:
                 if tool_call['name'] == 'search_external_threats':
-                    # Ejecutar el tool
-                    tool_result = search_external_threats.invoke(tool_call['args'])
+                    # Ejecutar el tool (Perplexity es síncrono, se corre en un thread)
+                    tool_result = await asyncio.to_thread(search_external_threats.invoke, tool_call['args'])
                     print(f"[SEARCH] Tool ejecutado: {tool_result[:100]}...")    
         
-        # Agent decision tracking
-        agent_decision = {
-            "agent_name": "external_threat_agent",
-            "status": "completed",
-            "execution_time": datetime.utcnow().isoformat() + "Z",
-            "query_used": query
-        }
-        
-        agent_audit = state.get('agent_audit', [])
-        agent_audit.append(agent_decision)
-        
-        return {
-            "search_evidence": search_evidence,
-            "agent_audit": agent_audit
-        }    
+        return search_evidence    
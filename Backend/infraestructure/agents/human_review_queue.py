@@ -2,6 +2,13 @@ from infraestructure.redis_adapter import RedisAdapter
 from typing import Dict, Any
 import datetime
 
+# Campos que necesita la vista de detalle HITL
+HITL_SUMMARY_FIELDS = [
+    'transaction_id', 'transaction_request', 'usual_behavior', 'anomaly_score', 'anomaly_signals', 'signals',
+    'behavioral_analysis', 'rag_evidence', 'search_evidence', 'debate', 'decision',
+    'explanations', 'explanation_audit',
+]
+
 class HumanReviewQueue():
 
     def __init__(self, redis_adapter: RedisAdapter = None):
@@ -12,11 +19,27 @@ class HumanReviewQueue():
         
         print(f"Transaction {transaction_id} being escalated to human review queue")
         
-        self.redis.add_to_hitl_queue(transaction_id, {'transaction_id': transaction_id})
+        # Se guarda el resumen de la decisión para servir /hitl/{id} sin ir a DynamoDB
+        await self.redis.add_to_hitl_queue(transaction_id, {
+            'transaction_id': transaction_id,
+            'escalated_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'summary': self.build_summary(state),
+        })
         
         print(f"Transaction {transaction_id} escalated to human review queue")
         
         return {
             'need_human_review': True,
             'hitl_status': 'escalated',
-        }
\ No newline at end of file
+        }
+    
+    @staticmethod
+    def build_summary(state: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {}
+        for field in HITL_SUMMARY_FIELDS:
+            value = state.get(field)
+            if hasattr(value, 'model_dump'):
+                value = value.model_dump(mode='json')
+            summary[field] = value
+        summary['need_human_review'] = True
+        return summary
\ No newline at end of file
@@ -2,49 +2,86 @@ from domain.schema.schemas import AgentState
 from datetime import datetime
 from typing import Dict, Any, List
 from qdrant_client import QdrantClient
-from openai import OpenAI
+from openai import AsyncOpenAI
+from infraestructure.embedding_cache import EmbeddingCache
+from infraestructure.policy_vector_index import InMemoryPolicyIndex
+from infraestructure.metrics import track_external
+import asyncio
+import math
 import os
 
 class InternalPolicyRAGAgent:
     
-    def __init__(self):
+    def __init__(self, redis_adapter=None):
         self.qdrant_url = os.getenv("QDRANT_URL", "http://qdrant:6333")
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.collection_name = "fraud_policies"
+        self.embedding_model = "text-embedding-3-large"
         self.qdrant_client = QdrantClient(url=self.qdrant_url)
-        self.openai_client = OpenAI(api_key=self.openai_api_key)
+        self.openai_client = AsyncOpenAI(api_key=self.openai_api_key)
+        # Redis como segundo nivel compartido entre workers (opcional)
+        use_redis = os.getenv("EMBEDDING_CACHE_REDIS", "true").lower() == "true"
+        self.embedding_cache = EmbeddingCache(redis_adapter if use_redis else None)
         self.top_k = 2  # Número de políticas a recuperar
+        # qdrant: consulta por request | memory: snapshot local de la colección
+        self.search_backend = os.getenv("POLICY_SEARCH_BACKEND", "qdrant").lower()
+        self.policy_index = InMemoryPolicyIndex(self.qdrant_client, self.collection_name) if self.search_backend == "memory" else None
 
-    def get_embedding(self, text: str) -> List[float]:
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-3-large",
-            input=text
-        )
-        return response.data[0].embedding
+    async def get_embedding(self, text: str) -> List[float]:
+        cached = await self.embedding_cache.get(self.embedding_model, text)
+        if cached is not None:
+            return cached
+        
+        with track_external("openai", "embeddings"):
+            response = await self.openai_client.embeddings.create(
+                model=self.embedding_model,
+                input=text
+            )
+        embedding = response.data[0].embedding
+        await self.embedding_cache.set(self.embedding_model, text, embedding)
+        return embedding
 
     def build_search_query(self, state: AgentState) -> str:
         signals = state.get('signals', [])
         transaction = state['transaction_request']
         
-        query = f"Fraud policy for {transaction.amount} {transaction.currency} in {transaction.country}. Anomalies: {', '.join(signals)}"
+        # El monto va como banda de orden de magnitud y las señales ordenadas: la query
+        # (y la clave del cache de embeddings) se repite entre transacciones parecidas
+        low, high = self._amount_band(transaction.amount)
+        query = (f"Fraud policy for amounts between {low} and {high} {transaction.currency} "
+                 f"in {transaction.country}. Anomalies: {', '.join(sorted(signals))}")
         return query
 
+    @staticmethod
+    def _amount_band(amount: float) -> tuple:
+        if not amount or amount < 1:
+            return 0, 1
+        exponent = math.floor(math.log10(amount))
+        return 10 ** exponent, 10 ** (exponent + 1)
+
     async def search_policies(self, query: str) -> List[dict]:
         try:
             print(f"[RAG] Starting policy search with query: {query}")
             
-            # Generar embedding de la query
-            query_embedding = self.get_embedding(query)
+            # Generar embedding de la query (cacheado por query normalizada)
+            query_embedding = await self.get_embedding(query)
             print(f"[RAG] Embedding generated, size: {len(query_embedding)}")
             
-            # Buscar en Qdrant
-            print(f"[RAG] Searching in Qdrant collection: {self.collection_name}")
-            results = self.qdrant_client.query_points(
-                collection_name=self.collection_name,
-                query=query_embedding,
-                limit=self.top_k
-            ).points
-            print(f"[RAG] Found {len(results)} results from Qdrant")
+            if self.policy_index is not None:
+                results = await self.policy_index.search(query_embedding, self.top_k)
+                print(f"[RAG] Found {len(results)} results from in-memory index (version {self.policy_index.version})")
+            else:
+                # Buscar en Qdrant
+                print(f"[RAG] Searching in Qdrant collection: {self.collection_name}")
+                with track_external("qdrant", "query_points"):
+                    response = await asyncio.to_thread(
+                        self.qdrant_client.query_points,
+                        collection_name=self.collection_name,
+                        query=query_embedding,
+                        limit=self.top_k
+                    )
+                results = response.points
+                print(f"[RAG] Found {len(results)} results from Qdrant")
             
             # Formatear resultados
             policies = []
@@ -85,10 +122,11 @@ class InternalPolicyRAGAgent:
             "status": "completed",
             "execution_time": datetime.utcnow().isoformat() + "Z",
             "search_query": search_query,
+            "search_backend": self.search_backend,
         }
         
         # Actualizar estado
         return {
             "rag_evidence": policies,
-            "agent_audit": state.get('agent_audit', []) + [agent_decision],
+            "agent_audit": [agent_decision],
         }
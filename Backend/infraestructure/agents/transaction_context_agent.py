@@ -1,12 +1,35 @@
 from domain.schema.schemas import AgentState
 from datetime import datetime
 from typing import Dict, Any, List
+import numpy as np
+import pandas as pd
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    """round(x, 2) de Python sobre un array.
+
+    np.round escala por 100 y en empates aparentes (p. ej. 0.285) puede
+    diferir de round(); esos pocos valores se resuelven con round().
+    """
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(float(v), 2) for v in values[near_tie]]
+    return rounded
+
 
 class TransactionContextAgent:
     def __init__(self):
         self.threshold = 2  # 2x del promedio para MONTO
+        # Parámetros de las reglas, compartidos por el camino por transacción y score_batch
+        self.amount_score_weights = (0.3, 0.95)  # (normal, anómala) sobre ratio / threshold
+        self.time_scores = (0.1, 0.85)  # (horario usual, fuera de rango)
+        self.device_scores = (0.05, 0.85)  # (conocido, nuevo)
+        self.country_scores = (0.05, 0.75)  # (usual, inusual)
+        self.neutral_anomaly_count = 2  # Punto de máxima incertidumbre del riesgo compuesto
 
-    async def analyze_transaction(self, state: AgentState) -> AgentState:
+    async def analyze_transaction(self, state: AgentState) -> Dict[str, Any]:
         transaction = state['transaction_request']
         usual_behavior = state.get('usual_behavior')
 
@@ -30,13 +53,13 @@ class TransactionContextAgent:
             "anomaly_score": anomaly_score,
         }
         
-        # Actualizar el estado
-        state['anomaly_signals'] = anomaly_signals
-        state["anomaly_score"] = anomaly_score
-        state['signals'] = signals
-        state['agent_audit'] = state.get('agent_audit', []) + [agent_decision]
-        
-        return state
+        # Actualizar el estado (agent_audit se acumula vía reducer)
+        return {
+            "anomaly_signals": anomaly_signals,
+            "anomaly_score": anomaly_score,
+            "signals": signals,
+            "agent_audit": [agent_decision],
+        }
     
     def check_amount_anomaly(self, transaction, usual_behavior: dict) -> Dict[str, Any]:
         if not usual_behavior:
@@ -47,7 +70,8 @@ class TransactionContextAgent:
         ratio = amount / usual_amount_avg if usual_amount_avg > 0 else 0
         
         is_anomaly = ratio > self.threshold
-        score = min(ratio / self.threshold * 0.95, 1.0) if is_anomaly else ratio / self.threshold * 0.3
+        normal_weight, anomaly_weight = self.amount_score_weights
+        score = min(ratio / self.threshold * anomaly_weight, 1.0) if is_anomaly else ratio / self.threshold * normal_weight
         
         return {
             "is_anomaly": is_anomaly,
@@ -67,7 +91,7 @@ class TransactionContextAgent:
             # Parsear como rango: "09-22" -> 9 a 22
             start_hour, end_hour = map(int, str(usual_hours).split("-"))
             in_usual_hours = start_hour <= hour <= end_hour
-            score = 0.1 if in_usual_hours else 0.85
+            score = self.time_scores[0] if in_usual_hours else self.time_scores[1]
             return {
                 "is_anomaly": not in_usual_hours,
                 "score": round(score, 2),
@@ -88,7 +112,7 @@ class TransactionContextAgent:
         
         return {
             "is_anomaly": not device_match,
-            "score": 0.05 if device_match else 0.85,
+            "score": self.device_scores[0] if device_match else self.device_scores[1],
             "device_match": device_match,
             "reason": f"Dispositivo {device_id} es conocido y confiable" if device_match else f"Dispositivo {device_id} es nuevo/desconocido"
         }
@@ -105,7 +129,7 @@ class TransactionContextAgent:
         
         return {
             "is_anomaly": not country_match,
-            "score": 0.05 if country_match else 0.75,
+            "score": self.country_scores[0] if country_match else self.country_scores[1],
             "country_match": country_match,
             "reason": f"País {country} está en los países usuales" if country_match else f"País {country} es inusual"
         }
@@ -118,7 +142,7 @@ class TransactionContextAgent:
         )
         
         # Fórmula: qué tan alejado estamos del punto neutro (2 anomalías)
-        confidence = abs(anomaly_count - 2) / 2.0
+        confidence = abs(anomaly_count - self.neutral_anomaly_count) / float(self.neutral_anomaly_count)
         
         return round(confidence, 2)
     
@@ -140,4 +164,113 @@ class TransactionContextAgent:
         if not signals:
             signals.append("transacción normal")
         
-        return signals
\ No newline at end of file
+        return signals
+
+    # --- Modo columnar (backtesting) ---
+
+    def score_batch(self, transactions: pd.DataFrame, profiles: pd.DataFrame) -> pd.DataFrame:
+        """Las cuatro señales y el riesgo compuesto para un lote, vectorizado.
+
+        transactions: columnas de TransactionRequest (customer_id, amount,
+        country, device_id, timestamp). profiles: columnas de UsualBehavior,
+        una fila por customer_id. Los perfiles se parsean una vez por cliente;
+        las transacciones sin perfil se puntúan como en el camino por
+        transacción (sin anomalías). Devuelve una fila por transacción, en el
+        mismo orden, con los mismos valores que analyze_transaction.
+        """
+        parsed = self._parse_profiles(profiles)
+        profile_idx = pd.Index(parsed["customer_id"]).get_indexer(transactions["customer_id"])
+        has_profile = profile_idx >= 0
+        take = np.where(has_profile, profile_idx, 0)
+
+        def profile_column(name: str, fill) -> np.ndarray:
+            values = parsed[name].to_numpy()[take] if len(parsed) else np.full(len(take), fill)
+            return np.where(has_profile, values, fill)
+
+        # Monto
+        amount = transactions["amount"].to_numpy(dtype=float)
+        avg = profile_column("usual_amount_avg", 0.0).astype(float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(avg > 0, amount / avg, 0.0)
+        normal_weight, anomaly_weight = self.amount_score_weights
+        amount_anomaly = has_profile & (ratio > self.threshold)
+        amount_score = np.where(
+            amount_anomaly,
+            np.minimum(ratio / self.threshold * anomaly_weight, 1.0),
+            ratio / self.threshold * normal_weight
+        )
+
+        # Horario: rango pre-parseado por perfil; un formato inválido no es anomalía
+        hours = self._hours(transactions["timestamp"])
+        start = profile_column("start_hour", -1).astype(int)
+        end = profile_column("end_hour", -1).astype(int)
+        hours_valid = has_profile & profile_column("hours_valid", False).astype(bool)
+        in_usual_hours = (start <= hours) & (hours <= end)
+        time_anomaly = hours_valid & ~in_usual_hours
+        time_score = np.where(hours_valid, np.where(in_usual_hours, *self.time_scores), 0.0)
+
+        # Dispositivo y país: pertenencia de (cliente, valor) a los pares conocidos
+        device_anomaly = has_profile & ~self._known_pairs(parsed, "usual_devices", transactions, "device_id")
+        device_score = np.where(has_profile, np.where(device_anomaly, self.device_scores[1], self.device_scores[0]), 0.0)
+        country_anomaly = has_profile & ~self._known_pairs(parsed, "usual_countries", transactions, "country")
+        country_score = np.where(has_profile, np.where(country_anomaly, self.country_scores[1], self.country_scores[0]), 0.0)
+
+        anomaly_count = (amount_anomaly.astype(int) + time_anomaly.astype(int)
+                         + device_anomaly.astype(int) + country_anomaly.astype(int))
+        anomaly_score = _round2(np.abs(anomaly_count - self.neutral_anomaly_count) / float(self.neutral_anomaly_count))
+
+        return pd.DataFrame({
+            "transaction_id": transactions["transaction_id"].to_numpy(),
+            "has_profile": has_profile,
+            "amount_anomaly": amount_anomaly,
+            "amount_score": np.where(has_profile, _round2(amount_score), 0.0),
+            "amount_ratio": np.where(has_profile, _round2(ratio), np.nan),
+            "time_anomaly": time_anomaly,
+            "time_score": _round2(time_score),
+            "device_anomaly": device_anomaly,
+            "device_score": device_score,
+            "country_anomaly": country_anomaly,
+            "country_score": country_score,
+            "anomaly_count": anomaly_count,
+            "anomaly_score": anomaly_score,
+        }, index=transactions.index)
+
+    @staticmethod
+    def _parse_profiles(profiles: pd.DataFrame) -> pd.DataFrame:
+        # Mismo parseo que check_time_anomaly, una vez por perfil y no por transacción
+        parsed = profiles.drop_duplicates("customer_id", keep="last").reset_index(drop=True)
+        starts, ends, valid = [], [], []
+        for usual_hours in parsed["usual_hours"]:
+            try:
+                start_hour, end_hour = map(int, str(usual_hours).split("-"))
+                starts.append(start_hour)
+                ends.append(end_hour)
+                valid.append(True)
+            except Exception:
+                starts.append(-1)
+                ends.append(-1)
+                valid.append(False)
+        return parsed.assign(start_hour=starts, end_hour=ends, hours_valid=valid)
+
+    @staticmethod
+    def _hours(timestamps: pd.Series) -> np.ndarray:
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            try:
+                converted = pd.to_datetime(timestamps, format="ISO8601")
+            except (TypeError, ValueError):
+                converted = None
+            # Offsets mixtos no caben en una columna datetime: la hora local se toma elemento a elemento
+            if converted is None or not pd.api.types.is_datetime64_any_dtype(converted):
+                return np.array([datetime.fromisoformat(str(ts)).hour for ts in timestamps], dtype=int)
+            timestamps = converted
+        return timestamps.dt.hour.to_numpy(dtype=int)
+
+    @staticmethod
+    def _known_pairs(parsed: pd.DataFrame, profile_column: str, transactions: pd.DataFrame, column: str) -> np.ndarray:
+        # "D-01, D-02" -> pares (cliente, "D-01"), (cliente, "D-02"), como el split/strip del camino por transacción
+        known = parsed[["customer_id", profile_column]].assign(
+            value=parsed[profile_column].astype(str).str.split(",")
+        ).explode("value")
+        known_index = pd.MultiIndex.from_arrays([known["customer_id"], known["value"].str.strip()])
+        keys = pd.MultiIndex.from_arrays([transactions["customer_id"], transactions[column]])
+        return np.asarray(keys.isin(known_index))
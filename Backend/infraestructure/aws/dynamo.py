@@ -1,10 +1,42 @@
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from infraestructure.aws.dynamo_codec import decode_item, encode_item
+from infraestructure.metrics import observe_external, track_external
 from datetime import datetime
+import base64
 import json
-from decimal import Decimal
-from typing import Optional, Dict, Any
+from typing import Callable, Iterable, Optional, Dict, Any
 import os
 
+# GSI de listado: partición constante por tipo de entidad, orden por saved_at
+TRANSACTIONS_INDEX_NAME = os.getenv("DYNAMO_TRANSACTIONS_INDEX", "entity_type-saved_at-index")
+TRANSACTION_ENTITY_TYPE = "transaction"
+
+# Campos de resumen que devuelve el listado (el resto se lee con get_transaction)
+TRANSACTION_SUMMARY_PROJECTION = [
+    'transaction_id', 'saved_at', 'updated_at', 'need_human_review', 'reviewed_by_human',
+    'decision', 'last_decision',
+    'transaction_request.customer_id', 'transaction_request.amount', 'transaction_request.currency',
+    'transaction_request.country', 'transaction_request.channel', 'transaction_request.#ts',
+]
+
+# Definición del GSI (la usan create_dynamo_index.py y la tabla de benchmarks)
+TRANSACTIONS_INDEX_ATTRIBUTES = [
+    {'AttributeName': 'entity_type', 'AttributeType': 'S'},
+    {'AttributeName': 'saved_at', 'AttributeType': 'S'},
+]
+TRANSACTIONS_INDEX_SPEC = {
+    'IndexName': TRANSACTIONS_INDEX_NAME,
+    'KeySchema': [
+        {'AttributeName': 'entity_type', 'KeyType': 'HASH'},
+        {'AttributeName': 'saved_at', 'KeyType': 'RANGE'},
+    ],
+    'Projection': {
+        'ProjectionType': 'INCLUDE',
+        'NonKeyAttributes': ['updated_at', 'need_human_review', 'reviewed_by_human', 'decision', 'last_decision', 'transaction_request'],
+    },
+}
+
 class DynamoService:
 
     def __init__(self, table_name: str = "bcp_transactions", region_name: str = "us-east-1"):
@@ -13,51 +45,37 @@ class DynamoService:
         self.dynamodb = boto3.resource('dynamodb', region_name=region_name, aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
         self.table = self.dynamodb.Table(table_name)
         self.table_name = table_name
+        # Callbacks con los transaction_id escritos (p.ej. invalidación de caches de lectura)
+        self._write_listeners: list[Callable[[Iterable[str]], None]] = []
     
-    def _serialize_to_dict(self, obj: Any) -> Any:
-        if isinstance(obj, datetime):
-            return obj.isoformat() + 'Z'
-        elif hasattr(obj, 'model_dump'):
-            return self._serialize_to_dict(obj.model_dump())
-        elif hasattr(obj, 'dict'):
-            return self._serialize_to_dict(obj.dict())
-        elif isinstance(obj, dict):
-            return {k: self._serialize_to_dict(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._serialize_to_dict(item) for item in obj]
-        elif isinstance(obj, tuple):
-            return [self._serialize_to_dict(item) for item in obj]
-        elif isinstance(obj, set):
-            return [self._serialize_to_dict(item) for item in obj]
-        return obj
+    def add_write_listener(self, listener: Callable[[Iterable[str]], None]) -> None:
+        self._write_listeners.append(listener)
     
-    def _convert_floats_to_decimal(self, obj: Any) -> Any:
-        if isinstance(obj, float):
-            return Decimal(str(obj))
-        elif isinstance(obj, dict):
-            return {k: self._convert_floats_to_decimal(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_floats_to_decimal(item) for item in obj]
-        return obj
+    def _notify_write(self, transaction_ids: Iterable[str]) -> None:
+        ids = list(transaction_ids)
+        for listener in self._write_listeners:
+            try:
+                listener(ids)
+            except Exception as e:
+                print(f"Error notifying write listener: {str(e)}")
     
-    def _convert_decimal_to_float(self, obj: Any) -> Any:
-        if isinstance(obj, Decimal):
-            return float(obj)
-        elif isinstance(obj, dict):
-            return {k: self._convert_decimal_to_float(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_decimal_to_float(item) for item in obj]
-        return obj
+    def build_item(self, transaction_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Una sola pasada: modelos, datetimes y floats -> tipos de DynamoDB
+        item = encode_item(transaction_data)
+        item['saved_at'] = datetime.utcnow().isoformat() + 'Z'
+        item['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+        item['entity_type'] = TRANSACTION_ENTITY_TYPE
+        return item
     
+    # Los métodos que devuelven False/None ante errores miden solo la llamada a DynamoDB
+    # (track_external cuenta el error antes de que el except lo convierta)
     def save_transaction(self, transaction_data: Dict[str, Any]) -> bool:
         try:
-            item = self._serialize_to_dict(transaction_data)
-            item['saved_at'] = datetime.utcnow().isoformat() + 'Z'
-            item['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-            
-            item = self._convert_floats_to_decimal(item)
+            item = self.build_item(transaction_data)
             
-            self.table.put_item(Item=item)
+            with track_external("dynamodb", "save_transaction"):
+                self.table.put_item(Item=item)
+            self._notify_write([item.get('transaction_id')])
             
             print(f"Transaction {transaction_data.get('transaction_id')} saved to DynamoDB")
             return True
@@ -68,14 +86,24 @@ class DynamoService:
             traceback.print_exc()
             return False
     
+    @observe_external("dynamodb", "save_items_batch")
+    def save_items_batch(self, items: list[Dict[str, Any]]) -> None:
+        # batch_writer agrupa en BatchWriteItem de 25 y reintenta los UnprocessedItems.
+        # Los errores se propagan para que el llamador aplique su política de reintentos.
+        with self.table.batch_writer(overwrite_by_pkeys=['transaction_id']) as batch:
+            for item in items:
+                batch.put_item(Item=item)
+        self._notify_write(item.get('transaction_id') for item in items)
+    
     def get_transaction(self, transaction_id: str) -> Optional[Dict[str, Any]]:
         try:
-            response = self.table.get_item(
-                Key={'transaction_id': transaction_id}
-            )
+            with track_external("dynamodb", "get_transaction"):
+                response = self.table.get_item(
+                    Key={'transaction_id': transaction_id}
+                )
             
             if 'Item' in response:
-                item = self._convert_decimal_to_float(response['Item'])
+                item = decode_item(response['Item'])
                 return item
             else:
                 print(f"Transaction {transaction_id} not found in DynamoDB")
@@ -90,18 +118,20 @@ class DynamoService:
     def update_transaction(self, transaction_id: str, updates: Dict[str, Any]) -> bool:
         try:
             updates['updated_at'] = datetime.utcnow().isoformat() + 'Z'
-            updates = self._convert_floats_to_decimal(updates)
+            updates = encode_item(updates)
             
             update_expr = "SET " + ", ".join([f"#{k} = :{k}" for k in updates.keys()])
             expr_attr_names = {f"#{k}": k for k in updates.keys()}
             expr_attr_values = {f":{k}": v for k, v in updates.items()}
             
-            self.table.update_item(
-                Key={'transaction_id': transaction_id},
-                UpdateExpression=update_expr,
-                ExpressionAttributeNames=expr_attr_names,
-                ExpressionAttributeValues=expr_attr_values
-            )
+            with track_external("dynamodb", "update_transaction"):
+                self.table.update_item(
+                    Key={'transaction_id': transaction_id},
+                    UpdateExpression=update_expr,
+                    ExpressionAttributeNames=expr_attr_names,
+                    ExpressionAttributeValues=expr_attr_values
+                )
+            self._notify_write([transaction_id])
             
             print(f"Transaction {transaction_id} updated in DynamoDB")
             return True
@@ -112,25 +142,114 @@ class DynamoService:
             traceback.print_exc()
             return False
     
-    def get_all_transactions(self, limit: Optional[int] = None) -> list[Dict[str, Any]]:
+    @observe_external("dynamodb", "append_human_review")
+    def append_human_review(self, transaction_id: str, audit_entry: Dict[str, Any], last_decision: Dict[str, Any]) -> bool:
+        # Un solo UpdateItem condicional: agrega la entrada de auditoría con list_append
+        # sin leer el item y rechaza transacciones no escaladas o ya revisadas (False).
+        # Cualquier otro error se propaga
         try:
-            if limit:
-                response = self.table.scan(Limit=limit)
-            else:
-                response = self.table.scan()
-            
-            items = response.get('Items', [])
-            
-            while 'LastEvaluatedKey' in response and not limit:
-                response = self.table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-                items.extend(response.get('Items', []))
-            
-            transactions = [self._convert_decimal_to_float(item) for item in items]
-            return transactions
-            
+            self.table.update_item(
+                Key={'transaction_id': transaction_id},
+                UpdateExpression=(
+                    "SET #audit = list_append(if_not_exists(#audit, :empty), :entry), "
+                    "#last = :last, #reviewed = :true, #updated = :now"
+                ),
+                ConditionExpression=(
+                    "attribute_exists(transaction_id) AND #need = :true "
+                    "AND (attribute_not_exists(#reviewed) OR #reviewed = :false)"
+                ),
+                ExpressionAttributeNames={
+                    '#audit': 'agent_audit',
+                    '#last': 'last_decision',
+                    '#reviewed': 'reviewed_by_human',
+                    '#updated': 'updated_at',
+                    '#need': 'need_human_review',
+                },
+                ExpressionAttributeValues={
+                    ':entry': [encode_item(audit_entry)],
+                    ':empty': [],
+                    ':last': encode_item(last_decision),
+                    ':true': True,
+                    ':false': False,
+                    ':now': datetime.utcnow().isoformat() + 'Z',
+                }
+            )
+            self._notify_write([transaction_id])
+            print(f"Transaction {transaction_id} updated with human review")
+            return True
+        
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            print(f"Transaction {transaction_id} not escalated or already reviewed")
+            return False
         except Exception as e:
-            print(f"Error retrieving all transactions from DynamoDB: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
-
+            # Se propaga: el llamador no debe confundir un fallo de escritura con "ya revisada"
+            print(f"Error appending human review in DynamoDB: {str(e)}")
+            raise
+    
+    @staticmethod
+    def encode_page_token(last_evaluated_key: Optional[Dict[str, Any]]) -> Optional[str]:
+        if not last_evaluated_key:
+            return None
+        return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode("utf-8")).decode("ascii")
+    
+    @staticmethod
+    def decode_page_token(token: str) -> Dict[str, Any]:
+        try:
+            key = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        except Exception:
+            raise ValueError("Invalid pagination token")
+        if not isinstance(key, dict) or 'transaction_id' not in key:
+            raise ValueError("Invalid pagination token")
+        return key
+    
+    def list_transactions(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        need_human_review: Optional[bool] = None,
+        reviewed_by_human: Optional[bool] = None,
+        decision: Optional[str] = None,
+        max_queries: int = 10
+    ) -> Dict[str, Any]:
+        """Página de transacciones, más recientes primero, vía Query sobre el GSI de saved_at."""
+        filter_expr = None
+        for condition in (
+            Attr('need_human_review').eq(need_human_review) if need_human_review is not None else None,
+            Attr('reviewed_by_human').eq(True) if reviewed_by_human else None,
+            # Las transacciones no revisadas pueden no tener el atributo
+            Attr('reviewed_by_human').ne(True) if reviewed_by_human is False else None,
+            Attr('decision.value').eq(decision) if decision else None,
+        ):
+            if condition is not None:
+                filter_expr = condition if filter_expr is None else filter_expr & condition
+        
+        query_kwargs = {
+            'IndexName': TRANSACTIONS_INDEX_NAME,
+            'KeyConditionExpression': Key('entity_type').eq(TRANSACTION_ENTITY_TYPE),
+            'ScanIndexForward': False,
+            'ProjectionExpression': ", ".join(TRANSACTION_SUMMARY_PROJECTION),
+            'ExpressionAttributeNames': {'#ts': 'timestamp'},
+        }
+        if filter_expr is not None:
+            query_kwargs['FilterExpression'] = filter_expr
+        
+        items = []
+        last_key = self.decode_page_token(cursor) if cursor else None
+        # Limit acota los items evaluados, así LastEvaluatedKey nunca salta resultados filtrados;
+        # con filtros selectivos se encadenan hasta max_queries consultas por página
+        for _ in range(max_queries):
+            if last_key:
+                query_kwargs['ExclusiveStartKey'] = last_key
+            query_kwargs['Limit'] = limit - len(items)
+            # Solo la consulta: un cursor inválido no es un error de DynamoDB
+            with track_external("dynamodb", "list_transactions"):
+                response = self.table.query(**query_kwargs)
+            items.extend(response.get('Items', []))
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key or len(items) >= limit:
+                break
+        
+        return {
+            'items': [decode_item(item) for item in items],
+            'next_cursor': self.encode_page_token(last_key),
+        }
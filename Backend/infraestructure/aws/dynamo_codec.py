@@ -0,0 +1,49 @@
+"""Codec de items de DynamoDB en una sola pasada.
+
+encode_item convierte el estado del grafo (modelos pydantic, datetimes,
+floats, tuplas y sets anidados) directamente a los tipos que acepta la capa
+resource de boto3, sin model_dump intermedio ni una segunda pasada para los
+Decimal. decode_item hace el camino inverso (Decimal -> float).
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
+from pydantic import BaseModel
+
+_PASSTHROUGH = (str, bool, int, type(None))
+
+
+def encode_item(obj: Any) -> Any:
+    kind = type(obj)
+    if kind in _PASSTHROUGH:
+        return obj
+    if kind is float:
+        # repr es la representación más corta que preserva el valor (igual que str)
+        return Decimal(repr(obj))
+    if kind is dict:
+        return {key: encode_item(value) for key, value in obj.items()}
+    if kind is list or kind is tuple or kind is set:
+        return [encode_item(value) for value in obj]
+    if isinstance(obj, BaseModel):
+        # Recorre los campos del modelo sin materializar el dict de model_dump
+        return {name: encode_item(getattr(obj, name)) for name in type(obj).model_fields}
+    if isinstance(obj, datetime):
+        return obj.isoformat() + 'Z'
+    if isinstance(obj, float):
+        return Decimal(repr(obj))
+    if isinstance(obj, dict):
+        return {key: encode_item(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, set)):
+        return [encode_item(value) for value in obj]
+    return obj
+
+
+def decode_item(obj: Any) -> Any:
+    kind = type(obj)
+    if kind is Decimal:
+        return float(obj)
+    if kind is dict:
+        return {key: decode_item(value) for key, value in obj.items()}
+    if kind is list:
+        return [decode_item(value) for value in obj]
+    return obj
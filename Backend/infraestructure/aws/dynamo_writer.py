@@ -0,0 +1,168 @@
+from infraestructure.aws.dynamo import DynamoService
+from typing import Dict, Any, List, Optional
+import asyncio
+import os
+import random
+import time
+
+
+class DynamoWriteBehind:
+    """Persistencia write-behind para DynamoDB.
+
+    Los handlers encolan el resultado y responden de inmediato; un worker en
+    background agrupa los items y los escribe con batch_writer fuera del
+    event loop, reintentando con backoff exponencial. Con la cola llena el
+    encolado no espera nunca: hasta DYNAMO_WRITE_MAX_OVERFLOW escrituras van
+    por el mismo camino con reintentos en tasks de background y el resto se
+    descarta y se cuenta en `dropped`; los fallos quedan en `failed`.
+    """
+
+    def __init__(self, dynamo_service: DynamoService, max_queue_size: int | None = None,
+                 batch_size: int | None = None, flush_interval_seconds: float | None = None,
+                 max_retries: int | None = None, base_backoff_seconds: float | None = None,
+                 max_overflow_writes: int | None = None):
+        self.dynamo = dynamo_service
+        self.max_queue_size = max_queue_size if max_queue_size is not None else int(os.getenv("DYNAMO_WRITE_QUEUE_SIZE", "1000"))
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv("DYNAMO_WRITE_BATCH_SIZE", "25"))
+        self.flush_interval_seconds = (flush_interval_seconds if flush_interval_seconds is not None
+                                       else float(os.getenv("DYNAMO_WRITE_FLUSH_INTERVAL", "0.5")))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("DYNAMO_WRITE_MAX_RETRIES", "5"))
+        self.base_backoff_seconds = (base_backoff_seconds if base_backoff_seconds is not None
+                                     else float(os.getenv("DYNAMO_WRITE_BACKOFF_SECONDS", "0.2")))
+        self.max_overflow_writes = (max_overflow_writes if max_overflow_writes is not None
+                                    else int(os.getenv("DYNAMO_WRITE_MAX_OVERFLOW", "4")))
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._overflow_tasks: set = set()  # escrituras fuera de la cola, acotadas por max_overflow_writes
+        self._stopping = False
+
+        # Métricas
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.overflow = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def start(self) -> None:
+        if self._worker is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._stopping = False
+            self._worker = asyncio.create_task(self._run())
+            print(f"[DYNAMO] Write-behind worker started (queue={self.max_queue_size}, batch={self.batch_size})")
+
+    def enqueue(self, transaction_data: Dict[str, Any]) -> bool:
+        if self.queue is not None and not self._stopping:
+            try:
+                self.queue.put_nowait(transaction_data)
+                self.enqueued += 1
+                return True
+            except asyncio.QueueFull:
+                pass
+        # Cola llena o sin worker activo (p.ej. scripts): nunca se espera a DynamoDB
+        self._spawn_overflow_write(transaction_data)
+        return False
+
+    def _spawn_overflow_write(self, transaction_data: Dict[str, Any]) -> None:
+        transaction_id = transaction_data.get('transaction_id')
+        if len(self._overflow_tasks) >= self.max_overflow_writes:
+            self.dropped += 1
+            print(f"[DYNAMO] Write queue and overflow full, dropping {transaction_id}")
+            return
+        self.overflow += 1
+        print(f"[DYNAMO] Write queue full or stopped, writing {transaction_id} in background")
+        task = asyncio.create_task(self._flush([transaction_data]))
+        self._overflow_tasks.add(task)
+        task.add_done_callback(self._overflow_tasks.discard)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout=self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                if self._stopping:
+                    return
+                continue
+
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            await self._flush(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            items = await asyncio.to_thread(lambda: [self.dynamo.build_item(data) for data in batch])
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"[DYNAMO] Could not serialize batch of {len(batch)}: {e}")
+            return
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(self.dynamo.save_items_batch, items)
+                self.written += len(items)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(items)
+                    ids = [item.get('transaction_id') for item in items]
+                    print(f"[DYNAMO] Batch write failed after {self.max_retries} retries, dropping {ids}: {e}")
+                    break
+                self.retries += 1
+                backoff = self.base_backoff_seconds * (2 ** attempt) * (1 + random.random())
+                print(f"[DYNAMO] Batch write failed (attempt {attempt + 1}), retrying in {backoff:.2f}s: {e}")
+                await asyncio.sleep(backoff)
+
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        if self._worker is None:
+            return
+        self._stopping = True
+        try:
+            # Drenar lo pendiente antes de apagar
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+            if self._overflow_tasks:
+                await asyncio.wait_for(asyncio.gather(*self._overflow_tasks, return_exceptions=True), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[DYNAMO] Shutdown flush timed out with {self.queue.qsize()} items pending")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        print(f"[DYNAMO] Write-behind worker stopped (written={self.written}, failed={self.failed}, dropped={self.dropped})")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_capacity": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "retries": self.retries,
+            "overflow": self.overflow,
+            "overflow_inflight": len(self._overflow_tasks),
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+            "max_flush_seconds": round(self.max_flush_seconds, 4),
+            "avg_flush_seconds": round(self.total_flush_seconds / self.flushes, 4) if self.flushes else 0.0,
+        }
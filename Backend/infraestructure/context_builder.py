@@ -0,0 +1,257 @@
+"""Contexto compacto y acotado por tokens para los agentes LLM.
+
+La evidencia (transacción, perfil, anomalías, análisis comportamental,
+políticas y threat intelligence) se renderiza una sola vez por transacción en
+evidence_join y se guarda en state["rendered_context"] como secciones de
+líneas. Cada agente arma su vista con las secciones que necesita, en su orden
+de prioridad y dentro de su presupuesto de tokens (CONTEXT_BUDGET_<AGENTE>).
+
+El recorte es determinista: las secciones se agregan por prioridad, línea a
+línea, y las líneas que no entran se reemplazan por un marcador con la
+cantidad omitida. La salida conserva el orden canónico de las secciones.
+"""
+from typing import Dict, List, Tuple
+from infraestructure.metrics import metrics
+import math
+import os
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken llega como dependencia de langchain-openai
+    tiktoken = None
+
+CONTEXT_TOKENS = metrics.histogram(
+    "agent_context_tokens", "Tokens del contexto enviado al LLM por agente", ["agent"],
+    buckets=(64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)
+)
+
+# Orden en que se presentan las secciones en el prompt
+SECTION_ORDER = ("transaction", "profile", "anomalies", "behavioral", "policies", "threats", "debate", "decision")
+# Secciones que dependen solo de la evidencia: se renderizan una vez en evidence_join
+EVIDENCE_SECTIONS = SECTION_ORDER[:6]
+
+# Secciones por agente en orden de prioridad (las últimas son las primeras en recortarse)
+AGENT_SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "debate": ("transaction", "anomalies", "behavioral"),
+    "arbiter": ("policies", "anomalies", "transaction", "behavioral", "profile", "threats", "debate"),
+    "explainability": ("decision", "transaction", "anomalies", "behavioral", "policies", "threats"),
+}
+DEFAULT_BUDGETS = {"debate": 400, "arbiter": 900, "explainability": 900}
+
+
+def _compact(text, max_chars: int) -> str:
+    text = " ".join(str(text).split())
+    if len(text) > max_chars:
+        text = text[:max_chars].rstrip() + "…"
+    return text
+
+
+def _approx_amount(amount) -> str:
+    amount = float(amount)
+    if amount <= 0:
+        return f"{amount:g}"
+    rounded = round(amount, 1 - math.floor(math.log10(amount)))
+    return str(int(rounded)) if rounded >= 10 else f"{rounded:g}"
+
+
+class ContextBuilder:
+    def __init__(self, budgets: Dict[str, int] | None = None, max_line_chars: int | None = None):
+        self.budgets = {
+            agent: int(os.getenv(f"CONTEXT_BUDGET_{agent.upper()}", str(default)))
+            for agent, default in DEFAULT_BUDGETS.items()
+        }
+        self.budgets.update(budgets or {})
+        self.max_line_chars = max_line_chars if max_line_chars is not None else int(os.getenv("CONTEXT_MAX_LINE_CHARS", "300"))
+        self._encoding = None
+        self._encoding_loaded = False
+
+        self.renders = 0
+        self.views = 0
+        self.cached_views = 0
+        self.truncated_views = 0
+        self.tokens_total = 0
+
+    # --- Conteo de tokens ---
+
+    def _get_encoding(self):
+        if not self._encoding_loaded:
+            self._encoding_loaded = True
+            if tiktoken is not None:
+                try:
+                    self._encoding = tiktoken.get_encoding(os.getenv("CONTEXT_TOKEN_ENCODING", "o200k_base"))
+                except Exception as e:
+                    # Sin acceso al archivo BPE se usa la aproximación de ~4 caracteres por token
+                    print(f"[CONTEXT] tiktoken encoding unavailable, using estimate: {e}")
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+        return (len(text) + 3) // 4
+
+    # --- Renderizado de secciones ---
+
+    def render(self, state) -> Dict[str, List[str]]:
+        """Secciones de evidencia renderizadas (se guardan en state["rendered_context"])."""
+        self.renders += 1
+        return {name: self._render_section(name, state) for name in EVIDENCE_SECTIONS}
+
+    def _render_section(self, name: str, state) -> List[str]:
+        return getattr(self, f"_render_{name}")(state)
+
+    def _render_transaction(self, state) -> List[str]:
+        tx = state.get('transaction_request')
+        if tx is None:
+            return []
+        # Sin ids, con la hora (lo que evalúa time_anomaly) y el monto a 2 cifras significativas:
+        # transacciones parecidas producen el mismo prompt y el cache LLM puede reutilizarlo.
+        # La relación exacta con el promedio ya va en la sección de anomalías
+        hour = f"{tx.timestamp.hour:02d}:00" if hasattr(tx.timestamp, 'hour') else tx.timestamp
+        return ["TRANSACCIÓN", (
+            f"~{_approx_amount(tx.amount)} {tx.currency} | país {tx.country} | canal {tx.channel} | "
+            f"dispositivo {tx.device_id} | hora {hour}"
+        )]
+
+    def _render_profile(self, state) -> List[str]:
+        bh = state.get('usual_behavior')
+        if bh is None:
+            return []
+        return ["COMPORTAMIENTO HABITUAL", (
+            f"monto promedio {bh.usual_amount_avg} | horario {bh.usual_hours} | "
+            f"países {bh.usual_countries} | dispositivos {bh.usual_devices}"
+        )]
+
+    def _render_anomalies(self, state) -> List[str]:
+        anomaly_signals = state.get('anomaly_signals') or {}
+        lines = [f"ANOMALÍAS (score {state.get('anomaly_score', 0)})"]
+        detected = [(k, v) for k, v in anomaly_signals.items() if isinstance(v, dict) and v.get('is_anomaly')]
+        # Las de mayor score van primero: son las últimas en recortarse
+        detected.sort(key=lambda item: -item[1].get('score', 0))
+        for anomaly_type, data in detected:
+            lines.append(_compact(
+                f"- {anomaly_type}: True ({data.get('score', 0):.2f}) {data.get('reason', '')}", self.max_line_chars
+            ))
+        # Las señales normales se resumen en una línea, sin su razón
+        normal = [
+            f"{anomaly_type} ({data.get('score', 0):.2f})" for anomaly_type, data in anomaly_signals.items()
+            if isinstance(data, dict) and not data.get('is_anomaly')
+        ]
+        if normal:
+            lines.append(f"- sin anomalía: {', '.join(normal)}")
+        return lines
+
+    def _render_behavioral(self, state) -> List[str]:
+        ba = state.get('behavioral_analysis') or {}
+        if not ba:
+            return []
+        return ["DESVIACIÓN COMPORTAMENTAL", _compact(
+            f"score {ba.get('deviation_score', 0):.2f}: {ba.get('pattern_deviation') or 'sin notas'}", self.max_line_chars
+        )]
+
+    def _render_policies(self, state) -> List[str]:
+        policies = [ev for ev in state.get('rag_evidence') or [] if not ev.get('error')]
+        if not policies:
+            return []
+        lines = ["POLÍTICAS INTERNAS"]
+        seen = set()
+        for ev in policies:
+            # Varios chunks de la misma regla aportan una sola línea (la de mayor similitud, ya ordenados)
+            key = (ev.get('policy_id'), ev.get('rule'))
+            if key in seen:
+                continue
+            seen.add(key)
+            lines.append(_compact(
+                f"- {ev.get('policy_id', 'N/A')} v{ev.get('version', 'N/A')} (sim {ev.get('similarity_score', 0):.2f}): {ev.get('rule', 'N/A')}",
+                self.max_line_chars
+            ))
+        return lines
+
+    def _render_threats(self, state) -> List[str]:
+        threats = state.get('search_evidence') or []
+        if not threats:
+            return []
+        lines = ["THREAT INTELLIGENCE"]
+        for ev in threats:
+            line = _compact(f"- {ev.get('fraud_type', 'N/A')}: {ev.get('summary', 'N/A')}", self.max_line_chars)
+            if line not in lines:
+                lines.append(line)
+        return lines
+
+    def _render_debate(self, state) -> List[str]:
+        debate = state.get('debate') or []
+        if not debate:
+            return []
+        lines = ["DEBATE"]
+        for entry in debate:
+            agent = "Cliente" if entry.get('agent') == 'pro_customer' else "Fraude"
+            lines.append(_compact(f"- [R{entry.get('round')} {agent}] {entry.get('argument', '')}", self.max_line_chars))
+        return lines
+
+    def _render_decision(self, state) -> List[str]:
+        decision = state.get('decision') or {}
+        if not decision:
+            return []
+        return [
+            f"DECISIÓN: {decision.get('value')} (confianza {decision.get('confidence') or 0:.2f})",
+            # El razonamiento del árbitro es la base de la explicación: admite el doble de largo
+            _compact(f"Razonamiento: {decision.get('chain_of_thought', '')}", self.max_line_chars * 2),
+        ]
+
+    # --- Vista por agente ---
+
+    def view(self, state, agent: str) -> Tuple[str, dict]:
+        """Contexto del agente dentro de su presupuesto y su uso ({tokens, budget, truncated})."""
+        self.views += 1
+        cached = state.get('rendered_context') or {}
+        if cached:
+            self.cached_views += 1
+
+        budget = self.budgets[agent]
+        selected: Dict[str, List[str]] = {}
+        used = 0
+        truncated = False
+        for name in AGENT_SECTIONS[agent]:
+            lines = cached[name] if name in cached else self._render_section(name, state)
+            kept, costs = [], []
+            for line in lines:
+                cost = self.count_tokens(line) + 1
+                if used + cost > budget:
+                    break
+                kept.append(line)
+                costs.append(cost)
+                used += cost
+            if len(kept) < len(lines):
+                truncated = True
+                # El marcador también cuenta: se liberan líneas del final hasta que entre
+                while len(kept) > 1:
+                    marker = f"… ({len(lines) - len(kept)} omitidos)"
+                    if used + self.count_tokens(marker) + 1 <= budget:
+                        break
+                    kept.pop()
+                    used -= costs.pop()
+                # Un encabezado sin contenido no aporta: la sección se descarta completa
+                if len(kept) <= 1:
+                    used -= sum(costs)
+                    continue
+                kept.append(marker)
+                used += self.count_tokens(marker) + 1
+            selected[name] = kept
+
+        text = "\n\n".join("\n".join(selected[name]) for name in SECTION_ORDER if selected.get(name))
+        tokens = self.count_tokens(text)
+        self.tokens_total += tokens
+        if truncated:
+            self.truncated_views += 1
+        CONTEXT_TOKENS.observe(tokens, agent=agent)
+        return text, {"tokens": tokens, "budget": budget, "truncated": truncated}
+
+    def stats(self) -> dict:
+        return {
+            "renders": self.renders,
+            "views": self.views,
+            "cached_views": self.cached_views,
+            "truncated_views": self.truncated_views,
+            "avg_view_tokens": round(self.tokens_total / self.views, 1) if self.views else 0.0,
+            "tiktoken": self._get_encoding() is not None,
+        }
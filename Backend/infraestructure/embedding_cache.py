@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from array import array
+from typing import List, Optional
+import base64
+import hashlib
+import os
+import re
+import time
+
+
+class EmbeddingCache:
+    """Cache de embeddings en dos niveles.
+
+    L1: LRU en memoria con TTL, por worker.
+    L2 (opcional): Redis, compartido entre workers.
+    """
+
+    def __init__(self, redis_adapter=None, max_entries: int | None = None, ttl_seconds: int | None = None,
+                 redis_ttl_seconds: int | None = None):
+        self.redis = redis_adapter
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+        self.redis_ttl_seconds = (redis_ttl_seconds if redis_ttl_seconds is not None
+                                  else int(os.getenv("EMBEDDING_CACHE_REDIS_TTL", "86400")))
+        self.key_prefix = "emb:"
+        self._entries: OrderedDict = OrderedDict()
+
+        self.hits_memory = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text.strip().lower())
+
+    def make_key(self, model: str, text: str) -> str:
+        digest = hashlib.sha256(f"{model}|{self.normalize(text)}".encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}{digest}"
+
+    @staticmethod
+    def _encode(vector: List[float]) -> str:
+        return base64.b64encode(array("d", vector).tobytes()).decode("ascii")
+
+    @staticmethod
+    def _decode(payload: str) -> List[float]:
+        values = array("d")
+        values.frombytes(base64.b64decode(payload))
+        return values.tolist()
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.make_key(model, text)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, vector = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                return vector
+            del self._entries[key]
+
+        if self.redis is not None:
+            try:
+                payload = await self.redis.get(key)
+                if payload:
+                    vector = self._decode(payload)
+                    self._store_local(key, vector)
+                    self.hits_redis += 1
+                    return vector
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"[EMBEDDING CACHE] Redis read failed: {e}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, model: str, text: str, vector: List[float]) -> None:
+        key = self.make_key(model, text)
+        self._store_local(key, vector)
+
+        if self.redis is not None and self.redis_ttl_seconds > 0:
+            try:
+                await self.redis.set(key, self._encode(vector), ex=self.redis_ttl_seconds)
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"[EMBEDDING CACHE] Redis write failed: {e}")
+
+    def _store_local(self, key: str, vector: List[float]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_redis + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.max_entries,
+            "hits_memory": self.hits_memory,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": round((self.hits_memory + self.hits_redis) / lookups, 4) if lookups else 0.0,
+        }
@@ -8,34 +8,63 @@ from infraestructure.agents.debate_agents import DebateAgent
 from infraestructure.agents.decision_arbiter import DecisionArbiter
 from infraestructure.agents.explainability_agent import ExplanabilityAgent
 from infraestructure.agents.human_review_queue import HumanReviewQueue
+from infraestructure.context_builder import ContextBuilder
+from infraestructure.policy_engine import PolicyEngine
+from infraestructure.llm_cache import CachedLLM, LLMResponseCache, enabled_agents
+from infraestructure.metrics import instrument_node, record_route
 from typing import Dict, Any
+import os
+
+# Agentes de evidencia que solo dependen de la salida de TransactionContextAgent
+EVIDENCE_AGENTS = ["behavioral_agent", "internal_policy_rag_agent", "external_threat_agent"]
+# anomaly_score por encima del cual la evidencia es clara y se salta el debate (should_debate)
+DEBATE_SKIP_ANOMALY_SCORE = 0.75
 
 
 class LangGraphInit:
 
-    def __init__(self, llm, redis_adapter=None):
+    def __init__(self, llm, redis_adapter=None, parallel: bool | None = None):
         try:
             self.llm = llm
-            self.runnable = self.build_graph()
+            if parallel is None:
+                parallel = os.getenv("PIPELINE_MODE", "parallel").lower() != "serial"
+            self.parallel = parallel
+            self.runnable = self.build_graph(parallel=parallel)
+
+            # Cache exacto de respuestas LLM, habilitado por agente (LLM_CACHE_AGENTS)
+            self.llm_cache = LLMResponseCache(redis_adapter)
+            self.llm_cache_agents = enabled_agents()
+
+            # Evidencia renderizada una vez por transacción y recortada por agente
+            self.context_builder = ContextBuilder()
+            # Políticas con predicado ejecutable: un match inequívoco decide sin debate ni árbitro
+            self.policy_engine = PolicyEngine()
 
             self.context_agent = TransactionContextAgent()
-            self.behavioral_agent = BehavioralAgent(llm)
-            self.policy_rag_agent = InternalPolicyRAGAgent()
-            self.threat_agent = ExternalThreatAgent(llm)
-            self.debate_agents = DebateAgent(llm)
-            self.arbiter_agent = DecisionArbiter(llm)
-            self.explainability_agent = ExplanabilityAgent(llm)
+            self.behavioral_agent = BehavioralAgent(self._llm_for("behavioral"))
+            self.policy_rag_agent = InternalPolicyRAGAgent(redis_adapter)
+            self.threat_agent = ExternalThreatAgent(llm, redis_adapter)
+            self.debate_agents = DebateAgent(llm, context_builder=self.context_builder)
+            self.arbiter_agent = DecisionArbiter(self._llm_for("arbiter"), context_builder=self.context_builder)
+            self.explainability_agent = ExplanabilityAgent(self._llm_for("explainability"), context_builder=self.context_builder)
             self.human_review_queue = HumanReviewQueue(redis_adapter)
 
         except Exception as e:
             raise e
 
-    def build_graph(self):
+    def _llm_for(self, agent: str):
+        if agent in self.llm_cache_agents:
+            return CachedLLM(self.llm, self.llm_cache, agent)
+        return self.llm
+
+    def build_graph(self, parallel: bool = True):
 
         def should_debate(state: AgentState) -> str:
-            if state['anomaly_score'] > 0.75:  # Evidencia muy clara de APPROVE o BLOCK
-                return "decision_arbiter"
-            return "debate_agents"
+            if (state.get('policy_match') or {}).get('enforced'):
+                return record_route("should_debate", "policy_decision")
+            if state['anomaly_score'] > DEBATE_SKIP_ANOMALY_SCORE:  # Evidencia muy clara de APPROVE o BLOCK
+                return record_route("should_debate", "decision_arbiter")
+            return record_route("should_debate", "debate_agents")
         
         def final_routing(state: AgentState) -> str:
             print("Final routing based on decision and confidence")
@@ -45,33 +74,52 @@ class LangGraphInit:
             print(f"Decision: {decision_value}, Confidence: {confidence}")
             
             if decision_value == "ESCALATE_TO_HUMAN" or confidence < 0.75:
-                return "human_review_queue"
+                return record_route("final_routing", "human_review_queue")
+            record_route("final_routing", "end")
             return END  # Fin del proceso automático
 
         workflow = StateGraph(AgentState)
-        workflow.add_node("transaction_context_agent", self._transaction_context_node)
-        workflow.add_node("behavioral_agent", self._behavioral_agent)
-        workflow.add_node("internal_policy_rag_agent", self._internal_policy_rag_agent)
-        workflow.add_node("external_threat_agent", self._external_threat_agent)
-        workflow.add_node("debate_agents", self._debate_agents)
-        workflow.add_node("decision_arbiter", self._decision_arbiter)
-        workflow.add_node("explainability_agent", self._explainability_agent)
-        workflow.add_node("human_review_queue", self._human_review_queue)
+        nodes = {
+            "transaction_context_agent": self._transaction_context_node,
+            "behavioral_agent": self._behavioral_agent,
+            "internal_policy_rag_agent": self._internal_policy_rag_agent,
+            "external_threat_agent": self._external_threat_agent,
+            "evidence_join": self._evidence_join,
+            "policy_decision": self._policy_decision,
+            "debate_agents": self._debate_agents,
+            "decision_arbiter": self._decision_arbiter,
+            "explainability_agent": self._explainability_agent,
+            "human_review_queue": self._human_review_queue,
+        }
+        # Cada nodo registra latencia y errores en /metrics
+        for node_name, node_fn in nodes.items():
+            workflow.add_node(node_name, instrument_node(node_name, node_fn))
 
 
         workflow.add_edge(START, "transaction_context_agent")
-        workflow.add_edge("transaction_context_agent", "behavioral_agent")
-        workflow.add_edge("behavioral_agent", "internal_policy_rag_agent")
-        workflow.add_edge("internal_policy_rag_agent", "external_threat_agent")
+
+        if parallel:
+            # Fan-out: los tres agentes de evidencia corren en el mismo superstep
+            for agent_name in EVIDENCE_AGENTS:
+                workflow.add_edge("transaction_context_agent", agent_name)
+            # Fan-in: evidence_join espera a que terminen los tres
+            workflow.add_edge(EVIDENCE_AGENTS, "evidence_join")
+        else:
+            workflow.add_edge("transaction_context_agent", EVIDENCE_AGENTS[0])
+            for previous, current in zip(EVIDENCE_AGENTS, EVIDENCE_AGENTS[1:]):
+                workflow.add_edge(previous, current)
+            workflow.add_edge(EVIDENCE_AGENTS[-1], "evidence_join")
 
         workflow.add_conditional_edges(
-            "external_threat_agent",
+            "evidence_join",
             should_debate,
             {
+                "policy_decision": "policy_decision",
                 "debate_agents": "debate_agents",
                 "decision_arbiter": "decision_arbiter"
             })
 
+        workflow.add_edge("policy_decision", "explainability_agent")
         workflow.add_edge("debate_agents", "decision_arbiter")
         workflow.add_edge("decision_arbiter", "explainability_agent")
 
@@ -99,6 +147,16 @@ class LangGraphInit:
     async def _external_threat_agent(self, state: AgentState) -> Dict[str, Any]:
         return await self.threat_agent.get_external_threat(state)
     
+    async def _evidence_join(self, state: AgentState) -> Dict[str, Any]:
+        # Punto de sincronización: con toda la evidencia disponible se renderiza el contexto compartido
+        update = {"rendered_context": self.context_builder.render(state)}
+        if self.policy_engine.enabled:
+            update["policy_match"] = self.policy_engine.evaluate(state.get('anomaly_signals'))
+        return update
+    
+    async def _policy_decision(self, state: AgentState) -> Dict[str, Any]:
+        return self.policy_engine.decide(state)
+    
     async def _debate_agents(self, state: AgentState) -> Dict[str, Any]:
         return await self.debate_agents.debate(state)
     
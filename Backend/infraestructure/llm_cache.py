@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from infraestructure.metrics import metrics
+import hashlib
+import json
+import os
+import time
+
+LLM_CACHE_LOOKUPS = metrics.counter("llm_cache_lookups_total", "Consultas al cache de respuestas LLM", ["agent", "result"])
+
+# Agentes cuyo LLM puede envolverse con el cache (LLM_CACHE_AGENTS)
+CACHEABLE_AGENTS = ("behavioral", "arbiter", "explainability")
+
+
+class LLMResponseCache:
+    """Cache exacto de respuestas del chat model en dos niveles.
+
+    La clave es el modelo, sus parámetros de muestreo, las tools enlazadas y
+    el contenido de los mensajes. L1: LRU en memoria con TTL. L2 (opcional):
+    Redis, compartido entre workers.
+    """
+
+    def __init__(self, redis_adapter=None, max_entries: int | None = None, ttl_seconds: int | None = None,
+                 redis_ttl_seconds: int | None = None):
+        self.redis = redis_adapter
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("LLM_CACHE_SIZE", "512"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("LLM_CACHE_TTL", "600"))
+        self.redis_ttl_seconds = (redis_ttl_seconds if redis_ttl_seconds is not None
+                                  else int(os.getenv("LLM_CACHE_REDIS_TTL", "3600")))
+        self.key_prefix = "llm:"
+        self._entries: OrderedDict = OrderedDict()
+
+        self.hits_memory = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def _canonical_message(message: BaseMessage) -> dict:
+        # Sin ids: cambian en cada ejecución aunque el contenido sea idéntico
+        return {
+            "type": message.type,
+            "content": message.content,
+            "tool_calls": [{"name": c["name"], "args": c["args"]} for c in getattr(message, "tool_calls", None) or []],
+        }
+
+    def make_key(self, model_signature: dict, messages: List[BaseMessage]) -> str:
+        payload = json.dumps(
+            {"model": model_signature, "messages": [self._canonical_message(m) for m in messages]},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return f"{self.key_prefix}{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    async def get(self, key: str) -> tuple[Optional[dict], str]:
+        """Payload JSON guardado (mensaje serializado o resultado estructurado) y origen."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                return payload, "hit_memory"
+            del self._entries[key]
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(key)
+                if raw:
+                    payload = json.loads(raw)
+                    self._store_local(key, payload)
+                    self.hits_redis += 1
+                    return payload, "hit_redis"
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"[LLM CACHE] Redis read failed: {e}")
+
+        self.misses += 1
+        return None, "miss"
+
+    async def set(self, key: str, payload: dict) -> None:
+        self._store_local(key, payload)
+
+        if self.redis is not None and self.redis_ttl_seconds > 0:
+            try:
+                await self.redis.set(key, json.dumps(payload, ensure_ascii=False), ex=self.redis_ttl_seconds)
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"[LLM CACHE] Redis write failed: {e}")
+
+    def _store_local(self, key: str, payload: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        hits = self.hits_memory + self.hits_redis
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "redis_ttl_seconds": self.redis_ttl_seconds,
+            "hits_memory": self.hits_memory,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedLLM:
+    """Envuelve el llm compartido (o un bind_tools) con LLMResponseCache.
+
+    Expone ainvoke y bind_tools como el chat model; cada respuesta lleva el
+    resultado de la consulta en response_metadata["llm_cache"] para que el
+    agente lo registre en agent_audit.
+    """
+
+    def __init__(self, llm, cache: LLMResponseCache, agent_name: str):
+        self.llm = llm
+        self.cache = cache
+        self.agent_name = agent_name
+
+    def _model_signature(self) -> Dict[str, Any]:
+        # bind_tools devuelve un RunnableBinding: el modelo está en .bound y las tools en .kwargs
+        model = getattr(self.llm, "bound", self.llm)
+        return {
+            "model": getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__,
+            "temperature": getattr(model, "temperature", None),
+            "bound": getattr(self.llm, "kwargs", {}),
+        }
+
+    def bind_tools(self, tools, **kwargs) -> "CachedLLM":
+        return CachedLLM(self.llm.bind_tools(tools, **kwargs), self.cache, self.agent_name)
+
+    def with_structured_output(self, schema: Type[BaseModel], **kwargs) -> "CachedStructuredLLM":
+        return CachedStructuredLLM(self, schema, **kwargs)
+
+    async def ainvoke(self, messages: List[BaseMessage], *args, **kwargs) -> BaseMessage:
+        key = self.cache.make_key(self._model_signature(), messages)
+        payload, status = await self.cache.get(key)
+        LLM_CACHE_LOOKUPS.inc(agent=self.agent_name, result="hit" if payload is not None else "miss")
+        if payload is not None:
+            cached = messages_from_dict([payload])[0]
+            cached.response_metadata = {**cached.response_metadata, "llm_cache": status}
+            return cached
+
+        response = await self.llm.ainvoke(messages, *args, **kwargs)
+        await self.cache.set(key, message_to_dict(response))
+        response.response_metadata = {**response.response_metadata, "llm_cache": "miss"}
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+class CachedStructuredLLM:
+    """with_structured_output sobre CachedLLM: se cachea el resultado ya validado.
+
+    Devuelve el mismo dict que with_structured_output(include_raw=True)
+    ({"raw", "parsed", "parsing_error"}) más "llm_cache". Los fallos de
+    parseo no se guardan.
+    """
+
+    def __init__(self, cached_llm: CachedLLM, schema: Type[BaseModel], **kwargs):
+        self.cached_llm = cached_llm
+        self.schema = schema
+        kwargs["include_raw"] = True
+        self.runnable = cached_llm.llm.with_structured_output(schema, **kwargs)
+
+    def _key(self, messages: List[BaseMessage]) -> str:
+        signature = {**self.cached_llm._model_signature(), "schema": self.schema.model_json_schema()}
+        return self.cached_llm.cache.make_key(signature, messages)
+
+    async def ainvoke(self, messages: List[BaseMessage], *args, **kwargs) -> dict:
+        cache = self.cached_llm.cache
+        key = self._key(messages)
+        payload, status = await cache.get(key)
+        LLM_CACHE_LOOKUPS.inc(agent=self.cached_llm.agent_name, result="hit" if payload is not None else "miss")
+        if payload is not None:
+            return {"raw": None, "parsed": self.schema.model_validate(payload), "parsing_error": None, "llm_cache": status}
+
+        result = await self.runnable.ainvoke(messages, *args, **kwargs)
+        if result.get("parsed") is not None:
+            await cache.set(key, result["parsed"].model_dump(mode="json"))
+        return {**result, "llm_cache": "miss"}
+
+
+def cache_status(response) -> str | None:
+    """Resultado del cache para una respuesta, o None si el llm no está envuelto."""
+    if isinstance(response, dict):
+        return response.get("llm_cache")
+    return (getattr(response, "response_metadata", None) or {}).get("llm_cache")
+
+
+def enabled_agents() -> set:
+    configured = os.getenv("LLM_CACHE_AGENTS", "behavioral")
+    return {name.strip().lower() for name in configured.split(",") if name.strip().lower() in CACHEABLE_AGENTS}
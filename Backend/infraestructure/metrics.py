@@ -0,0 +1,205 @@
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Tuple
+import functools
+import inspect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket_counts, sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], dict]:
+        with self._lock:
+            return {
+                key: {"buckets": list(zip(self.buckets, counts)), "sum": total, "count": count}
+                for key, (counts, total, count) in self._values.items()
+            }
+
+    def quantile(self, q: float, **labels) -> float | None:
+        # Estimación por interpolación lineal dentro del bucket (como histogram_quantile)
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        data = self.snapshot().get(key)
+        if not data or not data["count"]:
+            return None
+        rank = q * data["count"]
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in data["buckets"]:
+            if count >= rank:
+                if count == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+            lower_bound, lower_count = bound, count
+        return self.buckets[-1]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, data in sorted(self.snapshot().items()):
+            for bound, count in data["buckets"]:
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {data['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {data['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {data['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro mínimo de métricas con exposición en formato texto de Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._stats_sources: Dict[str, Callable[[], dict]] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        if name not in self._metrics:
+            self._metrics[name] = Counter(name, documentation, labelnames)
+        return self._metrics[name]
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+        return self._metrics[name]
+
+    def register_stats(self, prefix: str, source: Callable[[], dict]) -> None:
+        # Expone como gauges los valores numéricos de un stats() existente
+        self._stats_sources[prefix] = source
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for prefix, source in self._stats_sources.items():
+            try:
+                stats = source() or {}
+            except Exception as e:
+                print(f"[METRICS] Stats source {prefix} failed: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+NODE_LATENCY = metrics.histogram("agent_node_duration_seconds", "Latencia por nodo del grafo", ["node"])
+NODE_ERRORS = metrics.counter("agent_node_errors_total", "Errores por nodo del grafo", ["node"])
+EXTERNAL_LATENCY = metrics.histogram("external_call_duration_seconds", "Latencia de llamadas externas", ["service", "operation"])
+EXTERNAL_ERRORS = metrics.counter("external_call_errors_total", "Errores de llamadas externas", ["service", "operation"])
+ROUTING_DECISIONS = metrics.counter("graph_routing_decisions_total", "Ramas elegidas por los routers del grafo", ["router", "branch"])
+STRUCTURED_OUTPUT_FAILURES = metrics.counter("llm_structured_output_failures_total", "Respuestas LLM que no validaron contra el modelo de salida", ["agent"])
+LLM_RETRIES = metrics.counter("llm_retries_total", "Reintentos de llamadas LLM por salida inválida", ["agent"])
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens consumidos por agente", ["agent", "type"])
+
+
+@contextmanager
+def track_external(service: str, operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        EXTERNAL_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - start, service=service, operation=operation)
+
+
+def observe_external(service: str, operation: str | None = None):
+    """Decorador de track_external para funciones sync o async."""
+
+    def decorator(fn):
+        op = operation or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with track_external(service, op):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track_external(service, op):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def instrument_node(name: str, fn):
+    @functools.wraps(fn)
+    async def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return await fn(state)
+        except Exception:
+            NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            NODE_LATENCY.observe(time.perf_counter() - start, node=name)
+    return wrapper
+
+
+def record_route(router: str, branch: str) -> str:
+    ROUTING_DECISIONS.inc(router=router, branch=branch)
+    return branch
@@ -1,5 +1,32 @@
 from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
+from infraestructure.metrics import EXTERNAL_ERRORS, EXTERNAL_LATENCY
 import os
+import time
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Mide cada llamada al chat model (incluidas las que usan bind_tools)."""
+
+    def __init__(self):
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            EXTERNAL_LATENCY.observe(time.perf_counter() - start, service="openai", operation="chat")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        EXTERNAL_ERRORS.inc(service="openai", operation="chat")
+        if start is not None:
+            EXTERNAL_LATENCY.observe(time.perf_counter() - start, service="openai", operation="chat")
 
 class OpenAIClient:
     
@@ -13,6 +40,7 @@ class OpenAIClient:
         self.llm = ChatOpenAI(
                     name="Agent",
                     model_name=model,
-                    temperature=temperature)        
+                    temperature=temperature,
+                    callbacks=[LLMMetricsCallback()])        
     def get_llm(self):
         return self.llm
\ No newline at end of file
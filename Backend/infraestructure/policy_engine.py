@@ -0,0 +1,208 @@
+from domain.policies import FRAUD_POLICIES
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple
+import operator
+import os
+import time
+import numpy as np
+import pandas as pd
+
+SIGNALS = ("amount_anomaly", "time_anomaly", "device_anomaly", "country_anomaly")
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+class CompiledPolicy(NamedTuple):
+    policy_id: str
+    version: str
+    rule: str
+    decision: str
+    check: Callable[[dict], bool]  # anomaly_signals de una transacción
+    check_frame: Callable[[pd.DataFrame], np.ndarray]  # salida de TransactionContextAgent.score_batch
+
+
+def _frame_column(signal: str, field: str) -> str:
+    # Columnas de score_batch: amount_anomaly (is_anomaly), amount_score, amount_ratio, ...
+    return signal if field == "is_anomaly" else signal.replace("_anomaly", f"_{field}")
+
+
+def _compile(predicate: dict) -> tuple:
+    """Predicado JSON -> (función sobre anomaly_signals, función sobre un DataFrame)."""
+    for combinator, reduce_frame in (("all", np.logical_and.reduce), ("any", np.logical_or.reduce)):
+        if combinator in predicate:
+            parts = [_compile(part) for part in predicate[combinator]]
+            if not parts:
+                raise ValueError(f"Empty '{combinator}' predicate")
+            checks = [check for check, _ in parts]
+            frame_checks = [check_frame for _, check_frame in parts]
+            reduce_scalar = all if combinator == "all" else any
+            return (
+                lambda signals: reduce_scalar(check(signals) for check in checks),
+                lambda frame: reduce_frame([check_frame(frame) for check_frame in frame_checks]),
+            )
+
+    signal, field, op_name, value = (predicate.get(key) for key in ("signal", "field", "op", "value"))
+    if signal not in SIGNALS:
+        raise ValueError(f"Unknown signal '{signal}'")
+    if op_name not in OPERATORS or not field:
+        raise ValueError(f"Invalid condition {predicate}")
+    op = OPERATORS[op_name]
+    column = _frame_column(signal, field)
+
+    def check(signals: dict) -> bool:
+        # Un campo ausente (p.ej. ratio sin perfil) nunca cumple la condición
+        actual = (signals.get(signal) or {}).get(field)
+        return actual is not None and bool(op(actual, value))
+
+    def check_frame(frame: pd.DataFrame) -> np.ndarray:
+        values = frame[column]
+        return np.asarray(op(values, value) & values.notna(), dtype=bool)
+
+    return check, check_frame
+
+
+class PolicyEngine:
+    """Evaluador determinista de las políticas con predicado ejecutable.
+
+    Los predicados se compilan una vez a closures al construir el motor; cada
+    evaluación son unas pocas comparaciones sobre anomaly_signals. Un match es
+    inequívoco cuando todas las políticas que cumplen imponen la misma
+    decisión: en modo enforce el grafo emite esa decisión directamente y se
+    salta debate y árbitro. Con decisiones en conflicto sigue el camino LLM.
+
+    POLICY_ENGINE_MODE: enforce (default), shadow (solo registra el match) u off.
+    """
+
+    def __init__(self, policies: List[dict] | None = None, mode: str | None = None):
+        self.mode = (mode or os.getenv("POLICY_ENGINE_MODE", "enforce")).lower()
+        source = FRAUD_POLICIES if policies is None else policies
+        self.policies: List[CompiledPolicy] = []
+        for policy in source:
+            if not policy.get("predicate") or not policy.get("decision"):
+                continue  # Solo texto: queda para el RAG
+            check, check_frame = _compile(policy["predicate"])
+            self.policies.append(CompiledPolicy(
+                policy["policy_id"], policy["version"], policy["rule"], policy["decision"], check, check_frame
+            ))
+
+        self.evaluations = 0
+        self.matches = 0
+        self.ambiguous = 0
+        self.short_circuits = 0
+        self.evaluation_seconds = 0.0
+        self.by_policy: Dict[str, int] = {policy.policy_id: 0 for policy in self.policies}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and bool(self.policies)
+
+    @property
+    def enforced(self) -> bool:
+        return self.mode == "enforce" and self.enabled
+
+    def evaluate(self, anomaly_signals: dict) -> dict:
+        """Políticas que cumplen y la decisión si el match es inequívoco."""
+        start = time.perf_counter()
+        matched = [policy for policy in self.policies if policy.check(anomaly_signals or {})]
+        elapsed = time.perf_counter() - start
+
+        decisions = {policy.decision for policy in matched}
+        unambiguous = len(decisions) == 1
+        self.evaluations += 1
+        self.evaluation_seconds += elapsed
+        if matched:
+            self.matches += 1
+            if not unambiguous:
+                self.ambiguous += 1
+        for policy in matched:
+            self.by_policy[policy.policy_id] += 1
+
+        chosen = matched[0] if unambiguous else None
+        return {
+            "matched": [
+                {"policy_id": policy.policy_id, "version": policy.version, "decision": policy.decision}
+                for policy in matched
+            ],
+            "decision": chosen.decision if chosen else None,
+            "policy_id": chosen.policy_id if chosen else None,
+            "version": chosen.version if chosen else None,
+            "enforced": bool(chosen) and self.enforced,
+            "mode": self.mode,
+            "evaluation_us": round(elapsed * 1e6, 1),
+        }
+
+    def decide(self, state) -> Dict[str, Any]:
+        """Nodo del grafo: decisión impuesta por la política (sin LLM)."""
+        match = state["policy_match"]
+        policy = next(policy for policy in self.policies if policy.policy_id == match["policy_id"])
+        self.short_circuits += 1
+        decision = {
+            "value": policy.decision,
+            "chain_of_thought": f"Política {policy.policy_id} (versión {policy.version}): {policy.rule}",
+            "confidence": 1.0
+        }
+        agent_decision = {
+            "agent_name": "policy_engine",
+            "status": "completed",
+            "execution_time": datetime.utcnow().isoformat() + "Z",
+            "decision": policy.decision,
+            "policy_id": policy.policy_id,
+            "policy_version": policy.version,
+            "matched_policies": [item["policy_id"] for item in match["matched"]],
+            "evaluation_us": match["evaluation_us"],
+        }
+        return {
+            "decision": decision,
+            "agent_audit": [agent_decision],
+            "need_human_review": policy.decision == "ESCALATE_TO_HUMAN"
+        }
+
+    def evaluate_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """evaluate vectorizado sobre la salida de score_batch (replay/backtesting)."""
+        rows = len(frame)
+        policy_ids = np.full(rows, None, dtype=object)
+        versions = np.full(rows, None, dtype=object)
+        matched_ids = np.full(rows, "", dtype=object)
+        decision_masks: Dict[str, np.ndarray] = {}
+        for policy in self.policies:
+            mask = policy.check_frame(frame)
+            # La primera política que cumple es la elegida, como en evaluate
+            first = mask & pd.isna(policy_ids)
+            policy_ids[first] = policy.policy_id
+            versions[first] = policy.version
+            matched_ids[mask] = np.where(matched_ids[mask] == "", policy.policy_id, matched_ids[mask] + "," + policy.policy_id)
+            decision_masks[policy.decision] = decision_masks.get(policy.decision, np.zeros(rows, dtype=bool)) | mask
+
+        decision = np.full(rows, None, dtype=object)
+        distinct = np.zeros(rows, dtype=int)
+        for value, mask in decision_masks.items():
+            decision[mask] = value
+            distinct += mask
+        unambiguous = distinct == 1
+        decision[~unambiguous] = None
+        policy_ids[~unambiguous] = None
+        versions[~unambiguous] = None
+        return pd.DataFrame({
+            "policy_matches": matched_ids,
+            "policy_id": policy_ids,
+            "policy_version": versions,
+            "policy_decision": decision,
+        }, index=frame.index)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "policies": len(self.policies),
+            "evaluations": self.evaluations,
+            "matches": self.matches,
+            "ambiguous": self.ambiguous,
+            "short_circuits": self.short_circuits,
+            "avg_evaluation_us": round(self.evaluation_seconds / self.evaluations * 1e6, 2) if self.evaluations else 0.0,
+            "by_policy": dict(self.by_policy),
+        }
@@ -0,0 +1,163 @@
+from qdrant_client import QdrantClient
+from infraestructure.metrics import observe_external
+from typing import Any, Dict, List, NamedTuple, Optional
+import asyncio
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+
+class IndexedPolicy(NamedTuple):
+    # Misma forma que los ScoredPoint de Qdrant que consume el agente RAG
+    score: float
+    payload: Dict[str, Any]
+
+
+class InMemoryPolicyIndex:
+    """Snapshot en memoria de la colección de políticas.
+
+    Qdrant sigue siendo la fuente de verdad: los vectores y payloads se copian
+    a una matriz NumPy contigua y normalizada, y el top-k se resuelve con un
+    único producto matricial (equivalente a la distancia COSINE de Qdrant).
+    El snapshot se reconstruye cuando cambia el contenido de la colección
+    (payloads o vectores).
+    """
+
+    def __init__(self, qdrant_client: QdrantClient, collection_name: str, refresh_interval_seconds: float | None = None):
+        self.qdrant_client = qdrant_client
+        self.collection_name = collection_name
+        if refresh_interval_seconds is None:
+            refresh_interval_seconds = float(os.getenv("POLICY_INDEX_REFRESH_SECONDS", "60"))
+        self.refresh_interval_seconds = refresh_interval_seconds
+
+        self._matrix: Optional[np.ndarray] = None
+        self._payloads: List[Dict[str, Any]] = []
+        self.version: Optional[str] = None
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+        self.loaded_at: Optional[float] = None
+        self.reload_count = 0
+
+    @observe_external("qdrant", "scroll")
+    def _scroll(self, with_vectors: bool) -> list:
+        points = []
+        offset = None
+        while True:
+            batch, offset = self.qdrant_client.scroll(
+                collection_name=self.collection_name,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=with_vectors
+            )
+            points.extend(batch)
+            if offset is None:
+                return points
+
+    @staticmethod
+    def _vector(point) -> list:
+        vector = point.vector
+        if isinstance(vector, dict):
+            # Colecciones con vectores nombrados: se usa el primero
+            vector = next(iter(vector.values()))
+        return vector
+
+    @classmethod
+    def _fingerprint(cls, points: list) -> str:
+        # Versión de la colección: id + payload completo + vector de cada punto, así un
+        # cambio de texto o un re-embedding sin subir `version` también recarga el índice
+        parts = []
+        for point in points:
+            digest = hashlib.sha256(json.dumps(point.payload or {}, sort_keys=True, default=str).encode("utf-8"))
+            vector = cls._vector(point)
+            if vector is not None:
+                digest.update(np.asarray(vector, dtype=np.float32).tobytes())
+            parts.append(f"{point.id}:{digest.hexdigest()}")
+        return hashlib.sha256("|".join(sorted(parts)).encode("utf-8")).hexdigest()[:16]
+
+    def collection_version(self) -> str:
+        return self._fingerprint(self._scroll(with_vectors=True))
+
+    def load(self) -> None:
+        start = time.perf_counter()
+        points = self._scroll(with_vectors=True)
+
+        vectors = []
+        payloads = []
+        for point in points:
+            vectors.append(self._vector(point))
+            payloads.append(point.payload or {})
+
+        if vectors:
+            matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        # Swap atómico del snapshot
+        self._matrix = matrix
+        self._payloads = payloads
+        self.version = self._fingerprint(points)
+        self.loaded_at = time.time()
+        self.reload_count += 1
+        print(f"[RAG] In-memory index loaded: {len(payloads)} policies, version {self.version}, "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    async def warm_up(self) -> None:
+        # Carga inicial en el arranque: el primer request no paga el scroll de Qdrant
+        async with self._lock:
+            if self._matrix is None:
+                await asyncio.to_thread(self.load)
+                self._last_check = time.monotonic()
+
+    async def _refresh_if_needed(self) -> None:
+        now = time.monotonic()
+        if self._matrix is not None and now - self._last_check < self.refresh_interval_seconds:
+            return
+
+        async with self._lock:
+            if self._matrix is not None and time.monotonic() - self._last_check < self.refresh_interval_seconds:
+                return
+            self._last_check = time.monotonic()
+            if self._matrix is None:
+                await asyncio.to_thread(self.load)
+                return
+            try:
+                version = await asyncio.to_thread(self.collection_version)
+                if version != self.version:
+                    print(f"[RAG] Policy collection changed ({self.version} -> {version}), reloading")
+                    await asyncio.to_thread(self.load)
+            except Exception as e:
+                # Se sigue sirviendo el snapshot anterior
+                print(f"[RAG] Could not check policy collection version: {e}")
+
+    async def search(self, query_vector: List[float], top_k: int) -> List[IndexedPolicy]:
+        await self._refresh_if_needed()
+        matrix = self._matrix
+        payloads = self._payloads
+        if matrix is None or not len(payloads):
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = matrix @ (query / norm)
+
+        k = min(top_k, len(payloads))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [IndexedPolicy(score=float(scores[i]), payload=payloads[i]) for i in top]
+
+    def stats(self) -> dict:
+        return {
+            "policies": len(self._payloads),
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "reload_count": self.reload_count,
+            "matrix_bytes": int(self._matrix.nbytes) if self._matrix is not None else 0,
+        }
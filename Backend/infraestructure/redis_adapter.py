@@ -1,5 +1,11 @@
-import redis
+import asyncio
+import random
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
 import os
+import base64
+import time
+from infraestructure.metrics import observe_external
 import json
 from datetime import datetime
 
@@ -13,55 +19,209 @@ class RedisAdapter:
     def __init__(self):
         host = os.getenv("REDIS_HOST", "redis")
         port = int(os.getenv("REDIS_PORT", 6380))
-        self.r = redis.Redis(host=host, port=port, db=0, decode_responses=True)
+        # Pool compartido por los handlers de FastAPI y los nodos del grafo
+        self.pool = aioredis.ConnectionPool(
+            host=host,
+            port=port,
+            db=0,
+            decode_responses=True,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "2.0")),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "2.0")),
+        )
+        self.r = aioredis.Redis(connection_pool=self.pool)
         self.HITL_QUEUE_KEY = "hitl:queue"
         self.HITL_DATA_PREFIX = "hitl:data:"
+        self.PROFILE_STATE_PREFIX = "profile:state:"
+        self.PROFILE_VIEW_PREFIX = "profile:view:"
+        self.PROFILE_UPDATE_MAX_RETRIES = 20
+        self.PROFILE_UPDATE_BACKOFF = 0.002
+
+    async def health(self) -> dict:
+        start = time.perf_counter()
+        try:
+            await self.r.ping()
+            healthy, error = True, None
+        except Exception as e:
+            healthy, error = False, str(e)
+        return {
+            "healthy": healthy,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            "error": error,
+            "max_connections": self.pool.max_connections,
+        }
+
+    async def close(self) -> None:
+        await self.r.aclose()
+        await self.pool.disconnect()
+
+    @observe_external("redis", "exists")
+    async def exists(self, key):
+        return await self.r.exists(key)
+
+    @observe_external("redis", "get")
+    async def get(self, key):
+        return await self.r.get(key)
+
+    @observe_external("redis", "set")
+    async def set(self, key, value, ex=None):
+        await self.r.set(key, value, ex=ex)
+
+    @observe_external("redis", "delete")
+    async def delete(self, *keys):
+        return await self.r.delete(*keys)
 
-    def exists(self, key):
-        return self.r.exists(key)
-    
-    def set(self, key, value, ex=None):
-        self.r.set(key, value, ex=ex)
-    
     # HITL Queue Methods
-    def add_to_hitl_queue(self, transaction_id: str, transaction_data: dict):
-        # Guardar datos completos en un hash
-        print("Adding to HITL queue:", transaction_id, transaction_data)
+    # La cola es un sorted set (score = epoch ms de escalamiento): ZADD/ZREM en O(log n)
+    @observe_external("redis", "migrate_legacy_hitl_queue")
+    async def migrate_legacy_hitl_queue(self) -> int:
+        # Versiones anteriores guardaban la cola como lista (LPUSH, más reciente primero)
+        if await self.r.type(self.HITL_QUEUE_KEY) != "list":
+            return 0
+        legacy_ids = await self.r.lrange(self.HITL_QUEUE_KEY, 0, -1)
+        now_ms = datetime.now().timestamp() * 1000
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.delete(self.HITL_QUEUE_KEY)
+            if legacy_ids:
+                # Se preserva el orden: el primero de la lista es el más reciente
+                pipe.zadd(self.HITL_QUEUE_KEY, {tid: now_ms - idx for idx, tid in enumerate(legacy_ids)})
+            await pipe.execute()
+        print(f"Migrated {len(legacy_ids)} HITL entries from list to sorted set")
+        return len(legacy_ids)
+
+    @observe_external("redis", "add_to_hitl_queue")
+    async def add_to_hitl_queue(self, transaction_id: str, transaction_data: dict):
         data_key = f"{self.HITL_DATA_PREFIX}{transaction_id}"
-        print("Storing data key:", data_key)
-        self.r.set(data_key, json.dumps(transaction_data, cls=DateTimeEncoder))
-        # Agregar transaction_id a la cola
-        self.r.lpush(self.HITL_QUEUE_KEY, transaction_id)
+        score = datetime.now().timestamp() * 1000
+        # MULTI/EXEC: el item de la cola y su data key se crean juntos
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.set(data_key, json.dumps(transaction_data, cls=DateTimeEncoder))
+            pipe.zadd(self.HITL_QUEUE_KEY, {transaction_id: score}, nx=True)
+            await pipe.execute()
         print(f"Transaction {transaction_id} added to HITL queue")
-        
-    def get_pending_hitl_transactions(self) -> list:
-        return self.r.lrange(self.HITL_QUEUE_KEY, 0, -1)
-    
-    def get_hitl_transaction(self, transaction_id: str) -> dict:
+
+    @staticmethod
+    def _encode_cursor(score: float, member: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([score, member]).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        score, member = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), member
+
+    @observe_external("redis", "get_pending_hitl_page")
+    async def get_pending_hitl_page(self, cursor: str = None, limit: int = 50) -> dict:
+        """Página de pendientes, más recientes primero, y largo total en un solo round trip."""
+        if cursor:
+            max_score, last_member = self._decode_cursor(cursor)
+        else:
+            max_score, last_member = "+inf", None
+
+        async with self.r.pipeline(transaction=False) as pipe:
+            if cursor:
+                # Empates exactos: todos los miembros con el score del cursor, y después los de score menor
+                pipe.zrangebyscore(self.HITL_QUEUE_KEY, max_score, max_score, withscores=True)
+                pipe.zrevrangebyscore(self.HITL_QUEUE_KEY, f"({max_score!r}", "-inf", start=0, num=limit + 1, withscores=True)
+            else:
+                pipe.zrevrangebyscore(self.HITL_QUEUE_KEY, max_score, "-inf", start=0, num=limit + 1, withscores=True)
+            pipe.zcard(self.HITL_QUEUE_KEY)
+            results = await pipe.execute()
+
+        if cursor:
+            ties, lower, queue_length = results
+            # En empates el orden descendente es por miembro descendente: siguen los menores al del cursor
+            remaining_ties = [(m, sc) for m, sc in reversed(ties) if m < last_member]
+            entries = (remaining_ties + lower)[:limit + 1]
+        else:
+            entries, queue_length = results
+
+        page = entries[:limit]
+        next_cursor = self._encode_cursor(page[-1][1], page[-1][0]) if len(entries) > limit else None
+        return {
+            "transaction_ids": [member for member, _ in page],
+            "next_cursor": next_cursor,
+            "queue_length": queue_length,
+        }
+
+    async def get_pending_hitl_transactions(self, cursor: str = None, limit: int = 50) -> list:
+        return (await self.get_pending_hitl_page(cursor, limit))["transaction_ids"]
+
+    @observe_external("redis", "get_hitl_transaction")
+    async def get_hitl_transaction(self, transaction_id: str) -> dict:
         data_key = f"{self.HITL_DATA_PREFIX}{transaction_id}"
-        data = self.r.get(data_key)
+        data = await self.r.get(data_key)
         return json.loads(data) if data else None
-    
-    def update_hitl_decision(self, transaction_id: str, new_decision: str, reviewer_notes: str = "") -> bool:
+
+    @observe_external("redis", "update_hitl_decision")
+    async def update_hitl_decision(self, transaction_id: str, new_decision: str, reviewer_notes: str = "") -> bool:
         data_key = f"{self.HITL_DATA_PREFIX}{transaction_id}"
-        data = self.get_hitl_transaction(transaction_id)
-        
-        if not data:
+        data = await self.get_hitl_transaction(transaction_id)
+
+        if not data or data.get('reviewed_by_human'):
             return False
-        
+
         # Actualizar decisión
         data['decision'] = new_decision
         data['reviewed_by_human'] = True
         data['reviewer_notes'] = reviewer_notes
         data['reviewed_at'] = str(datetime.now())
-        
-        # Guardar actualización
-        self.r.set(data_key, json.dumps(data, cls=DateTimeEncoder))
-        
-        # Remover de la cola
-        self.r.lrem(self.HITL_QUEUE_KEY, 0, transaction_id)
-        
+
+        # Guardar actualización y remover de la cola en una sola transacción
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.set(data_key, json.dumps(data, cls=DateTimeEncoder))
+            pipe.zrem(self.HITL_QUEUE_KEY, transaction_id)
+            await pipe.execute()
+
         return True
-    
-    def get_hitl_queue_length(self) -> int:
-        return self.r.llen(self.HITL_QUEUE_KEY)
\ No newline at end of file
+
+    @observe_external("redis", "cache_hitl_summary")
+    async def cache_hitl_summary(self, transaction_id: str, summary: dict) -> None:
+        # Completa entradas antiguas (solo transaction_id) con el resumen leído de DynamoDB
+        data_key = f"{self.HITL_DATA_PREFIX}{transaction_id}"
+        data = await self.get_hitl_transaction(transaction_id) or {'transaction_id': transaction_id}
+        data['summary'] = summary
+        await self.r.set(data_key, json.dumps(data, cls=DateTimeEncoder))
+
+    @observe_external("redis", "get_hitl_queue_length")
+    async def get_hitl_queue_length(self) -> int:
+        return await self.r.zcard(self.HITL_QUEUE_KEY)
+
+    # Perfiles aprendidos (ProfileBuilder)
+    # El estado incremental y la vista materializada viven en keys separadas:
+    # el request path solo lee la vista
+
+    @observe_external("redis", "update_customer_profile")
+    async def update_customer_profile(self, customer_id: str, apply) -> dict:
+        """Read-modify-write optimista (WATCH/MULTI) del perfil de un cliente.
+
+        apply(state | None) -> (state, view). Si otro worker modifica el
+        estado entre la lectura y el EXEC, se reintenta con el valor nuevo.
+        """
+        state_key = f"{self.PROFILE_STATE_PREFIX}{customer_id}"
+        view_key = f"{self.PROFILE_VIEW_PREFIX}{customer_id}"
+        conflicts = 0
+        async with self.r.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(state_key)
+                    raw = await pipe.get(state_key)
+                    state, view = apply(json.loads(raw) if raw else None)
+                    pipe.multi()
+                    pipe.set(state_key, json.dumps(state))
+                    pipe.set(view_key, json.dumps(view))
+                    await pipe.execute()
+                    return {"view": view, "conflicts": conflicts}
+                except WatchError:
+                    conflicts += 1
+                    if conflicts >= self.PROFILE_UPDATE_MAX_RETRIES:
+                        raise
+                    # Backoff con jitter para que los workers en conflicto no reintenten a la vez
+                    await asyncio.sleep(random.uniform(0, self.PROFILE_UPDATE_BACKOFF * conflicts))
+
+    @observe_external("redis", "get_customer_profiles")
+    async def get_customer_profiles(self, customer_ids: list) -> dict:
+        if not customer_ids:
+            return {}
+        views = await self.r.mget([f"{self.PROFILE_VIEW_PREFIX}{customer_id}" for customer_id in customer_ids])
+        return {customer_id: json.loads(view) for customer_id, view in zip(customer_ids, views) if view}
@@ -0,0 +1,108 @@
+from typing import Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import json
+import os
+
+
+class ThreatEvidenceCache:
+    """Cache de evidencia de amenazas externas compartido vía Redis.
+
+    La clave es la firma normalizada (país, moneda, anomalías activas). Los
+    misses concurrentes de una misma firma se deduplican (single-flight):
+    solo el primero consulta al proveedor y el resto espera su resultado.
+    """
+
+    def __init__(self, redis_adapter=None, ttl_seconds: int | None = None, empty_ttl_seconds: int | None = None):
+        self.redis = redis_adapter
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("THREAT_CACHE_TTL", "3600"))
+        self.empty_ttl_seconds = (empty_ttl_seconds if empty_ttl_seconds is not None
+                                  else int(os.getenv("THREAT_CACHE_EMPTY_TTL", "60")))
+        self.key_prefix = "threat:"
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.redis_errors = 0
+
+    def signature(self, country: str, currency: str, anomaly_flags) -> str:
+        flags = ",".join(sorted(anomaly_flags)) or "none"
+        return f"{self.key_prefix}{(country or '').strip().upper()}:{(currency or '').strip().upper()}:{flags}"
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[List[dict]]]) -> Tuple[List[dict], str]:
+        cached = await self._read(key)
+        if cached is not None:
+            self.hits += 1
+            return cached, "hit"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(inflight), "shared"
+            except asyncio.CancelledError:
+                # Si se canceló el líder (no este waiter), se reintenta la consulta
+                if not inflight.cancelled():
+                    raise
+                return await self.get_or_fetch(key, fetch)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.misses += 1
+        try:
+            evidence = await fetch()
+            future.set_result(evidence)
+            # La escritura ocurre antes de soltar el in-flight: un miss concurrente
+            # en ese intervalo espera este resultado en vez de consultar de nuevo
+            if not any(ev.get("url") == "error" for ev in evidence):  # No se cachean búsquedas fallidas
+                await self._write(key, evidence)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                # Evita "Future exception was never retrieved" si nadie más esperaba
+                future.exception()
+            raise
+        finally:
+            # Líder cancelado (CancelledError no es Exception): los waiters no quedan colgados
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+        return evidence, "miss"
+
+    async def _read(self, key: str):
+        if self.redis is None:
+            return None
+        try:
+            payload = await self.redis.get(key)
+            return json.loads(payload) if payload else None
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"[THREAT CACHE] Redis read failed: {e}")
+            return None
+
+    async def _write(self, key: str, evidence: List[dict]) -> None:
+        if self.redis is None:
+            return
+        # Sin evidencia (el modelo no usó la herramienta): TTL corto para no ocultar inteligencia real
+        ttl = self.ttl_seconds if evidence else self.empty_ttl_seconds
+        if ttl <= 0:  # TTL 0 desactiva el cache de ese tipo de resultado
+            return
+        try:
+            await self.redis.set(key, json.dumps(evidence, ensure_ascii=False), ex=ttl)
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"[THREAT CACHE] Redis write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "empty_ttl_seconds": self.empty_ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_inflight": self.shared,
+            "inflight": len(self._inflight),
+            "redis_errors": self.redis_errors,
+            "hit_rate": round((self.hits + self.shared) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+import asyncio
+import json
+import os
+import threading
+import time
+
+# Marca de "no existe" para el cache negativo
+_NOT_FOUND = "__not_found__"
+
+
+class TransactionCache:
+    """Cache read-through de GET /transaction/{id} en dos niveles.
+
+    Nivel 1: dict LRU en proceso con TTL corto (absorbe el polling de la UI).
+    Nivel 2: Redis compartido entre réplicas con TTL mayor. Los IDs inexistentes
+    se cachean con un TTL propio más corto. DynamoService notifica cada
+    escritura y la entrada se invalida en ambos niveles.
+    """
+
+    def __init__(self, redis_adapter=None, local_ttl_seconds: float | None = None,
+                 redis_ttl_seconds: int | None = None, negative_ttl_seconds: float | None = None,
+                 max_entries: int | None = None):
+        self.redis = redis_adapter
+        self.local_ttl_seconds = (local_ttl_seconds if local_ttl_seconds is not None
+                                  else float(os.getenv("TRANSACTION_CACHE_LOCAL_TTL", "2")))
+        self.redis_ttl_seconds = (redis_ttl_seconds if redis_ttl_seconds is not None
+                                  else int(os.getenv("TRANSACTION_CACHE_REDIS_TTL", "30")))
+        self.negative_ttl_seconds = (negative_ttl_seconds if negative_ttl_seconds is not None
+                                     else float(os.getenv("TRANSACTION_CACHE_NEGATIVE_TTL", "5")))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("TRANSACTION_CACHE_SIZE", "2048"))
+        self.key_prefix = "txn:"
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Las invalidaciones llegan desde threads de escritura (to_thread/batch_writer)
+        self._lock = threading.Lock()
+        # Solo los IDs con lecturas en curso: generación y cantidad de lecturas (se borran al terminar)
+        self._generations: Dict[str, int] = {}
+        self._loading: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.hits_memory = 0
+        self.hits_redis = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.redis_errors = 0
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Fija el event loop en el que se borran las entradas de Redis (hook de startup)."""
+        self._loop = loop or asyncio.get_running_loop()
+
+    async def get_or_load(self, transaction_id: str, load: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        found, value = self._get_local(transaction_id)
+        if found:
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits_memory += 1
+            return value
+
+        found, value = await self._get_redis(transaction_id)
+        if found:
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits_redis += 1
+            self._store_local(transaction_id, value)
+            return value
+
+        self.misses += 1
+        with self._lock:
+            self._loading[transaction_id] = self._loading.get(transaction_id, 0) + 1
+            generation = self._generations.setdefault(transaction_id, 0)
+        try:
+            value = await load()
+        finally:
+            with self._lock:
+                # Si hubo una escritura durante la lectura, el resultado puede estar obsoleto
+                fresh = self._generations.get(transaction_id) == generation
+                self._loading[transaction_id] -= 1
+                if not self._loading[transaction_id]:
+                    del self._loading[transaction_id]
+                    del self._generations[transaction_id]
+        if fresh:
+            self._store_local(transaction_id, value)
+            await self._set_redis(transaction_id, value)
+        return value
+
+    def invalidate(self, transaction_ids: Iterable[str]) -> None:
+        """Listener de escrituras de DynamoService; se puede llamar desde cualquier thread."""
+        ids = [tid for tid in transaction_ids if tid]
+        if not ids:
+            return
+        with self._lock:
+            for tid in ids:
+                self._entries.pop(tid, None)
+                if tid in self._generations:
+                    self._generations[tid] += 1
+            self.invalidations += len(ids)
+
+        if self.redis is None:
+            return
+        if self._loop is None:
+            # Sin loop la entrada compartida quedaría obsoleta en las demás réplicas hasta su TTL
+            raise RuntimeError("TransactionCache.start() must be called before writes are invalidated")
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._delete_redis(ids), self._loop)
+
+    def _get_local(self, transaction_id: str):
+        with self._lock:
+            entry = self._entries.get(transaction_id)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[transaction_id]
+                return False, None
+            self._entries.move_to_end(transaction_id)
+            return True, value
+
+    def _store_local(self, transaction_id: str, value: Optional[Dict[str, Any]]) -> None:
+        ttl = self.local_ttl_seconds if value is not None else min(self.local_ttl_seconds, self.negative_ttl_seconds)
+        if ttl <= 0:  # TTL 0 desactiva ese tipo de entrada
+            return
+        with self._lock:
+            self._entries[transaction_id] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(transaction_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _get_redis(self, transaction_id: str):
+        if self.redis is None:
+            return False, None
+        try:
+            payload = await self.redis.get(f"{self.key_prefix}{transaction_id}")
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"[TRANSACTION CACHE] Redis read failed: {e}")
+            return False, None
+        if payload is None:
+            return False, None
+        if payload == _NOT_FOUND:
+            return True, None
+        return True, json.loads(payload)
+
+    async def _set_redis(self, transaction_id: str, value: Optional[Dict[str, Any]]) -> None:
+        ttl = self.redis_ttl_seconds if value is not None else self.negative_ttl_seconds
+        if self.redis is None or ttl <= 0:
+            return
+        try:
+            if value is None:
+                await self.redis.set(f"{self.key_prefix}{transaction_id}", _NOT_FOUND, ex=max(1, int(self.negative_ttl_seconds)))
+            else:
+                await self.redis.set(f"{self.key_prefix}{transaction_id}", json.dumps(value, ensure_ascii=False), ex=self.redis_ttl_seconds)
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"[TRANSACTION CACHE] Redis write failed: {e}")
+
+    async def _delete_redis(self, transaction_ids: list) -> None:
+        try:
+            await self.redis.delete(*[f"{self.key_prefix}{tid}" for tid in transaction_ids])
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"[TRANSACTION CACHE] Redis invalidation failed: {e}")
+
+    def stats(self) -> dict:
+        hits = self.hits_memory + self.hits_redis + self.negative_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "local_ttl_seconds": self.local_ttl_seconds,
+            "redis_ttl_seconds": self.redis_ttl_seconds,
+            "negative_ttl_seconds": self.negative_ttl_seconds,
+            "hits_memory": self.hits_memory,
+            "hits_redis": self.hits_redis,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "redis_errors": self.redis_errors,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
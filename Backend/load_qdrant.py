@@ -2,23 +2,14 @@ import os
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
 from openai import OpenAI
+from domain.policies import FRAUD_POLICIES
 
 QDRANT_URL = os.getenv("QDRANT_URL", "http://qdrant:6333")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 COLLECTION_NAME = "fraud_policies"
 
-policies = [
-    {
-        "policy_id": "FP-01",
-        "rule": "Monto > 3x promedio habitual y horario fuera de rango → CHALLENGE",
-        "version": "2025.1"
-    },
-    {
-        "policy_id": "FP-02",
-        "rule": "Transacción internacional y dispositivo nuevo → ESCALATE_TO_HUMAN",
-        "version": "2025.1"
-    }
-]
+# Texto de cada política (domain/policies.py); predicado y decisión los lee PolicyEngine de la misma fuente
+policies = FRAUD_POLICIES
 
 def get_embedding(text: str) -> list[float]:
     client = OpenAI(api_key=OPENAI_API_KEY)
@@ -1,14 +1,22 @@
+import asyncio
 import json
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import Optional
 import os
 from infraestructure.langgraph_init import LangGraphInit
 from infraestructure.openai_client import OpenAIClient
 from infraestructure.redis_adapter import RedisAdapter
 from infraestructure.aws.dynamo import DynamoService
+from infraestructure.aws.dynamo_writer import DynamoWriteBehind
+from infraestructure.metrics import metrics
+from infraestructure.transaction_cache import TransactionCache
 from domain.schema.schemas import TransactionRequest, UsualBehavior, AgentState, HITLReviewRequest
+from application.profile_builder import ProfileBuilder
 from application.search_usual import SearchUsual
+from application.batch_analysis import BatchAnalysis
 from datetime import datetime
 
 
@@ -26,22 +34,73 @@ app.add_middleware(
 # Inicializar grafo
 try:
     redis = RedisAdapter()
-    search_usual = SearchUsual()
+    # Perfiles aprendidos de las decisiones finalizadas; SearchUsual los sirve ya materializados
+    profile_builder = ProfileBuilder(redis)
+    search_usual = SearchUsual(profile_builder=profile_builder)
     dynamo_service = DynamoService()
+    dynamo_writer = DynamoWriteBehind(dynamo_service)
+    transaction_cache = TransactionCache(redis)
+    dynamo_service.add_write_listener(transaction_cache.invalidate)
     openai_client = OpenAIClient()
     llm = openai_client.get_llm()
     graph = LangGraphInit(llm, redis)
+    batch_analysis = BatchAnalysis(graph, search_usual, dynamo_writer, profile_builder=profile_builder)
+    
+    # Stats existentes expuestos también como gauges en /metrics
+    metrics.register_stats("dynamo_write_behind", dynamo_writer.stats)
+    metrics.register_stats("profile_store", search_usual.profile_store.stats)
+    metrics.register_stats("profile_builder", profile_builder.stats)
+    metrics.register_stats("embedding_cache", graph.policy_rag_agent.embedding_cache.stats)
+    metrics.register_stats("threat_cache", graph.threat_agent.threat_cache.stats)
+    metrics.register_stats("transaction_cache", transaction_cache.stats)
+    metrics.register_stats("llm_cache", graph.llm_cache.stats)
+    metrics.register_stats("context_builder", graph.context_builder.stats)
+    metrics.register_stats("policy_engine", graph.policy_engine.stats)
 except Exception as e:
     print(f"Error inicializando grafo: {e}")
     graph = None
 
 
+@app.on_event("startup")
+async def start_background_workers():
+    try:
+        await redis.migrate_legacy_hitl_queue()
+    except Exception as e:
+        print(f"Error migrando cola HITL: {e}")
+    try:
+        # POLICY_SEARCH_BACKEND=memory: el snapshot de políticas se arma antes del primer request
+        if graph is not None and graph.policy_rag_agent.policy_index is not None:
+            await graph.policy_rag_agent.policy_index.warm_up()
+    except Exception as e:
+        print(f"Error cargando índice de políticas: {e}")
+    try:
+        transaction_cache.start()
+        dynamo_writer.start()
+        profile_builder.start()
+    except Exception as e:
+        print(f"Error iniciando workers: {e}")
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    # Flush de las escrituras pendientes antes de apagar
+    try:
+        await dynamo_writer.stop()
+        await profile_builder.stop()
+    except Exception as e:
+        print(f"Error deteniendo workers: {e}")
+    try:
+        await redis.close()
+    except Exception as e:
+        print(f"Error cerrando conexiones Redis: {e}")
+
+
 @app.post("/analize")
 async def chat(request: TransactionRequest):
     try:
         print("-----"*25)
         # Conseguir comportamiento usual del cliente
-        usual_behavior = search_usual.get_usual_behavior_by_customer_id(request.customer_id)
+        usual_behavior = await search_usual.resolve_usual_behavior(request.customer_id)
 
         # Crear estado inicial
         state = AgentState(
@@ -55,9 +114,12 @@ async def chat(request: TransactionRequest):
         result = await graph.runnable.ainvoke(input=state)
         
         try:
-            dynamo_service.save_transaction(result)
+            # Write-behind: la respuesta no espera a DynamoDB
+            dynamo_writer.enqueue(result)
         except Exception as e:
-            print(f"Error guardando en DynamoDB: {str(e)}")
+            print(f"Error encolando en DynamoDB: {str(e)}")
+        # Decisión final sin revisión humana: actualiza el perfil aprendido en background
+        profile_builder.observe_result(result)
         
         return result
     
@@ -68,16 +130,55 @@ async def chat(request: TransactionRequest):
             "message": str(e)
         }
 
+
+async def _iter_ndjson(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+@app.post("/analize/batch")
+async def analyze_batch(request: Request, concurrency: Optional[int] = None):
+    try:
+        if graph is None:
+            return {"status": "error", "message": "Grafo no inicializado"}
+        
+        # Acepta una lista JSON, {"transactions": [...]} o NDJSON (una transacción por línea)
+        if "ndjson" in request.headers.get("content-type", ""):
+            # NDJSON se parsea línea a línea mientras llega, sin cargar el cuerpo completo
+            transactions = [TransactionRequest(**item) async for item in _iter_ndjson(request)]
+        else:
+            payload = json.loads(await request.body())
+            if isinstance(payload, dict):
+                payload = payload.get("transactions", [])
+            transactions = [TransactionRequest(**item) for item in payload]
+    except Exception as e:
+        return {"status": "error", "message": f"Invalid batch payload: {str(e)}"}
+    
+    async def stream_results():
+        async for result in batch_analysis.run(transactions, concurrency=concurrency):
+            yield json.dumps(jsonable_encoder(result), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @app.get("/hitl/pending")
-async def get_pending_hitl():
+async def get_pending_hitl(cursor: Optional[str] = None, limit: int = 50):
     try:
-        pending_ids = redis.get_pending_hitl_transactions()
-        queue_length = redis.get_hitl_queue_length()
+        # Página y largo de la cola en un solo round trip a Redis
+        page = await redis.get_pending_hitl_page(cursor=cursor, limit=max(1, min(limit, 500)))
         
         return {
             "status": "success",
-            "queue_length": queue_length,
-            "pending_transactions": pending_ids
+            "queue_length": page["queue_length"],
+            "pending_transactions": page["transaction_ids"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -86,7 +187,7 @@ async def get_pending_hitl():
 @app.get("/hitl/{transaction_id}")
 async def get_hitl_transaction(transaction_id: str):
     try:
-        transaction_in_queue = redis.get_hitl_transaction(transaction_id)
+        transaction_in_queue = await redis.get_hitl_transaction(transaction_id)
         
         if not transaction_in_queue:
             return {
@@ -94,8 +195,12 @@ async def get_hitl_transaction(transaction_id: str):
                 "message": f"Transaction {transaction_id} not found in HITL queue"
             }
         
-        transaction_data = dynamo_service.get_transaction(transaction_id)
-        print("Transaction data retrieved:", transaction_data)
+        # Read-through: el resumen se guarda al escalar; solo las entradas antiguas van a DynamoDB
+        transaction_data = transaction_in_queue.get("summary")
+        if transaction_data is None:
+            transaction_data = await asyncio.to_thread(dynamo_service.get_transaction, transaction_id)
+            if transaction_data:
+                await redis.cache_hitl_summary(transaction_id, transaction_data)
         
         return {
             "status": "success",
@@ -115,51 +220,70 @@ async def review_transaction(transaction_id: str, review: HITLReviewRequest):
                 "message": f"Invalid decision. Must be one of: {valid_decisions}"
             }
         
-        success = redis.update_hitl_decision(
-            transaction_id,
-            review.decision,
-            review.reviewer_notes
-        )
-        
-        if not success:
+        pending = await redis.get_hitl_transaction(transaction_id)
+        if not pending or pending.get('reviewed_by_human'):
             return {
                 "status": "error",
                 "message": f"Transaction {transaction_id} not found or already reviewed"
             }
         
-        transaction_data = dynamo_service.get_transaction(transaction_id)
+        reviewed_at = datetime.utcnow().isoformat() + 'Z'
+        human_review_audit = {
+            "agent_name": "human_review",
+            "status": "completed",
+            "execution_time": reviewed_at,
+            "decision": review.decision,
+            "reviewer_notes": review.reviewer_notes
+        }
+        last_decision = {
+            'value': review.decision,
+            'decided_by': 'human',
+            'reviewer_notes': review.reviewer_notes,
+            'reviewed_at': reviewed_at
+        }
         
-        if transaction_data:
-            
-            human_review_audit = {
-                "agent_name": "human_review",
-                "status": "completed",
-                "execution_time": datetime.utcnow().isoformat() + 'Z',
-                "decision": review.decision,
-                "reviewer_notes": review.reviewer_notes
-            }
-            
-            agent_audit = transaction_data.get('agent_audit', [])
-            agent_audit.append(human_review_audit)
-            
-            updates = {
-                'last_decision': {
-                    'value': review.decision,
-                    'decided_by': 'human',
-                    'reviewer_notes': review.reviewer_notes,
-                    'reviewed_at': datetime.utcnow().isoformat() + 'Z'
-                },
-                'agent_audit': agent_audit,
-                'reviewed_by_human': True
+        # DynamoDB es el registro: el UpdateItem condicional va primero y decide entre revisiones
+        # concurrentes. Redis se marca solo después, así un fallo aquí se puede reintentar
+        try:
+            persisted = await asyncio.to_thread(
+                dynamo_service.append_human_review, transaction_id, human_review_audit, last_decision
+            )
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"Review of transaction {transaction_id} could not be persisted, retry: {str(e)}",
+                "persisted": False
             }
-            
-            dynamo_service.update_transaction(transaction_id, updates)
-            print(f"Transaction {transaction_id} updated with human review")
+        
+        if not persisted:
+            # Falló la condición: la transacción no está en DynamoDB, no fue escalada o ya fue revisada
+            record = await asyncio.to_thread(dynamo_service.get_transaction, transaction_id)
+            if record is None:
+                # El write-behind todavía no guardó la transacción: Redis queda intacto para reintentar
+                message = f"Transaction {transaction_id} not persisted yet, retry"
+            else:
+                previous = record.get('last_decision') or {}
+                # Un intento anterior persistió pero no llegó a Redis: se saca de la cola
+                if record.get('reviewed_by_human'):
+                    await redis.update_hitl_decision(transaction_id, previous.get('value'), previous.get('reviewer_notes', ''))
+                message = f"Transaction {transaction_id} not escalated or already reviewed"
+            return {"status": "error", "message": message, "persisted": False}
+        
+        try:
+            await redis.update_hitl_decision(transaction_id, review.decision, review.reviewer_notes)
+        except Exception as e:
+            # La decisión ya está persistida; el siguiente intento saca la entrada de la cola
+            print(f"Error updating HITL queue for {transaction_id}: {str(e)}")
+        
+        # La decisión humana es final: el perfil aprendido toma la transacción del resumen HITL
+        if review.decision in profile_builder.learn_decisions:
+            profile_builder.observe_review((pending.get("summary") or {}).get("transaction_request"), review.decision)
         
         return {
             "status": "success",
             "message": f"Transaction {transaction_id} reviewed successfully",
-            "decision": review.decision
+            "decision": review.decision,
+            "persisted": persisted
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -168,7 +292,11 @@ async def review_transaction(transaction_id: str, review: HITLReviewRequest):
 @app.get("/transaction/{transaction_id}")
 async def get_transaction(transaction_id: str):
     try:
-        transaction = dynamo_service.get_transaction(transaction_id)
+        # Read-through: memoria -> Redis -> DynamoDB; los not-found también se cachean
+        transaction = await transaction_cache.get_or_load(
+            transaction_id,
+            lambda: asyncio.to_thread(dynamo_service.get_transaction, transaction_id)
+        )
         
         if not transaction:
             return {
@@ -184,15 +312,88 @@ async def get_transaction(transaction_id: str):
         return {"status": "error", "message": str(e)}
 
 
+@app.get("/profiles/stats")
+async def get_profile_stats():
+    try:
+        return {
+            "status": "success",
+            "data": search_usual.profile_store.stats()
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/persistence/stats")
+async def get_persistence_stats():
+    try:
+        return {
+            "status": "success",
+            "data": dynamo_writer.stats()
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    try:
+        if graph is None:
+            return {"status": "error", "message": "Grafo no inicializado"}
+        return {
+            "status": "success",
+            "data": {
+                "embeddings": graph.policy_rag_agent.embedding_cache.stats(),
+                "threat_intel": graph.threat_agent.threat_cache.stats(),
+                "transactions": transaction_cache.stats(),
+                "llm_responses": {**graph.llm_cache.stats(), "agents": sorted(graph.llm_cache_agents)},
+                "policy_index": graph.policy_rag_agent.policy_index.stats() if graph.policy_rag_agent.policy_index else None
+            }
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+
+@app.get("/health")
+async def health():
+    # Chequeo de Redis con PING sobre el pool compartido
+    redis_health = await redis.health()
+    return {
+        "status": "success" if redis_health["healthy"] and graph is not None else "degraded",
+        "graph_initialized": graph is not None,
+        "redis": redis_health
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/transactions")
-async def get_all_transactions(limit: Optional[int] = None):
+async def get_all_transactions(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    need_human_review: Optional[bool] = None,
+    reviewed_by_human: Optional[bool] = None,
+    decision: Optional[str] = None
+):
     try:
-        transactions = dynamo_service.get_all_transactions(limit=limit)
+        # Listado paginado por cursor opaco sobre el GSI de saved_at (más recientes primero)
+        # boto3 es bloqueante (hasta varias queries al GSI): se ejecuta fuera del event loop
+        page = await asyncio.to_thread(
+            dynamo_service.list_transactions,
+            limit=max(1, min(limit, 500)),
+            cursor=cursor,
+            need_human_review=need_human_review,
+            reviewed_by_human=reviewed_by_human,
+            decision=decision
+        )
         
         return {
             "status": "success",
-            "count": len(transactions),
-            "data": transactions
+            "count": len(page["items"]),
+            "data": page["items"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         return {"status": "error", "message": str(e)}
\ No newline at end of file
@@ -11,6 +11,8 @@ const AllTransactions = () => {
   const [transactions, setTransactions] = useState([]);
   const [error, setError] = useState(null);
   const [limit, setLimit] = useState(50);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const fetchTransactions = async (isRefresh = false) => {
     if (isRefresh) {
@@ -24,6 +26,7 @@ const AllTransactions = () => {
       const data = await getAllTransactions(limit);
       if (data.status === 'success') {
         setTransactions(data.data || []);
+        setNextCursor(data.next_cursor || null);
       }
     } catch (err) {
       setError(err.message || 'Error fetching transactions');
@@ -33,6 +36,25 @@ const AllTransactions = () => {
     }
   };
 
+  // The listing is cursor-paginated: each page is appended to the loaded list
+  const loadMoreTransactions = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    setError(null);
+
+    try {
+      const data = await getAllTransactions(limit, nextCursor);
+      if (data.status === 'success') {
+        setTransactions((prev) => [...prev, ...(data.data || [])]);
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (err) {
+      setError(err.message || 'Error fetching transactions');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchTransactions();
   }, [limit]);
@@ -225,6 +247,17 @@ const AllTransactions = () => {
               </tbody>
             </table>
           </div>
+          {nextCursor && (
+            <div className="p-6 text-center border-t border-gray-200">
+              <button
+                onClick={loadMoreTransactions}
+                disabled={loadingMore}
+                className="px-4 py-2 border border-gray-300 rounded-lg hover:bg-gray-50 transition-colors disabled:opacity-50"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </motion.div>
       )}
 
@@ -7,6 +7,7 @@ import { getPendingHITL } from '../services/api';
 const HITLQueue = () => {
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [queueData, setQueueData] = useState(null);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
@@ -34,6 +35,28 @@ const HITLQueue = () => {
     fetchQueue();
   }, []);
 
+  // The queue is cursor-paginated: each page is appended to the loaded list
+  const handleLoadMore = async () => {
+    if (!queueData?.next_cursor) return;
+    setLoadingMore(true);
+    setError(null);
+
+    try {
+      const data = await getPendingHITL(queueData.next_cursor);
+      setQueueData((prev) => ({
+        ...data,
+        pending_transactions: [
+          ...(prev?.pending_transactions || []),
+          ...(data.pending_transactions || []),
+        ],
+      }));
+    } catch (err) {
+      setError(err.message || 'Error fetching HITL queue');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleRefresh = () => {
     fetchQueue(true);
   };
@@ -164,6 +187,17 @@ const HITLQueue = () => {
                     </div>
                   </motion.div>
                 ))}
+                {queueData.next_cursor && (
+                  <div className="p-6 text-center">
+                    <button
+                      onClick={handleLoadMore}
+                      disabled={loadingMore}
+                      className="px-4 py-2 border border-gray-300 rounded-lg hover:bg-gray-50 transition-colors disabled:opacity-50"
+                    >
+                      {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                  </div>
+                )}
               </div>
             ) : (
               <div className="p-12 text-center text-gray-400">
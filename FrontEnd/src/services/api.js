@@ -14,8 +14,10 @@ export const analyzeTransaction = async (transactionData) => {
   return response.data;
 };
 
-export const getPendingHITL = async () => {
-  const response = await api.get('/hitl/pending');
+export const getPendingHITL = async (cursor = null, limit = 50) => {
+  const params = { limit };
+  if (cursor) params.cursor = cursor;
+  const response = await api.get('/hitl/pending', { params });
   return response.data;
 };
 
@@ -37,9 +39,11 @@ export const getTransaction = async (transactionId) => {
   return response.data;
 };
 
-export const getAllTransactions = async (limit = null) => {
-  const url = limit ? `/transactions?limit=${limit}` : '/transactions';
-  const response = await api.get(url);
+export const getAllTransactions = async (limit = null, cursor = null) => {
+  const params = {};
+  if (limit) params.limit = limit;
+  if (cursor) params.cursor = cursor;
+  const response = await api.get('/transactions', { params });
   return response.data;
 };
 